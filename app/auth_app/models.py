@@ -1,15 +1,13 @@
 from django.contrib.auth.models import AbstractUser
 from django.db import models
-from django.utils import timezone
-from datetime import timedelta
 
+from .throttling import clear_failures, is_locked_out, record_failure
+# Failed logins and locks are tracked in the shared cache, not on the row
 
-class User(AbstractUser):
-    # Track consecutive failed logins to mitigate brute-force attacks
-    failed_attempts = models.PositiveIntegerField(default=0)
 
-    # Timestamp until which the account is locked after repeated failures
-    lock_until = models.DateTimeField(null=True, blank=True)
+class User(AbstractUser):
+    # Bumped to revoke every signed API token issued so far (see auth_app.tokens)
+    token_version = models.PositiveIntegerField(default=0)
     
     class Meta:
         # Reuse Django's default auth_user table for compatibility
@@ -17,17 +15,12 @@ class User(AbstractUser):
     
     def is_locked(self):
         # Determine whether the account is currently locked
-        return self.lock_until and timezone.now() < self.lock_until
+        return is_locked_out(self.username)
     
     def reset_lock(self):
         # Clear lock state after successful authentication
-        self.failed_attempts = 0
-        self.lock_until = None
-        self.save(update_fields=['failed_attempts', 'lock_until'])
+        clear_failures(self.username)
     
     def increment_failed_attempts(self):
-        # Increment failure count and temporarily lock account if threshold exceeded
-        self.failed_attempts += 1
-        if self.failed_attempts >= 5:
-            self.lock_until = timezone.now() + timedelta(minutes=15)
-        self.save(update_fields=['failed_attempts', 'lock_until'])
\ No newline at end of file
+        # Count a failure; the account is locked temporarily once the threshold is exceeded
+        record_failure(self.username)
@@ -0,0 +1,76 @@
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.test import SimpleTestCase, TestCase
+from django.test.utils import CaptureQueriesContext
+
+from auth_app.throttling import SlidingWindow, login_attempts, login_failures
+
+
+class SlidingWindowTests(SimpleTestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.window = SlidingWindow("test", limit=3, period=60)
+
+    def test_previous_window_is_weighted_by_its_overlap(self):
+        for _ in range(4):
+            self.window.hit("client", now=100)
+        self.assertEqual(self.window.count("client", now=119), 4)
+
+        # 10s into the next window, 50 of the previous 60 seconds still count
+        self.assertAlmostEqual(self.window.count("client", now=130), 4 * 50 / 60)
+        self.assertAlmostEqual(self.window.hit("client", now=130), 1 + 4 * 50 / 60)
+
+        # Two windows later nothing is left
+        self.assertEqual(self.window.count("client", now=245), 0)
+
+    def test_identifiers_are_counted_separately(self):
+        self.window.hit("a", now=100)
+        self.window.hit("a", now=100)
+        self.assertEqual(self.window.count("b", now=100), 0)
+
+    def test_allow_enforces_the_limit(self):
+        with mock.patch("auth_app.throttling.time.time", return_value=100):
+            self.assertEqual([self.window.allow("client") for _ in range(4)], [True, True, True, False])
+            self.window.reset("client")
+            self.assertTrue(self.window.allow("client"))
+
+
+class LoginThrottleTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = get_user_model().objects.create_user("alice", password="Secret@12345")
+
+    def login(self, password, username="alice", ip="10.0.0.1"):
+        return self.client.post(
+            "/api/auth/login/", {"username": username, "password": password},
+            content_type="application/json", REMOTE_ADDR=ip
+        )
+
+    def test_limits_attempts_per_client_address(self):
+        for attempt in range(login_attempts.limit):
+            self.assertEqual(self.login("wrong", username=f"user{attempt}").status_code, 401)
+        self.assertEqual(self.login("Secret@12345").status_code, 429)
+        self.assertEqual(self.login("Secret@12345", ip="10.0.0.2").status_code, 200)
+
+    def test_locks_out_a_username_after_repeated_failures(self):
+        for attempt in range(login_failures.limit):
+            self.assertEqual(self.login("wrong", ip=f"10.0.1.{attempt}").status_code, 401)
+        self.assertEqual(self.login("Secret@12345", ip="10.0.2.1").status_code, 403)
+
+    def test_success_clears_failures(self):
+        for attempt in range(login_failures.limit - 1):
+            self.login("wrong", ip=f"10.0.1.{attempt}")
+        self.assertEqual(self.login("Secret@12345", ip="10.0.2.1").status_code, 200)
+        self.assertEqual(login_failures.count("alice"), 0)
+        self.assertEqual(self.login("wrong", ip="10.0.2.2").status_code, 401)
+        self.assertEqual(self.login("Secret@12345", ip="10.0.2.3").status_code, 200)
+
+    def test_failures_never_write_to_the_database(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.login("wrong")
+        self.assertEqual([query["sql"] for query in queries if not query["sql"].startswith("SELECT")], [])
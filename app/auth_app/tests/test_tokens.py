@@ -0,0 +1,38 @@
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from rest_framework import exceptions
+
+from auth_app.tokens import VERSION_KEY, issue_token, revoke_tokens, token_version, user_cache, user_for_token
+
+
+class TokenRevocationTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        user_cache.clear()
+        self.user = get_user_model().objects.create_user("alice", password="Secret@12345")
+
+    def test_revoked_tokens_are_rejected(self):
+        token = issue_token(self.user)
+        self.assertEqual(user_for_token(token), self.user)
+
+        revoke_tokens(self.user)
+        with self.assertRaises(exceptions.AuthenticationFailed):
+            user_for_token(token)
+        self.assertEqual(user_for_token(issue_token(self.user)), self.user)
+
+    @override_settings(AUTH_TOKEN_MAX_AGE=60)
+    def test_versions_are_cached_for_the_token_lifetime(self):
+        with mock.patch.object(cache, "set", wraps=cache.set) as cache_set:
+            token_version(self.user.pk)
+        cache_set.assert_called_once_with(VERSION_KEY.format(user_id=self.user.pk), 0, timeout=60)
+
+    def test_revocation_does_not_cache_a_version(self):
+        # A reader holding the old version may write it after the revocation;
+        # the revocation itself must not leave an entry that never expires
+        token_version(self.user.pk)
+        revoke_tokens(self.user)
+        self.assertIsNone(cache.get(VERSION_KEY.format(user_id=self.user.pk)))
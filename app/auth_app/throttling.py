@@ -0,0 +1,106 @@
+import hashlib
+import time
+# Window positions are derived from wall-clock time shared by all workers
+
+from django.conf import settings
+from django.core.cache import cache
+# Counters live in the shared cache (Redis, or locmem in development)
+
+
+# Login protection that never writes to the user table:
+#   login_attempts   sliding-window limit of login requests per client IP
+#   login_failures   sliding-window count of failed logins per username
+# A username reaching the failure limit is locked out for
+# AUTH_LOCKOUT_SECONDS by a single cache key.
+
+LOCK_KEY = "auth:lock:{ident}"
+
+
+def _ident(value):
+    # Fixed-length, cache-safe key part for arbitrary user input
+    return hashlib.sha256(str(value).encode("utf-8")).hexdigest()[:32]
+
+
+class SlidingWindow:
+    """
+    Sliding-window counter over the shared cache.
+
+    Each identifier has one counter per fixed window of `period` seconds.
+    The sliding count adds the current window to the previous one,
+    weighted by how much of it still overlaps the last `period` seconds,
+    which approximates a true sliding log with two integers.
+    """
+
+    def __init__(self, scope, limit, period):
+        self.scope = scope
+        self.limit = limit
+        self.period = period
+
+    def _keys(self, ident, now):
+        window = int(now // self.period)
+        prefix = f"auth:rl:{self.scope}:{_ident(ident)}"
+        return f"{prefix}:{window}", f"{prefix}:{window - 1}"
+
+    def count(self, ident, now=None):
+        # Requests counted in the `period` seconds before `now`
+        now = time.time() if now is None else now
+        current, previous = self._keys(ident, now)
+        values = cache.get_many([current, previous])
+        overlap = 1 - (now % self.period) / self.period
+        return values.get(current, 0) + values.get(previous, 0) * overlap
+
+    def hit(self, ident, now=None):
+        # Count one request and return the new sliding count
+        now = time.time() if now is None else now
+        current, _ = self._keys(ident, now)
+        # Counters outlive their window so the next one can still weight them
+        cache.add(current, 0, timeout=2 * self.period)
+        try:
+            cache.incr(current)
+        except ValueError:
+            # Expired between add() and incr()
+            cache.set(current, 1, timeout=2 * self.period)
+        return self.count(ident, now)
+
+    def allow(self, ident):
+        # Count a request and tell whether it stays within the limit
+        return self.hit(ident) <= self.limit
+
+    def reset(self, ident):
+        now = time.time()
+        cache.delete_many(list(self._keys(ident, now)))
+
+
+login_attempts = SlidingWindow(
+    "login-ip",
+    getattr(settings, "AUTH_LOGIN_RATE_LIMIT", 5),
+    getattr(settings, "AUTH_LOGIN_RATE_PERIOD", 60),
+)
+
+login_failures = SlidingWindow(
+    "login-failure",
+    getattr(settings, "AUTH_LOCKOUT_ATTEMPTS", 5),
+    getattr(settings, "AUTH_LOCKOUT_PERIOD", 900),
+)
+
+
+def is_locked_out(username):
+    return cache.get(LOCK_KEY.format(ident=_ident(username))) is not None
+
+
+def record_failure(username):
+    # Count a failed login; returns True once the username gets locked out
+    if login_failures.hit(username) < login_failures.limit:
+        return False
+    cache.set(
+        LOCK_KEY.format(ident=_ident(username)),
+        1,
+        timeout=getattr(settings, "AUTH_LOCKOUT_SECONDS", 900)
+    )
+    return True
+
+
+def clear_failures(username):
+    # Forget failures and any lock after a successful login
+    login_failures.reset(username)
+    cache.delete(LOCK_KEY.format(ident=_ident(username)))
@@ -0,0 +1,178 @@
+import threading
+import time
+from collections import OrderedDict
+# In-process LRU of authenticated users
+
+from asgiref.sync import sync_to_async
+# User lookups of async views run off the event loop
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import AnonymousUser
+from django.core import signing
+from django.core.cache import cache
+# Token versions are shared by every web process through the cache
+from django.db.models import F
+
+from rest_framework import exceptions
+from rest_framework.authentication import BaseAuthentication, get_authorization_header
+
+
+# Signed bearer tokens let API calls authenticate without a session row
+# read or a user fetch. A token carries the user id and the user's token
+# version; revoke_tokens() bumps the version (stored on the user and
+# cached for at most AUTH_TOKEN_MAX_AGE) so every token issued before it
+# stops working.
+
+TOKEN_SALT = "auth_app.tokens"
+KEYWORD = b"bearer"
+VERSION_KEY = "auth:token-version:{user_id}"
+
+
+def issue_token(user):
+    # Signed, timestamped token for `user` (see AUTH_TOKEN_MAX_AGE)
+    return signing.dumps({"u": user.pk, "v": user.token_version}, salt=TOKEN_SALT, compress=True)
+
+
+def revoke_tokens(user):
+    # Invalidate every token issued to `user` so far
+    User = get_user_model()
+    User.objects.filter(pk=user.pk).update(token_version=F("token_version") + 1)
+    user.token_version = User.objects.filter(pk=user.pk).values_list("token_version", flat=True).get()
+    # Deleted rather than set: a concurrent token_version() that read the old
+    # version before the update could otherwise cache it after this write,
+    # without expiry. Now such a stale entry lasts AUTH_TOKEN_MAX_AGE at most.
+    cache.delete(VERSION_KEY.format(user_id=user.pk))
+    user_cache.discard(user.pk)
+
+
+def token_version(user_id):
+    # Current token version of a user; the database is only read on a cache miss
+    key = VERSION_KEY.format(user_id=user_id)
+    version = cache.get(key)
+    if version is None:
+        version = (
+            get_user_model().objects
+            .filter(pk=user_id)
+            .values_list("token_version", flat=True)
+            .first()
+        )
+        if version is not None:
+            cache.set(key, version, timeout=settings.AUTH_TOKEN_MAX_AGE)
+    return version
+
+
+class UserCache:
+    """
+    Bounded in-process LRU of user objects keyed by id.
+
+    Entries remember the token version they were loaded under and expire
+    after `ttl` seconds, so revocations and account changes are picked up.
+    """
+
+    def __init__(self, max_size, ttl):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._users = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, user_id, version):
+        with self._lock:
+            entry = self._users.get(user_id)
+            if entry is None:
+                return None
+            cached_version, user, expires = entry
+            if cached_version != version or expires < time.monotonic():
+                del self._users[user_id]
+                return None
+            self._users.move_to_end(user_id)
+            return user
+
+    def put(self, user, version):
+        with self._lock:
+            self._users[user.pk] = (version, user, time.monotonic() + self.ttl)
+            self._users.move_to_end(user.pk)
+            while len(self._users) > self.max_size:
+                self._users.popitem(last=False)
+
+    def discard(self, user_id):
+        with self._lock:
+            self._users.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._users.clear()
+
+
+user_cache = UserCache(
+    getattr(settings, "AUTH_USER_CACHE_SIZE", 10000),
+    getattr(settings, "AUTH_USER_CACHE_SECONDS", 60),
+)
+
+
+def user_for_token(token):
+    # Active user the token was issued to; raises AuthenticationFailed
+    try:
+        payload = signing.loads(token, salt=TOKEN_SALT, max_age=settings.AUTH_TOKEN_MAX_AGE)
+        user_id, version = payload["u"], payload["v"]
+    except signing.SignatureExpired:
+        raise exceptions.AuthenticationFailed("Token expired.")
+    except (signing.BadSignature, KeyError, TypeError):
+        raise exceptions.AuthenticationFailed("Invalid token.")
+
+    if token_version(user_id) != version:
+        raise exceptions.AuthenticationFailed("Token revoked.")
+
+    user = user_cache.get(user_id, version)
+    if user is None:
+        user = get_user_model().objects.filter(pk=user_id).first()
+        if user is None or user.token_version != version:
+            raise exceptions.AuthenticationFailed("Token revoked.")
+        user_cache.put(user, version)
+
+    if not user.is_active:
+        raise exceptions.AuthenticationFailed("User inactive or deleted.")
+    return user
+
+
+def token_from_header(header):
+    # Token of an "Authorization: Bearer <token>" header, or None
+    parts = header.split()
+    if not parts or parts[0].lower() != KEYWORD:
+        return None
+    if len(parts) != 2:
+        raise exceptions.AuthenticationFailed("Invalid token header.")
+    try:
+        return parts[1].decode()
+    except UnicodeError:
+        raise exceptions.AuthenticationFailed("Invalid token header.")
+
+
+class SignedTokenAuthentication(BaseAuthentication):
+    """
+    DRF authentication for "Authorization: Bearer <token>" headers.
+
+    Verifying a token costs no database query once the user is cached.
+    Requests without a bearer token fall through to the next class.
+    """
+
+    def authenticate(self, request):
+        token = token_from_header(get_authorization_header(request))
+        if token is None:
+            return None
+        return user_for_token(token), token
+
+    def authenticate_header(self, request):
+        return "Bearer"
+
+
+async def arequest_user(request):
+    # User of a plain Django (ASGI) request: bearer token first, then session.
+    # Invalid tokens give an anonymous user, like a missing session.
+    try:
+        token = token_from_header(get_authorization_header(request))
+        if token is None:
+            return await request.auser()
+        return await sync_to_async(user_for_token)(token)
+    except exceptions.AuthenticationFailed:
+        return AnonymousUser()
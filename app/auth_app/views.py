@@ -4,26 +4,21 @@ from rest_framework.response import Response  # Standard DRF response object
 from rest_framework import status  # HTTP status codes
 from rest_framework.permissions import AllowAny  # Allows unauthenticated access
 
-from django.contrib.auth import authenticate, login, logout  # Auth helpers
+from django.conf import settings  # Token lifetime
+from django.contrib.auth import login, logout  # Session helpers
 from django.contrib.auth import get_user_model  # Fetch custom User model
-from django.utils import timezone  # Timezone-aware datetime
-from datetime import timedelta  # Time duration helper
-
-from django_ratelimit.decorators import ratelimit  # Rate limiting decorator
 from django.utils.decorators import method_decorator  # Apply decorators to class-based views
 
 from django.views.decorators.csrf import csrf_exempt  # Disable CSRF protection
 from django.middleware.csrf import get_token  # Generate CSRF token
 
 from .serializers import RegisterSerializer  # Serializer for user registration
+from .throttling import clear_failures, is_locked_out, login_attempts, record_failure  # Cache-backed limits
+from .tokens import SignedTokenAuthentication, issue_token, revoke_tokens  # Stateless API tokens
 
 
 User = get_user_model()  # Get the active User model (custom or default)
 
-# Security configuration
-MAX_ATTEMPTS = 5          # Maximum allowed failed login attempts
-LOCK_MINUTES = 15         # Account lock duration after max failures
-
 
 @method_decorator(csrf_exempt, name="dispatch")  # Disable CSRF for entire class
 class Register(APIView):
@@ -44,56 +39,64 @@ class Register(APIView):
 @method_decorator(csrf_exempt, name="dispatch")  # Disable CSRF for login endpoint
 class Login(APIView):
     """
-    Authenticates user credentials and creates a session.
-    Rate-limited to prevent brute-force attacks.
+    Authenticates user credentials, creates a session and issues a
+    signed API token. Rate-limited to prevent brute-force attacks.
     """
     authentication_classes = [BasicAuthentication]  # Explicit authentication method
     permission_classes = [AllowAny]                  # Login allowed without auth
 
-    @method_decorator(ratelimit(key="ip", rate="5/m", block=True))  # Limit 5 attempts per minute per IP
     def post(self, request):
         username = request.data.get("username")  # Extract username from request
         password = request.data.get("password")  # Extract password from request
 
-        try:
-            user = User.objects.get(username=username)  # Fetch user by username
-            if user.is_locked():                         # Check if account is locked
-                return Response(
-                    {"error": "Account locked. Try later."},  # Lock message
-                    status=status.HTTP_403_FORBIDDEN
-                )
-        except User.DoesNotExist:
+        # Sliding-window limit per client IP, shared by all workers
+        if not login_attempts.allow(request.META.get("REMOTE_ADDR")):
             return Response(
-                {"error": "Invalid credentials"},  # Username not found
-                status=status.HTTP_401_UNAUTHORIZED
+                {"error": "Too many login attempts. Try later."},
+                status=status.HTTP_429_TOO_MANY_REQUESTS
+            )
+
+        # Locked usernames are rejected before touching the database
+        if is_locked_out(username):
+            return Response(
+                {"error": "Account locked. Try later."},  # Lock message
+                status=status.HTTP_403_FORBIDDEN
             )
 
-        user = authenticate(username=username, password=password)  # Validate credentials
-        if not user:
-            user.failed_attempts += 1  # Increment failed attempt counter
-            if user.failed_attempts >= MAX_ATTEMPTS:  # Check max attempts
-                user.lock_until = timezone.now() + timedelta(minutes=LOCK_MINUTES)  # Lock account
-            user.save(update_fields=["failed_attempts", "lock_until"])  # Save only relevant fields
+        # Failures are counted in the cache, never on the user row
+        user = User.objects.filter(username=username).first()  # Fetch user by username
+        if user is None or not user.check_password(password) or not user.is_active:
+            record_failure(username)  # Locks the username once the limit is reached
             return Response(
                 {"error": "Invalid credentials"},  # Authentication failed
                 status=status.HTTP_401_UNAUTHORIZED
             )
 
-        user.reset_lock()            # Reset failed attempts and unlock account
+        clear_failures(username)     # Reset failed attempts and unlock account
         login(request, user)         # Create authenticated session
 
-        return Response({"message": "Logged in"}, status=status.HTTP_200_OK)  # Login success
+        return Response(
+            {
+                "message": "Logged in",
+                "token": issue_token(user),                  # Bearer token for API calls
+                "expires_in": settings.AUTH_TOKEN_MAX_AGE    # Token lifetime in seconds
+            },
+            status=status.HTTP_200_OK
+        )  # Login success
 
 
 @method_decorator(csrf_exempt, name="dispatch")  # Disable CSRF for logout
 class Logout(APIView):
     """
     Terminates the authenticated session.
+    Logging out with a bearer token revokes all of the user's tokens.
     """
-    authentication_classes = [BasicAuthentication]  # Explicit auth configuration
+    authentication_classes = [SignedTokenAuthentication, BasicAuthentication]  # Explicit auth configuration
     permission_classes = [AllowAny]                  # Logout allowed without permission check
 
     def post(self, request):
+        if request.auth is not None and request.user.is_authenticated:
+            revoke_tokens(request.user)  # Invalidate outstanding API tokens
         logout(request)  # Destroy session
         return Response({"message": "Logged out"}, status=status.HTTP_200_OK)  # Logout success
 
@@ -3,4 +3,6 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'core.settings')
 
-application = get_asgi_application()
\ No newline at end of file
+# ASGI entry point used by the async deployment mode
+# (gunicorn with uvicorn workers, see the web-asgi service in docker-compose)
+application = get_asgi_application()
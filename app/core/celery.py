@@ -4,6 +4,9 @@ import os
 from celery import Celery
 # Celery application class for background task processing
 
+from kombu import Queue
+# Named queues separating small and large indexing work
+
 # Ensure Django settings are loaded before initializing Celery
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "core.settings")
 
@@ -22,6 +25,62 @@ app.conf.result_backend = os.environ.get(
     "CELERY_RESULT_BACKEND", "redis://redis:6379/0"
 )
 
+# Indexing is split by paragraph size so a bulk document never blocks the
+# short tasks queued behind it: "small" carries batches of ordinary
+# paragraphs, "large" the chunked indexing of paragraphs above
+# TEXT_LARGE_PARAGRAPH_CHARS (see text_app.ingest)
+app.conf.task_queues = (Queue("small"), Queue("large"))
+app.conf.task_default_queue = "small"
+app.conf.task_routes = {
+    "text_app.tasks.index_large_paragraph": {"queue": "large"},
+    "text_app.tasks.count_paragraph_chunk": {"queue": "large"},
+    "text_app.tasks.store_chunked_paragraph": {"queue": "large"},
+    "text_app.tasks.merge_segments": {"queue": "large"},
+}
+
+# Worker settings for each queue, applied to workers consuming only that
+# queue (`celery -A core worker -Q large`); command-line options still win.
+# Small tasks are short, so workers prefetch several; large workers take
+# one task at a time (the large tasks also acknowledge only once done).
+QUEUE_WORKER_SETTINGS = {
+    "small": {
+        "worker_concurrency": 8,
+        "worker_prefetch_multiplier": 4,
+    },
+    "large": {
+        "worker_concurrency": 2,
+        "worker_prefetch_multiplier": 1,
+    },
+}
+
+# Task return values are not stored: progress is tracked on IngestJob rows,
+# and only the chunk results collected by chords opt back in
+app.conf.task_ignore_result = True
+
 # Automatically discover tasks from all installed Django apps
 # Allows task definitions to live alongside application logic
-app.autodiscover_tasks()
\ No newline at end of file
+app.autodiscover_tasks()
+# Record queue wait, execution time and rows written for every task;
+# METRICS_WORKER_PORT additionally exposes each worker process's metrics
+from celery.signals import before_task_publish, celeryd_init, task_postrun, task_prerun, worker_process_init
+
+from . import metrics
+
+before_task_publish.connect(metrics.task_published, weak=False)
+task_prerun.connect(metrics.task_started, weak=False)
+task_postrun.connect(metrics.task_finished, weak=False)
+
+
+@worker_process_init.connect(weak=False)
+def _serve_worker_metrics(**kwargs):
+    port = os.environ.get("METRICS_WORKER_PORT")
+    if port:
+        metrics.serve_worker_metrics(int(port))
+
+
+# Apply QUEUE_WORKER_SETTINGS to single-queue workers
+@celeryd_init.connect(weak=False)
+def _configure_queue_worker(conf=None, options=None, **kwargs):
+    queues = (options or {}).get("queues") or []
+    if len(queues) == 1 and queues[0] in QUEUE_WORKER_SETTINGS:
+        conf.update(QUEUE_WORKER_SETTINGS[queues[0]])
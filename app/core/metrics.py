@@ -0,0 +1,378 @@
+import hmac
+import threading
+import time
+from bisect import bisect_left
+from contextlib import ExitStack
+# Locking for concurrent updates, timing and bucket lookup
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+# The middleware serves both WSGI and ASGI requests
+
+from django.conf import settings
+from django.db import connections
+# Queries are counted through execute wrappers on every configured database
+
+from django.http import Http404, HttpResponse
+# Plain-text response for the scrape endpoint
+
+
+# Default latency buckets in seconds (Prometheus-style upper bounds)
+DEFAULT_BUCKETS = (
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1,
+    0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0,
+)
+
+
+def _format_labels(names, values):
+    if not names:
+        return ""
+    pairs = ",".join(
+        '{}="{}"'.format(name, str(value).replace("\\", "\\\\").replace('"', '\\"'))
+        for name, value in zip(names, values)
+    )
+    return "{" + pairs + "}"
+
+
+class Counter:
+    # Monotonically increasing value per label set
+
+    kind = "counter"
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels.get(name, "") for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            items = list(self._values.items())
+        for key, value in items:
+            yield self.name, _format_labels(self.labelnames, key), value
+
+
+class Histogram:
+    # Bucketed distribution of observations per label set
+
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(labels.get(name, "") for name in self.labelnames)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                # Per-bucket (non-cumulative) counts, overflow slot, sum and count
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    def samples(self):
+        with self._lock:
+            items = [(key, (list(state[0]), state[1], state[2])) for key, state in self._values.items()]
+        for key, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                yield (
+                    f"{self.name}_bucket",
+                    _format_labels(self.labelnames + ("le",), key + (le,)),
+                    cumulative
+                )
+            yield f"{self.name}_sum", _format_labels(self.labelnames, key), total
+            yield f"{self.name}_count", _format_labels(self.labelnames, key), count
+
+
+class Registry:
+    """
+    In-process metrics registry rendered in the Prometheus text format.
+
+    Each process (gunicorn worker, Celery worker child) keeps its own
+    registry; updates are a dictionary lookup under a lock, cheap enough
+    to leave enabled under full load.
+    """
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._register(Counter, name, documentation, labelnames)
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram, name, documentation, labelnames, buckets=buckets)
+
+    def render(self):
+        lines = []
+        with self._lock:
+            metrics = list(self._metrics.values())
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for name, labels, value in metric.samples():
+                lines.append(f"{name}{labels} {value}")
+        return "\n".join(lines) + "\n"
+
+    def _register(self, cls, name, documentation, labelnames, **kwargs):
+        # Registering the same name twice returns the existing metric
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, documentation, labelnames, **kwargs)
+            return metric
+
+
+registry = Registry()
+# Process-wide registry shared by the middleware, Celery hooks and /metrics
+
+
+class QueryRecorder:
+    """
+    Database execute wrapper that counts queries, their time and rows written.
+
+    Installed around a request or a task on every connection with
+    record_queries().
+    """
+
+    WRITE_PREFIXES = ("INSERT", "UPDATE", "DELETE")
+
+    def __init__(self):
+        self.queries = 0
+        self.seconds = 0.0
+        self.rows_written = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.seconds += time.perf_counter() - started
+            self.queries += 1
+            if sql.lstrip()[:6].upper() in self.WRITE_PREFIXES:
+                rowcount = getattr(context["cursor"], "rowcount", -1)
+                if rowcount and rowcount > 0:
+                    self.rows_written += rowcount
+
+
+def record_queries(recorder):
+    """
+    Install the recorder on every database connection of this thread.
+
+    Shards and replicas are separate connections, so wrapping only the
+    default one would miss most of the text queries. Closing the returned
+    stack removes the wrappers again.
+    """
+    stack = ExitStack()
+    for conn in connections.all():
+        stack.enter_context(conn.execute_wrapper(recorder))
+    return stack
+
+
+def metrics_allowed(request):
+    # Scrapers are recognized by address (METRICS_ALLOWED_IPS) or token (METRICS_TOKEN)
+    if request.META.get("REMOTE_ADDR") in settings.METRICS_ALLOWED_IPS:
+        return True
+    token = settings.METRICS_TOKEN
+    authorization = request.headers.get("Authorization", "")
+    return bool(token) and hmac.compare_digest(authorization.encode(), f"Bearer {token}".encode())
+
+
+def metrics_view(request):
+    # Prometheus scrape endpoint for this process, hidden from the public
+    if not metrics_allowed(request):
+        raise Http404
+    return HttpResponse(
+        registry.render(),
+        content_type="text/plain; version=0.0.4; charset=utf-8"
+    )
+
+
+# --- HTTP requests ---------------------------------------------------------
+
+REQUEST_LATENCY = registry.histogram(
+    "http_request_duration_seconds",
+    "Request latency by view route, method and status.",
+    ("view", "method", "status")
+)
+REQUEST_QUERIES = registry.counter(
+    "http_db_queries_total",
+    "Database queries issued while serving requests, by view route.",
+    ("view",)
+)
+REQUEST_QUERY_SECONDS = registry.counter(
+    "http_db_query_seconds_total",
+    "Time spent in database queries while serving requests, by view route.",
+    ("view",)
+)
+
+
+class MetricsMiddleware:
+    """
+    Records latency and database query count/time for every request.
+
+    Requests are labelled with the matched URL route rather than the raw
+    path so that ids in URLs do not create unbounded label sets.
+
+    Under ASGI the ORM runs on the request's sync_to_async thread, whose
+    connections differ from the event loop's, so the wrappers are installed
+    and removed on that thread.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+
+        recorder = QueryRecorder()
+        started = time.perf_counter()
+        with record_queries(recorder):
+            response = self.get_response(request)
+        self._observe(request, response, recorder, time.perf_counter() - started)
+        return response
+
+    async def __acall__(self, request):
+        recorder = QueryRecorder()
+        started = time.perf_counter()
+        stack = await sync_to_async(record_queries)(recorder)
+        try:
+            response = await self.get_response(request)
+        finally:
+            await sync_to_async(stack.close)()
+        self._observe(request, response, recorder, time.perf_counter() - started)
+        return response
+
+    @staticmethod
+    def _observe(request, response, recorder, elapsed):
+        match = getattr(request, "resolver_match", None)
+        view = match.route if match is not None else "unmatched"
+
+        REQUEST_LATENCY.observe(
+            elapsed, view=view, method=request.method, status=response.status_code
+        )
+        if recorder.queries:
+            REQUEST_QUERIES.inc(recorder.queries, view=view)
+            REQUEST_QUERY_SECONDS.inc(recorder.seconds, view=view)
+
+
+# --- Celery tasks ----------------------------------------------------------
+
+TASK_QUEUE_WAIT = registry.histogram(
+    "celery_task_queue_wait_seconds",
+    "Time between a task being published and a worker starting it.",
+    ("task",)
+)
+TASK_DURATION = registry.histogram(
+    "celery_task_duration_seconds",
+    "Task execution time by final state.",
+    ("task", "state")
+)
+TASK_QUERIES = registry.counter(
+    "celery_task_db_queries_total",
+    "Database queries issued by tasks.",
+    ("task",)
+)
+TASK_ROWS_WRITTEN = registry.counter(
+    "celery_task_rows_written_total",
+    "Rows inserted, updated or deleted by tasks.",
+    ("task",)
+)
+
+PUBLISHED_AT_HEADER = "published_at"
+
+_running = {}
+# task_id -> (start time, recorder) for tasks executing in this process
+
+
+def task_published(sender=None, headers=None, **kwargs):
+    # Stamp the wall-clock publish time so the worker can measure queue wait
+    if headers is not None:
+        headers[PUBLISHED_AT_HEADER] = time.time()
+
+
+def task_started(task_id=None, task=None, **kwargs):
+    request = task.request
+    published_at = getattr(request, PUBLISHED_AT_HEADER, None)
+    if published_at is None:
+        published_at = (getattr(request, "headers", None) or {}).get(PUBLISHED_AT_HEADER)
+    if published_at is not None:
+        TASK_QUEUE_WAIT.observe(max(time.time() - float(published_at), 0.0), task=task.name)
+
+    recorder = QueryRecorder()
+    wrapped = connections.all()
+    for conn in wrapped:
+        conn.execute_wrappers.append(recorder)
+    _running[task_id] = (time.perf_counter(), recorder, wrapped)
+
+
+def task_finished(task_id=None, task=None, state=None, **kwargs):
+    entry = _running.pop(task_id, None)
+    if entry is None:
+        return
+    started, recorder, wrapped = entry
+    for conn in wrapped:
+        try:
+            conn.execute_wrappers.remove(recorder)
+        except ValueError:
+            # The task ran on a different thread's connections
+            pass
+
+    TASK_DURATION.observe(time.perf_counter() - started, task=task.name, state=state or "UNKNOWN")
+    if recorder.queries:
+        TASK_QUERIES.inc(recorder.queries, task=task.name)
+    if recorder.rows_written:
+        TASK_ROWS_WRITTEN.inc(recorder.rows_written, task=task.name)
+
+
+def serve_worker_metrics(port, attempts=32):
+    """
+    Expose this worker process's registry over HTTP.
+
+    Prefork children each hold their own registry, so every child binds
+    the first free port in [port, port + attempts).
+    """
+
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            body = registry.render().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    for offset in range(attempts):
+        try:
+            server = ThreadingHTTPServer(("0.0.0.0", port + offset), Handler)
+        except OSError:
+            continue
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return server
+    return None
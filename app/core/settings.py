@@ -1,3 +1,6 @@
+import os
+# Used to read optional service endpoints from environment variables
+
 from pathlib import Path
 # Path utility for building platform-independent file paths
 
@@ -34,6 +37,9 @@ INSTALLED_APPS = [
 
 
 MIDDLEWARE = [
+    # Request latency and per-view database query metrics (outermost, so it times everything)
+    "core.metrics.MetricsMiddleware",
+
     # Enable CORS handling for API requests from different origins
     "corsheaders.middleware.CorsMiddleware",
 
@@ -94,11 +100,65 @@ DATABASES = {
         "PASSWORD": "codemonk",
 
         # Database service hostname defined in docker-compose
-        "HOST": "db",
-        "PORT": 5432,
+        "HOST": os.environ.get("POSTGRES_HOST", "db"),
+        "PORT": int(os.environ.get("POSTGRES_PORT", 5432)),
     }
 }
 
+# Local tooling (e.g. `manage.py benchmark`) can run without PostgreSQL
+if os.environ.get("DJANGO_DB_ENGINE") == "sqlite":
+    DATABASES["default"] = {
+        "ENGINE": "django.db.backends.sqlite3",
+        "NAME": BASE_DIR / "db.sqlite3",
+    }
+
+# Per-user text data (paragraphs, frequencies and derived tables) is spread
+# over TEXT_SHARDS by user id; DJANGO_DB_SHARDS=N adds aliases shard1..shardN-1
+# next to "default" (databases <name>_shardK, or db_shardK.sqlite3 files)
+TEXT_SHARDS = ["default"]
+for shard in range(1, int(os.environ.get("DJANGO_DB_SHARDS", 1))):
+    alias = f"shard{shard}"
+    DATABASES[alias] = dict(DATABASES["default"])
+    if DATABASES[alias]["ENGINE"] == "django.db.backends.sqlite3":
+        DATABASES[alias]["NAME"] = BASE_DIR / f"db_shard{shard}.sqlite3"
+    else:
+        DATABASES[alias]["NAME"] = f"{DATABASES['default']['NAME']}_shard{shard}"
+    TEXT_SHARDS.append(alias)
+
+# Delay before a task refused by an ongoing shard move (rebalance_shard) runs again
+TEXT_SHARD_MOVE_RETRY_SECONDS = 30
+
+# Read replicas used by Search: DJANGO_DB_REPLICAS=N adds <alias>_replica1..N
+# for every primary alias (POSTGRES_REPLICA_HOST, or the same SQLite file)
+TEXT_READ_REPLICAS = {}
+for primary in list(TEXT_SHARDS):
+    for replica in range(1, int(os.environ.get("DJANGO_DB_REPLICAS", 0)) + 1):
+        alias = f"{primary}_replica{replica}"
+        DATABASES[alias] = dict(DATABASES[primary], TEST={"MIRROR": primary})
+        if DATABASES[alias]["ENGINE"] != "django.db.backends.sqlite3":
+            DATABASES[alias]["HOST"] = os.environ.get("POSTGRES_REPLICA_HOST", DATABASES[primary]["HOST"])
+        TEXT_READ_REPLICAS.setdefault(primary, []).append(alias)
+
+# Seconds after a write during which a user's searches stay on the primary
+TEXT_READ_YOUR_WRITES_SECONDS = 10
+
+# Replica reads for Search first, then per-user text models to the user's shard
+DATABASE_ROUTERS = [
+    "text_app.replicas.ReplicaRouter",
+    "text_app.routers.UserShardRouter",
+]
+
+# Shared cache used by login throttling and the text_app invalidation keys
+# ("memory://" selects a process-local stand-in, the default with SQLite)
+CACHE_URL = os.environ.get(
+    "DJANGO_CACHE_URL",
+    "memory://" if os.environ.get("DJANGO_DB_ENGINE") == "sqlite" else "redis://redis:6379/2"
+)
+if CACHE_URL == "memory://":
+    CACHES = {"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+else:
+    CACHES = {"default": {"BACKEND": "django_redis.cache.RedisCache", "LOCATION": CACHE_URL}}
+
 # Specify custom user model for authentication
 AUTH_USER_MODEL = "auth_app.User"
 
@@ -106,8 +166,142 @@ AUTH_USER_MODEL = "auth_app.User"
 # Static files configuration (minimal since no frontend is served)
 STATIC_URL = "/static/"
 
+# API authentication: signed bearer tokens (issued by login) are verified
+# without a database query; sessions and basic auth keep working
+REST_FRAMEWORK = {
+    "DEFAULT_AUTHENTICATION_CLASSES": [
+        "auth_app.tokens.SignedTokenAuthentication",
+        "rest_framework.authentication.SessionAuthentication",
+        "rest_framework.authentication.BasicAuthentication",
+    ],
+}
+
+# Login protection (see auth_app.throttling): login requests per client IP
+# per period, and failed logins per username before a temporary lockout
+AUTH_LOGIN_RATE_LIMIT = 5
+AUTH_LOGIN_RATE_PERIOD = 60
+AUTH_LOCKOUT_ATTEMPTS = 5
+AUTH_LOCKOUT_PERIOD = 900
+AUTH_LOCKOUT_SECONDS = 900
+
+# Lifetime of signed API tokens in seconds
+AUTH_TOKEN_MAX_AGE = 900
+
+# Users kept in each process for token authentication, and for how long
+AUTH_USER_CACHE_SIZE = 10000
+AUTH_USER_CACHE_SECONDS = 60
+
 # Default primary key field type for new models
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 
 # Allow cross-origin API requests (useful for API testing tools and clients)
-CORS_ALLOW_ALL_ORIGINS = True
\ No newline at end of file
+CORS_ALLOW_ALL_ORIGINS = True
+
+# Text ingestion tuning
+# Number of paragraph ids sent to the worker in a single Celery message
+TEXT_INGEST_CHUNK_SIZE = 500
+
+# Maximum total characters of the paragraphs sent in a single Celery message
+TEXT_INGEST_CHUNK_CHARS = 1000000
+
+# Paragraphs longer than this (in characters) go to the "large" queue, where
+# they are counted in slices of TEXT_LARGE_CHUNK_CHARS by separate tasks
+TEXT_LARGE_PARAGRAPH_CHARS = 100000
+TEXT_LARGE_CHUNK_CHARS = 1000000
+
+# Tokenizer: texts longer than TEXT_TOKENIZER_PIECE_CHARS are counted piece
+# by piece; from TEXT_TOKENIZER_PARALLEL_CHARS on, the pieces are counted in
+# a pool of TEXT_TOKENIZER_WORKERS processes (0 or 1 keeps counting serial)
+TEXT_TOKENIZER_PIECE_CHARS = 65536
+TEXT_TOKENIZER_PARALLEL_CHARS = 2000000
+TEXT_TOKENIZER_WORKERS = int(os.environ.get("TEXT_TOKENIZER_WORKERS", 0))
+
+# Rows per INSERT statement when the worker writes a batch of frequencies
+TEXT_WORKER_INSERT_BATCH_SIZE = 5000
+
+# Worker-side micro-batching of single-paragraph compute_frequency tasks.
+# Lossy: a task is acknowledged once its id is handed to the in-process
+# collector, so ids pending when a worker dies are dropped. Run the
+# requeue_unindexed command periodically (e.g. from cron) when enabling it;
+# it queues paragraphs still lacking a token_count again.
+TEXT_WORKER_MICROBATCH = False
+TEXT_WORKER_BATCH_MAX_SIZE = 200
+TEXT_WORKER_BATCH_WAIT_MS = 20
+
+# Optional search engine consulted by the Search view before the ORM query
+# (dotted path, or None to always query the database)
+# Cross-process invalidation relies on a shared cache backend in CACHES
+TEXT_SEARCH_ENGINE = None
+
+# Maximum number of users kept warm by the in-memory search engine
+TEXT_SEARCH_ENGINE_MAX_USERS = 1000
+
+# Immutable on-disk index segments of "text_app.search.segments.SegmentSearchEngine":
+# written by the workers, memory-mapped by the web processes, so the
+# directory must be shared by both (the "segments" volume in docker-compose).
+# Runs of TEXT_SEGMENT_MERGE_FACTOR segments of similar size are merged in
+# the background; segments up to TEXT_SEGMENT_TIER_POSTINGS postings share
+# the smallest size tier.
+TEXT_SEGMENT_DIR = os.environ.get("TEXT_SEGMENT_DIR", str(BASE_DIR / "segments"))
+TEXT_SEGMENT_MERGE_FACTOR = 8
+TEXT_SEGMENT_TIER_POSTINGS = 10000
+
+# Users whose open segments are cached in each web process
+TEXT_SEGMENT_CACHE_USERS = 1000
+
+# Redis instance holding the sorted-set index of RedisSearchEngine
+# ("memory://" selects an in-process stand-in backed by fakeredis)
+TEXT_SEARCH_REDIS_URL = os.environ.get(
+    "TEXT_SEARCH_REDIS_URL", "redis://redis:6379/1"
+)
+
+# Number of word -> term id mappings kept in each process
+TEXT_TERM_CACHE_SIZE = 100000
+
+# Storage used for word frequencies:
+# "rows" keeps one WordFrequency row per word per paragraph,
+# "blocks" keeps compressed PostingBlock rows per (user, term)
+TEXT_INDEX_STORAGE = "rows"
+
+# Maximum number of postings encoded in a single PostingBlock
+TEXT_POSTING_BLOCK_SIZE = 128
+
+# Cache of frequency tables keyed by paragraph content fingerprint
+TEXT_FREQ_CACHE_SIZE = 10000
+TEXT_FREQ_CACHE_MAX_TERMS = 5000
+
+# Optional shared Redis tier for the frequency cache (None keeps it process-local).
+# /api/text/stats/dedup/ reports the counters aggregated there and answers 503
+# without it; per-process counters are exported on /metrics either way.
+TEXT_FREQ_CACHE_REDIS_URL = os.environ.get("TEXT_FREQ_CACHE_REDIS_URL")
+
+# BM25 parameters used by Search?rank=bm25
+TEXT_BM25_K1 = 1.2
+TEXT_BM25_B = 0.75
+
+# Users whose search vocabulary (for prefix/fuzzy queries) is kept in each process
+TEXT_VOCABULARY_CACHE_USERS = 1000
+
+# Maximum number of exact words a prefix or fuzzy query expands to
+TEXT_VOCABULARY_MAX_EXPANSIONS = 20
+
+# Approximate top words (Count-Min Sketch per user, see text_app.sketches):
+# estimates exceed true counts by at most e / WIDTH of the user's total
+# words with probability 1 - e ** -DEPTH; HEAVY_HITTERS words are tracked.
+# Every indexed batch rewrites the user's whole sketch under a row lock
+# (WIDTH * DEPTH 8-byte counters, 80KB before compression at these values),
+# so batches of one user serialize on it; lower dimensions make that
+# cheaper at the cost of wider error bounds.
+TEXT_SKETCH_WIDTH = 2048
+TEXT_SKETCH_DEPTH = 5
+TEXT_SKETCH_HEAVY_HITTERS = 200
+
+# /metrics answers only clients at these addresses, or requests sending
+# "Authorization: Bearer <METRICS_TOKEN>" (e.g. a scraper behind a proxy);
+# everyone else gets a 404. Worker metrics use METRICS_WORKER_PORT instead.
+METRICS_ALLOWED_IPS = [
+    address.strip()
+    for address in os.environ.get("METRICS_ALLOWED_IPS", "127.0.0.1,::1").split(",")
+    if address.strip()
+]
+METRICS_TOKEN = os.environ.get("METRICS_TOKEN")
@@ -0,0 +1,13 @@
+import os
+# Tests run without PostgreSQL or Redis: local SQLite databases for
+# "default" and two more shards, each with a read replica mirroring it
+
+os.environ.setdefault("DJANGO_DB_ENGINE", "sqlite")
+os.environ.setdefault("DJANGO_DB_SHARDS", "3")
+os.environ.setdefault("DJANGO_DB_REPLICAS", "1")
+
+from .settings import *  # noqa: E402,F401,F403
+
+# Migrations are generated at deploy time (entrypoint.sh), so test
+# databases are created straight from the models
+MIGRATION_MODULES = {"auth_app": None, "text_app": None}
@@ -1,6 +1,9 @@
 from django.urls import path, include
 # URL utilities for composing application-level routes
 
+from .metrics import metrics_view
+# Prometheus scrape endpoint backed by the in-process registry
+
 
 urlpatterns = [
     # Namespace for all authentication-related APIs
@@ -8,4 +11,7 @@ urlpatterns = [
 
     # Namespace for text processing and search APIs
     path("api/text/", include("text_app.urls")),
+
+    # Request, query and task metrics in the Prometheus text format
+    path("metrics", metrics_view),
 ]
\ No newline at end of file
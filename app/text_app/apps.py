@@ -0,0 +1,12 @@
+from django.apps import AppConfig
+from django.db.models.signals import post_migrate
+
+
+class TextAppConfig(AppConfig):
+    name = "text_app"
+
+    def ready(self):
+        # Give every user shard its own primary key range
+        from .sharding import reserve_id_ranges
+
+        post_migrate.connect(reserve_id_ranges, sender=self)
@@ -0,0 +1,227 @@
+import json
+# Request bodies are decoded manually since these views bypass DRF
+
+from asgiref.sync import sync_to_async
+# Runs blocking engine lookups off the event loop
+
+from django.http import JsonResponse
+from django.middleware.csrf import CsrfViewMiddleware
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_GET, require_POST
+
+from rest_framework.authentication import get_authorization_header
+
+from auth_app.tokens import arequest_user, token_from_header
+
+from .ingest import acreate_paragraphs
+from .jobs import astart_job
+from .queries import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, asearch_page, decode_cursor, next_cursor
+from .multiterm import QuerySyntaxError, amulti_search_page, aterms_search_page, parse_query
+from .ranking import abm25_page
+from .replicas import user_replica_reads
+from .sharding import ShardMoving, begin_writes, end_writes, shard_for_user, use_shard
+from .search import get_search_engine
+from .terms import alookup_term_id
+from .vocabulary import InvalidPattern, expand_pattern, is_pattern
+
+
+# Async counterparts of the Submit and Search APIs.
+# They are plain Django coroutine views (DRF views are synchronous) and
+# authenticate with a bearer token or the session. Served under ASGI, a
+# request waiting on the database no longer holds a whole worker.
+
+
+def _not_authenticated():
+    # Same payload DRF returns for anonymous requests
+    return JsonResponse(
+        {"detail": "Authentication credentials were not provided."},
+        status=403
+    )
+
+
+def _csrf_rejected(request):
+    # Like DRF's SessionAuthentication, only cookie-authenticated requests
+    # need a CSRF token (browsers never attach bearer tokens by themselves)
+    if token_from_header(get_authorization_header(request)) is not None:
+        return False
+    check = CsrfViewMiddleware(lambda request: None)
+    check.process_request(request)
+    return check.process_view(request, None, (), {}) is not None
+
+
+# Exempt from the middleware so bearer-token clients need no CSRF token;
+# session requests are checked by _csrf_rejected
+@csrf_exempt
+@require_POST
+async def submit(request):
+    user = await arequest_user(request)
+    if not user.is_authenticated:
+        return _not_authenticated()
+
+    if _csrf_rejected(request):
+        return JsonResponse({"detail": "CSRF Failed: CSRF token missing or incorrect."}, status=403)
+
+    # Extract the list of paragraphs from the incoming request payload
+    try:
+        paragraphs = json.loads(request.body or b"{}").get("paragraphs", [])
+    except (ValueError, AttributeError):
+        return JsonResponse({"error": "Invalid JSON body"}, status=400)
+
+    # Validate that paragraph data is provided
+    if not paragraphs:
+        return JsonResponse({"error": "No paragraphs provided"}, status=400)
+
+    # Ensure the input is a list (not string, dict, etc.)
+    if not isinstance(paragraphs, list):
+        return JsonResponse({"error": "Paragraphs must be a list"}, status=400)
+
+    # Registered as a writer so rebalance_shard can wait for the request
+    try:
+        await sync_to_async(begin_writes)(user.id)
+    except ShardMoving as exc:
+        return JsonResponse({"detail": exc.detail}, status=exc.status_code)
+    try:
+        with use_shard(await sync_to_async(shard_for_user)(user.id)):
+            texts = [text for text in paragraphs if text and isinstance(text, str)]
+            job = await astart_job(user, len(texts))
+            created_ids = await acreate_paragraphs(user, texts, job)
+    finally:
+        await sync_to_async(end_writes)(user.id)
+
+    return JsonResponse(
+        {
+            "message": f"Processing {len(created_ids)} paragraphs",
+            "job_id": job.id,
+            "paragraph_ids": created_ids,
+            "processing": True
+        },
+        status=202
+    )
+
+
+@require_GET
+async def search(request):
+    user = await arequest_user(request)
+    if not user.is_authenticated:
+        return _not_authenticated()
+
+    # Every query below goes to the user's shard (or one of its replicas)
+    with use_shard(await sync_to_async(shard_for_user)(user.id)):
+        with await sync_to_async(user_replica_reads)(user.id):
+            return await _search(request, user)
+
+
+async def _search(request, user):
+    # Multi-word queries ("cat dog", "cat AND dog") are passed as ?q=
+    query = request.GET.get("q", "").strip()
+    if query:
+        return await _multi_search(request, user, query)
+
+    # Normalized to lowercase to ensure case-insensitive matching
+    word = request.GET.get("word", "").strip().lower()
+    if not word:
+        return JsonResponse({"error": "Word parameter is required"}, status=400)
+
+    # Optional page size and keyset cursor returned by a previous page
+    try:
+        limit = int(request.GET.get("limit", DEFAULT_PAGE_SIZE))
+        cursor = request.GET.get("cursor")
+        after = decode_cursor(cursor) if cursor else None
+    except ValueError:
+        return JsonResponse({"error": "Invalid limit or cursor"}, status=400)
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+
+    # Ranking: raw count (default, keyset paginated) or BM25 (first page only)
+    rank = request.GET.get("rank", "count")
+    if rank not in ("count", "bm25") or (rank == "bm25" and after is not None):
+        return JsonResponse(
+            {"error": "rank must be 'count' or 'bm25'; cursors are only valid with rank=count"},
+            status=400
+        )
+
+    # Prefix ("run*") and fuzzy ("runing~", "runing~2") words
+    if is_pattern(word):
+        if rank == "bm25":
+            return JsonResponse(
+                {"error": "rank=bm25 is not supported for prefix or fuzzy words"}, status=400
+            )
+        return await _pattern_search(user, word, limit, after)
+
+    if rank == "bm25":
+        term_id = await alookup_term_id(word)
+        results = await abm25_page(user.id, term_id, limit) if term_id is not None else []
+        return JsonResponse({
+            "word": word,
+            "rank": rank,
+            "total_results": len(results),
+            "results": results,
+            "next_cursor": None
+        })
+
+    # Answer the first page from the configured search engine when it is warm
+    engine = get_search_engine()
+    results = None
+    if engine is not None and after is None:
+        results = await sync_to_async(engine.search, thread_sensitive=False)(user.id, word, limit)
+
+    if results is None:
+        results = await _search_orm(user, word, limit, after)
+
+    return JsonResponse({
+        "word": word,
+        "rank": rank,
+        "total_results": len(results),
+        "results": results,
+        "next_cursor": next_cursor(results, limit)
+    })
+
+
+async def _search_orm(user, word, limit, after):
+    # Words that were never indexed cannot match anything
+    term_id = await alookup_term_id(word)
+    if term_id is None:
+        return []
+
+    return await asearch_page(user.id, term_id, limit, after)
+
+
+async def _pattern_search(user, pattern, limit, after):
+    try:
+        if after is not None:
+            raise InvalidPattern(pattern)
+        terms = await sync_to_async(expand_pattern)(user.id, pattern)
+    except InvalidPattern:
+        return JsonResponse(
+            {"error": "Invalid prefix or fuzzy pattern (cursors are not supported)"},
+            status=400
+        )
+
+    results = await aterms_search_page(user.id, terms, "OR", limit)
+    return JsonResponse({
+        "word": pattern,
+        "expanded": list(terms),
+        "total_results": len(results),
+        "results": results,
+        "next_cursor": None
+    })
+
+
+async def _multi_search(request, user, query):
+    try:
+        operator, words = parse_query(query)
+        limit = int(request.GET.get("limit", DEFAULT_PAGE_SIZE))
+    except QuerySyntaxError as e:
+        return JsonResponse({"error": str(e)}, status=400)
+    except ValueError:
+        return JsonResponse({"error": "Invalid limit"}, status=400)
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+
+    results = await amulti_search_page(user.id, words, operator, limit)
+    return JsonResponse({
+        "query": query,
+        "operator": operator,
+        "words": words,
+        "total_results": len(results),
+        "results": results,
+        "next_cursor": None
+    })
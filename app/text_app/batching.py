@@ -0,0 +1,59 @@
+import threading
+# Timer thread and lock used to flush pending ids from inside a worker process
+
+
+class ParagraphCollector:
+    """
+    Gathers paragraph ids inside a worker process for a few milliseconds
+    and hands them to a flush callback as one batch.
+
+    A batch is flushed when it reaches max_size or when max_wait_ms has
+    elapsed since the first pending id arrived, whichever comes first.
+    """
+
+    def __init__(self, flush, max_size=200, max_wait_ms=20):
+        # Callback receiving a list of paragraph ids
+        self.flush_callback = flush
+
+        # Flush thresholds (size and time)
+        self.max_size = max_size
+        self.max_wait = max_wait_ms / 1000.0
+
+        # Pending ids and the timer that will flush them
+        self._pending = []
+        self._timer = None
+        self._lock = threading.Lock()
+
+    def add(self, paragraph_id):
+        # Queue an id and flush immediately once the batch is full
+        with self._lock:
+            self._pending.append(paragraph_id)
+
+            if len(self._pending) >= self.max_size:
+                batch = self._take()
+            else:
+                batch = None
+                # Start the wait window on the first pending id only
+                if self._timer is None:
+                    self._timer = threading.Timer(self.max_wait, self.flush)
+                    self._timer.daemon = True
+                    self._timer.start()
+
+        if batch:
+            self.flush_callback(batch)
+
+    def flush(self):
+        # Hand all currently pending ids to the callback
+        with self._lock:
+            batch = self._take()
+
+        if batch:
+            self.flush_callback(batch)
+
+    def _take(self):
+        # Detach pending ids and cancel the timer (caller holds the lock)
+        batch, self._pending = self._pending, []
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        return batch
@@ -0,0 +1,212 @@
+from collections import Counter, defaultdict
+# Accumulates per-user and per-(user, term) deltas before writing
+
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, Value, When
+
+from .models import CorpusStats, DocumentFrequency, Paragraph
+from .replicas import mark_written
+from .sharding import current_shard
+from .terms import lookup_term_id
+from .vocabulary import vocabulary_cache
+
+
+# Corpus statistics used for BM25 ranking:
+#   Paragraph.token_count   document length
+#   DocumentFrequency       paragraphs of a user containing a term
+#   CorpusStats             paragraph count and total tokens of a user
+# They are updated by the indexing tasks inside the same transaction as
+# the frequencies, so ranking never sees one without the other.
+# A word is in the user's search vocabulary while its DocumentFrequency
+# is positive; words crossing 0 either way are reported to the cached
+# vocabularies.
+
+
+# Maximum number of term ids in a single UPDATE ... WHERE term_id IN (...)
+UPDATE_CHUNK_SIZE = 1000
+
+
+def record_indexed(indexed, term_ids):
+    # Count freshly indexed paragraphs into the statistics.
+    # Paragraphs that already have a token_count were counted before
+    # (a redelivered or retried task) and are left alone.
+    # Returns the paragraphs counted for the first time.
+    paragraph_deltas = defaultdict(lambda: [0, 0])
+    term_deltas = Counter()
+    lengths = []
+
+    for paragraph, freq in indexed:
+        if paragraph.token_count is not None:
+            continue
+        length = sum(freq.values())
+        paragraph.token_count = length
+        lengths.append(paragraph)
+
+        deltas = paragraph_deltas[paragraph.user_id]
+        deltas[0] += 1
+        deltas[1] += length
+        for word in freq:
+            term_deltas[paragraph.user_id, term_ids[word]] += 1
+
+    if lengths:
+        Paragraph.objects.bulk_update(lengths, ['token_count'])
+    changed = _apply(paragraph_deltas, term_deltas)
+    _notify_vocabulary(changed, {term_id: word for word, term_id in term_ids.items()})
+    _notify_written(paragraph_deltas)
+    return lengths
+
+
+def record_reindexed(paragraph, freq, term_ids, added_words, removed_words):
+    # Apply the effect of an edit: the new length replaces the old one
+    # and only words that appeared or disappeared change document frequency
+    previous_length = paragraph.token_count
+    if previous_length is None:
+        # Edited before its first indexing finished: count it as new
+        record_indexed([(paragraph, freq)], term_ids)
+        return
+
+    length = sum(freq.values())
+    paragraph.token_count = length
+    Paragraph.objects.filter(id=paragraph.id).update(token_count=length)
+
+    words = {term_id: word for word, term_id in term_ids.items()}
+    term_deltas = Counter()
+    for word in added_words:
+        term_deltas[paragraph.user_id, term_ids[word]] += 1
+    for word in removed_words:
+        term_id = term_ids.get(word) or lookup_term_id(word)
+        if term_id is not None:
+            term_deltas[paragraph.user_id, term_id] -= 1
+            words[term_id] = word
+
+    changed = _apply({paragraph.user_id: [0, length - previous_length]}, term_deltas)
+    _notify_vocabulary(changed, words)
+    _notify_written([paragraph.user_id])
+
+
+def _notify_vocabulary(changed, words):
+    # Add words that entered vocabularies and remove those that left,
+    # once the transaction commits
+    changes = {}
+    for (user_id, term_id), entered in changed.items():
+        if term_id in words:
+            changes.setdefault(user_id, {})[words[term_id]] = term_id if entered else None
+    if changes:
+        transaction.on_commit(lambda: vocabulary_cache.words_changed(changes), using=current_shard())
+
+
+def _notify_written(user_ids):
+    # Keep these users' searches on the primary until replicas catch up
+    user_ids = list(user_ids)
+    if user_ids:
+        transaction.on_commit(lambda: mark_written(user_ids), using=current_shard())
+
+
+def _apply(paragraph_deltas, term_deltas):
+    # Write accumulated deltas with atomic F() increments.
+    # Missing counter rows are created first with ignore_conflicts so
+    # concurrent workers never fail on the unique constraint.
+    # Returns {(user_id, term_id): True if the term entered the user's
+    # vocabulary, False if it left it}.
+    if paragraph_deltas:
+        CorpusStats.objects.bulk_create(
+            [CorpusStats(user_id=user_id) for user_id in sorted(paragraph_deltas)],
+            ignore_conflicts=True
+        )
+        for user_id in sorted(paragraph_deltas):
+            paragraphs, tokens = paragraph_deltas[user_id]
+            if paragraphs or tokens:
+                CorpusStats.objects.filter(user_id=user_id).update(
+                    paragraph_count=F('paragraph_count') + paragraphs,
+                    total_tokens=F('total_tokens') + tokens
+                )
+
+    term_deltas = {key: delta for key, delta in term_deltas.items() if delta}
+    if not term_deltas:
+        return {}
+
+    new_terms, idle_terms = _missing_terms(term_deltas)
+    if new_terms:
+        DocumentFrequency.objects.bulk_create(
+            [
+                DocumentFrequency(user_id=user_id, term_id=term_id)
+                for user_id, term_id in sorted(new_terms)
+            ],
+            ignore_conflicts=True
+        )
+
+    # Rows are updated in (user_id, term_id) order across the whole batch so
+    # concurrent workers lock them in the same order and cannot deadlock.
+    # Most terms share a handful of delta values (+1, +2, ...), so each
+    # chunk is one UPDATE with a CASE over its deltas.
+    by_user = defaultdict(list)
+    for (user_id, term_id), delta in term_deltas.items():
+        by_user[user_id].append((term_id, delta))
+
+    for user_id in sorted(by_user):
+        entries = sorted(by_user[user_id])
+        for start in range(0, len(entries), UPDATE_CHUNK_SIZE):
+            chunk = entries[start:start + UPDATE_CHUNK_SIZE]
+            groups = defaultdict(list)
+            for term_id, delta in chunk:
+                groups[delta].append(term_id)
+            increment = Case(
+                *[When(term_id__in=ids, then=Value(delta)) for delta, ids in sorted(groups.items())],
+                default=Value(0),
+                output_field=IntegerField()
+            )
+            DocumentFrequency.objects.filter(
+                user_id=user_id, term_id__in=[term_id for term_id, _ in chunk]
+            ).update(paragraph_count=F('paragraph_count') + increment)
+
+    changed = {key: True for key in new_terms if term_deltas[key] > 0}
+    # Only decremented rows and rows that were at 0 can cross 0; their
+    # updated counts are read back under the row locks just taken
+    crossing = [key for key, delta in term_deltas.items() if delta < 0 or key in idle_terms]
+    for (user_id, term_id), count in _counts(crossing).items():
+        if term_deltas[user_id, term_id] > 0 and count > 0:
+            changed[user_id, term_id] = True
+        elif term_deltas[user_id, term_id] < 0 and count <= 0:
+            changed[user_id, term_id] = False
+    return changed
+
+
+def _missing_terms(term_deltas):
+    # (user_id, term_id) pairs that have no DocumentFrequency row yet, and
+    # those whose row counts no paragraph
+    by_user = defaultdict(list)
+    for user_id, term_id in term_deltas:
+        by_user[user_id].append(term_id)
+
+    missing, idle = set(), set()
+    for user_id, ids in by_user.items():
+        ids.sort()
+        for start in range(0, len(ids), UPDATE_CHUNK_SIZE):
+            chunk = ids[start:start + UPDATE_CHUNK_SIZE]
+            existing = dict(
+                DocumentFrequency.objects
+                .filter(user_id=user_id, term_id__in=chunk)
+                .values_list('term_id', 'paragraph_count')
+            )
+            missing.update((user_id, term_id) for term_id in chunk if term_id not in existing)
+            idle.update((user_id, term_id) for term_id, count in existing.items() if count <= 0)
+    return missing, idle
+
+
+def _counts(keys):
+    # Current paragraph_count of the given (user_id, term_id) rows
+    by_user = defaultdict(list)
+    for user_id, term_id in keys:
+        by_user[user_id].append(term_id)
+
+    counts = {}
+    for user_id, ids in by_user.items():
+        ids.sort()
+        for start in range(0, len(ids), UPDATE_CHUNK_SIZE):
+            counts.update(
+                ((user_id, term_id), count)
+                for term_id, count in DocumentFrequency.objects
+                .filter(user_id=user_id, term_id__in=ids[start:start + UPDATE_CHUNK_SIZE])
+                .values_list('term_id', 'paragraph_count')
+            )
+    return counts
@@ -0,0 +1,176 @@
+import hashlib
+# Content fingerprints identify byte-identical paragraphs
+
+import json
+# Frequency tables are stored as JSON in the shared Redis tier
+
+import threading
+import time
+from collections import Counter, OrderedDict
+
+from django.conf import settings
+
+from core.metrics import registry
+# Per-process counters, exported with the other metrics of the process
+
+from .redis_client import connect
+
+
+FREQ_CACHE_LOOKUPS = registry.counter(
+    "text_freq_cache_lookups_total",
+    "Frequency cache lookups by result (hit or miss).",
+    ("result",)
+)
+FREQ_CACHE_SAVED_SECONDS = registry.counter(
+    "text_freq_cache_saved_seconds_total",
+    "Tokenization time saved by frequency cache hits."
+)
+
+
+def content_fingerprint(content):
+    # SHA-256 of the raw paragraph text
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+
+class FrequencyCache:
+    """
+    Bounded cache mapping content fingerprints to computed frequency tables.
+
+    A local LRU is consulted first, then an optional shared Redis tier.
+    Hit, miss and saved tokenization time counters are exported per process
+    through /metrics and, when Redis is configured, aggregated in a shared
+    hash. Each process adds its counts to the hash every STATS_FLUSH_LOOKUPS
+    lookups or STATS_FLUSH_SECONDS, so the shared totals lag slightly.
+    """
+
+    REDIS_PREFIX = "text:freq:"
+    STATS_KEY = "text:freq:stats"
+    STATS_FLUSH_LOOKUPS = 100
+    STATS_FLUSH_SECONDS = 5.0
+
+    def __init__(self, max_size, max_terms, redis_url=None, ttl=86400):
+        self.max_size = max_size
+        self.max_terms = max_terms
+        self.ttl = ttl
+        self.redis_url = redis_url
+        self._redis = None
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._pending = {"hits": 0, "misses": 0, "saved_seconds": 0.0}
+        self._flushed_at = time.monotonic()
+
+    def get(self, fingerprint):
+        # Return (total_words, Counter) or None
+        with self._lock:
+            entry = self._entries.get(fingerprint)
+            if entry is not None:
+                self._entries.move_to_end(fingerprint)
+
+        if entry is None and self.redis is not None:
+            raw = self.redis.get(self.REDIS_PREFIX + fingerprint)
+            if raw is not None:
+                data = json.loads(raw)
+                entry = (data["t"], data["f"], data["s"])
+                self._store_local(fingerprint, entry)
+
+        if entry is None:
+            self._record(hits=0, misses=1, saved=0.0)
+            return None
+
+        total_words, freq, seconds = entry
+        self._record(hits=1, misses=0, saved=seconds)
+        return total_words, Counter(freq)
+
+    def set(self, fingerprint, total_words, freq, seconds):
+        # Remember a computed table; very large vocabularies are not worth caching
+        if len(freq) > self.max_terms:
+            return
+        entry = (total_words, dict(freq), seconds)
+        self._store_local(fingerprint, entry)
+        if self.redis is not None:
+            self.redis.set(
+                self.REDIS_PREFIX + fingerprint,
+                json.dumps({"t": total_words, "f": entry[1], "s": seconds}),
+                ex=self.ttl
+            )
+
+    def stats(self):
+        # Counters aggregated across processes, or None without the shared
+        # tier: one process's counts would not describe the service
+        if self.redis is None:
+            return None
+        self.flush_stats()
+        raw = self.redis.hgetall(self.STATS_KEY)
+        stats = {key.decode(): float(value) for key, value in raw.items()}
+        hits = int(stats.get("hits", 0))
+        misses = int(stats.get("misses", 0))
+        saved = stats.get("saved_seconds", 0.0)
+
+        lookups = hits + misses
+        return {
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+            "saved_seconds": round(saved, 6),
+        }
+
+    def flush_stats(self):
+        # Add this process's pending counts to the shared hash
+        with self._lock:
+            pending = self._pending
+            self._pending = {"hits": 0, "misses": 0, "saved_seconds": 0.0}
+            self._flushed_at = time.monotonic()
+
+        if self.redis is None or not (pending["hits"] or pending["misses"]):
+            return
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.hincrby(self.STATS_KEY, "hits", pending["hits"])
+        pipe.hincrby(self.STATS_KEY, "misses", pending["misses"])
+        pipe.hincrbyfloat(self.STATS_KEY, "saved_seconds", pending["saved_seconds"])
+        pipe.execute()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._pending = {"hits": 0, "misses": 0, "saved_seconds": 0.0}
+
+    @property
+    def redis(self):
+        if self._redis is None and self.redis_url:
+            self._redis = connect(self.redis_url)
+        return self._redis
+
+    def _store_local(self, fingerprint, entry):
+        with self._lock:
+            self._entries[fingerprint] = entry
+            self._entries.move_to_end(fingerprint)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def _record(self, hits, misses, saved):
+        if hits:
+            FREQ_CACHE_LOOKUPS.inc(hits, result="hit")
+            FREQ_CACHE_SAVED_SECONDS.inc(saved)
+        if misses:
+            FREQ_CACHE_LOOKUPS.inc(misses, result="miss")
+
+        if not self.redis_url:
+            return
+        with self._lock:
+            self._pending["hits"] += hits
+            self._pending["misses"] += misses
+            self._pending["saved_seconds"] += saved
+            due = (
+                self._pending["hits"] + self._pending["misses"] >= self.STATS_FLUSH_LOOKUPS
+                or time.monotonic() - self._flushed_at >= self.STATS_FLUSH_SECONDS
+            )
+        if due:
+            self.flush_stats()
+
+
+frequency_cache = FrequencyCache(
+    max_size=getattr(settings, "TEXT_FREQ_CACHE_SIZE", 10000),
+    max_terms=getattr(settings, "TEXT_FREQ_CACHE_MAX_TERMS", 5000),
+    redis_url=getattr(settings, "TEXT_FREQ_CACHE_REDIS_URL", None),
+)
+# Process-wide cache used by compute_frequency
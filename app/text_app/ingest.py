@@ -0,0 +1,166 @@
+import json
+# Decodes newline-delimited JSON records
+
+from asgiref.sync import sync_to_async
+# Runs blocking broker publishes off the event loop
+
+from django.conf import settings
+# Project settings used for ingestion tuning parameters
+
+from .dedup import content_fingerprint
+from .jobs import add_paragraphs, start_job
+from .models import Paragraph
+from .replicas import amark_written, mark_written
+from .search import make_preview
+from .tasks import compute_frequency_batch, index_large_paragraph
+# Celery background task used to compute word frequency asynchronously
+
+
+def create_paragraphs(user, texts, job=None):
+    # Insert a batch of paragraph texts and queue them for indexing
+    # Returns the ids of the created paragraphs in input order
+    # The indexing tasks report their progress to `job` (an IngestJob)
+    new_paragraphs = [
+        Paragraph(
+            user=user,                              # Associate paragraph with authenticated user
+            content=text,                           # Store raw paragraph content
+            preview=make_preview(text),             # Served by Search instead of the full body
+            fingerprint=content_fingerprint(text),  # Lets duplicates reuse cached frequencies
+            job=job                                 # Counted as completed by its first indexing
+        )
+        for text in texts
+    ]
+
+    # Insert the whole batch in a single round-trip
+    # (primary keys are populated on backends that support RETURNING)
+    Paragraph.objects.bulk_create(new_paragraphs)
+    created_ids = [p.id for p in new_paragraphs]
+    mark_written([user.id])
+
+    _dispatch(created_ids, [len(text) for text in texts], user.id, job and job.id)
+    return created_ids
+
+
+async def acreate_paragraphs(user, texts, job=None):
+    # Async variant of create_paragraphs() for ASGI views
+    new_paragraphs = [
+        Paragraph(
+            user=user,
+            content=text,
+            preview=make_preview(text),
+            fingerprint=content_fingerprint(text),
+            job=job
+        )
+        for text in texts
+    ]
+    await Paragraph.objects.abulk_create(new_paragraphs)
+    created_ids = [p.id for p in new_paragraphs]
+    await amark_written([user.id])
+
+    # Publishing uses the blocking Celery client, so run it in a worker thread
+    await sync_to_async(_dispatch, thread_sensitive=False)(
+        created_ids, [len(text) for text in texts], user.id, job and job.id
+    )
+    return created_ids
+
+
+def is_large(size):
+    # Paragraphs above this many characters are indexed on the "large" queue
+    return size > settings.TEXT_LARGE_PARAGRAPH_CHARS
+
+
+def _dispatch(created_ids, sizes, user_id, job_id=None):
+    # Trigger background processing in chunks instead of one message per paragraph
+    # The owner's id lets the worker route to the right shard
+    # Small paragraphs are batched by count and total characters; large ones
+    # are counted in chunks on their own queue so they never delay small ones
+    chunk_size = settings.TEXT_INGEST_CHUNK_SIZE
+    chunk_chars = settings.TEXT_INGEST_CHUNK_CHARS
+
+    batch, batch_chars = [], 0
+    for paragraph_id, size in zip(created_ids, sizes):
+        if is_large(size):
+            index_large_paragraph.delay(paragraph_id, user_id=user_id, job_id=job_id)
+            continue
+        if batch and (len(batch) >= chunk_size or batch_chars + size > chunk_chars):
+            compute_frequency_batch.delay(batch, user_id=user_id, job_id=job_id)
+            batch, batch_chars = [], 0
+        batch.append(paragraph_id)
+        batch_chars += size
+
+    if batch:
+        compute_frequency_batch.delay(batch, user_id=user_id, job_id=job_id)
+
+
+def iter_lines(stream):
+    # Yield decoded lines from a byte stream without reading it fully
+    for line in stream:
+        if isinstance(line, bytes):
+            line = line.decode("utf-8", errors="replace")
+        yield line
+
+
+def iter_ndjson(lines):
+    # One paragraph per line: a JSON string or an object with "content"
+    # Yields None for lines that cannot be used so callers can count them
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError:
+            yield None
+            continue
+        if isinstance(record, dict):
+            record = record.get("content")
+        yield record if isinstance(record, str) and record.strip() else None
+
+
+def iter_text_blocks(lines):
+    # One paragraph per blank-line-separated block of plain text
+    block = []
+    for line in lines:
+        if line.strip():
+            block.append(line)
+        elif block:
+            yield "".join(block).strip()
+            block = []
+    if block:
+        yield "".join(block).strip()
+
+
+def ingest_stream(user, paragraphs, chunk_size):
+    # Insert paragraphs from an iterator in bounded chunks
+    # Only one chunk is held in memory at a time
+    # All chunks belong to one IngestJob, grown as chunks are inserted
+    job = start_job(user)
+    stats = {"job_id": job.id, "created": 0, "skipped": 0, "id_ranges": []}
+
+    chunk = []
+    for text in paragraphs:
+        if text is None:
+            stats["skipped"] += 1
+            continue
+        chunk.append(text)
+        if len(chunk) >= chunk_size:
+            _flush_chunk(user, chunk, job, stats)
+            chunk = []
+    if chunk:
+        _flush_chunk(user, chunk, job, stats)
+
+    return stats
+
+
+def _flush_chunk(user, chunk, job, stats):
+    add_paragraphs(job, len(chunk))
+    created_ids = create_paragraphs(user, chunk, job)
+    stats["created"] += len(created_ids)
+
+    # Collapse ids into [first, last] runs, extending the previous run if contiguous
+    ranges = stats["id_ranges"]
+    for paragraph_id in created_ids:
+        if ranges and ranges[-1][1] + 1 == paragraph_id:
+            ranges[-1][1] = paragraph_id
+        else:
+            ranges.append([paragraph_id, paragraph_id])
@@ -0,0 +1,72 @@
+from django.db.models import F
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+from .models import IngestJob, Paragraph
+
+
+# Progress of a submission is kept on one IngestJob row. The indexing tasks
+# carry the job id and add to its counters with single UPDATE ... SET
+# x = x + n statements, inside the same transaction as the index writes,
+# so "completed" counts each paragraph exactly once and the status
+# endpoint reads a single row however large the submission is.
+# A paragraph carries its job until it is counted (Paragraph.job), which
+# keeps that count independent of the corpus statistics: paragraphs edited
+# or recounted before their task ran still complete their job.
+
+
+def start_job(user, paragraph_count=0):
+    # Create the job of a new submission
+    return IngestJob.objects.create(user=user, paragraph_count=paragraph_count)
+
+
+async def astart_job(user, paragraph_count=0):
+    # Async variant of start_job() for ASGI views
+    return await IngestJob.objects.acreate(user=user, paragraph_count=paragraph_count)
+
+
+def add_paragraphs(job, count):
+    # Grow a streamed submission by a freshly inserted chunk
+    if count:
+        IngestJob.objects.filter(id=job.id).update(
+            paragraph_count=F('paragraph_count') + count,
+            updated_at=timezone.now()
+        )
+
+
+def record_progress(job_id, completed=0, failed=0, retrying=0):
+    # Apply counter deltas to a job (no-op for work submitted without one)
+    if job_id is None or not (completed or failed or retrying):
+        return
+    IngestJob.objects.filter(id=job_id).update(
+        completed=F('completed') + completed,
+        failed=F('failed') + failed,
+        # A redelivered task must not drive the gauge below zero
+        retrying=Greatest(F('retrying') + retrying, 0),
+        updated_at=timezone.now()
+    )
+
+
+def complete_paragraphs(job_id, paragraphs):
+    # Count indexed (locked) paragraphs still carrying the job as completed
+    if job_id is None:
+        return
+    ids = [paragraph.id for paragraph in paragraphs if paragraph.job_id == job_id]
+    if ids:
+        completed = Paragraph.objects.filter(id__in=ids, job_id=job_id).update(job=None)
+        record_progress(job_id, completed=completed)
+
+
+def job_status(job):
+    # API representation of a job's progress
+    return {
+        "job_id": job.id,
+        "paragraph_count": job.paragraph_count,
+        "completed": job.completed,
+        "failed": job.failed,
+        "retrying": job.retrying,
+        "pending": job.pending,
+        "done": job.pending == 0,
+        "created_at": job.created_at,
+        "updated_at": job.updated_at,
+    }
@@ -0,0 +1,47 @@
+from django.core.management.base import BaseCommand
+from django.db.models.functions import Left
+
+from text_app.models import Paragraph
+from text_app.search import make_preview
+from text_app.search.base import PREVIEW_LENGTH
+from text_app.sharding import shard_aliases, use_shard
+
+
+class Command(BaseCommand):
+    help = "Fill Paragraph.preview for rows created before the column existed"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--chunk-size", type=int, default=2000)
+
+    def handle(self, *args, **options):
+        updated = 0
+        for alias in shard_aliases():
+            with use_shard(alias):
+                updated += self._backfill(options["chunk_size"])
+
+        self.stdout.write(self.style.SUCCESS(f"Updated {updated} previews"))
+
+    def _backfill(self, chunk_size):
+        updated = 0
+        last_id = 0
+
+        while True:
+            # Walk the table by primary key; only the head of each body is read
+            rows = list(
+                Paragraph.objects
+                .filter(preview="", id__gt=last_id)
+                .order_by("id")
+                .annotate(head=Left("content", PREVIEW_LENGTH + 1))
+                .values_list("id", "head")[:chunk_size]
+            )
+            if not rows:
+                break
+            last_id = rows[-1][0]
+
+            Paragraph.objects.bulk_update(
+                [Paragraph(id=paragraph_id, preview=make_preview(head)) for paragraph_id, head in rows],
+                ["preview"]
+            )
+            updated += len(rows)
+
+        return updated
@@ -0,0 +1,236 @@
+import itertools
+import json
+import platform
+import random
+import statistics
+import subprocess
+import time
+from datetime import datetime, timezone
+
+import django
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import override_settings, setup_databases, teardown_databases
+from rest_framework.test import APIClient
+
+from core.celery import app as celery_app
+from text_app.models import Paragraph
+from text_app.sharding import user_shard
+from text_app.tasks import compute_frequency_batch
+
+
+# Apps whose tables are created directly from models in the throwaway database
+# (migrations are generated at deploy time and are not part of the tree)
+UNMIGRATED_APPS = {"auth_app": None, "text_app": None}
+
+BENCHMARK_CACHES = {"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+
+
+def _word(index):
+    # Deterministic alphabetic token for a vocabulary rank (a, b, ..., z, ba, bb, ...)
+    letters = []
+    while True:
+        index, rest = divmod(index, 26)
+        letters.append(chr(ord("a") + rest))
+        if index == 0:
+            break
+    return "w" + "".join(reversed(letters))
+
+
+class ZipfCorpus:
+    """
+    Synthetic corpus whose word ranks follow a Zipf distribution.
+
+    Rank r is drawn with probability proportional to 1 / r**s, which
+    matches the long-tailed vocabularies of real text.
+    """
+
+    def __init__(self, vocabulary, exponent, seed):
+        self.words = [_word(rank) for rank in range(vocabulary)]
+        weights = [1.0 / (rank + 1) ** exponent for rank in range(vocabulary)]
+        self.cum_weights = list(itertools.accumulate(weights))
+        self.random = random.Random(seed)
+
+    def sample_words(self, count):
+        return self.random.choices(self.words, cum_weights=self.cum_weights, k=count)
+
+    def paragraph(self, mean_length):
+        # Paragraph lengths vary uniformly within +/-50% of the mean
+        length = max(1, int(mean_length * self.random.uniform(0.5, 1.5)))
+        return " ".join(self.sample_words(length))
+
+
+def _percentiles(samples):
+    ordered = sorted(samples)
+
+    def pick(p):
+        return ordered[min(len(ordered) - 1, int(len(ordered) * p))] * 1000
+
+    return {
+        "count": len(ordered),
+        "mean_ms": round(statistics.mean(ordered) * 1000, 3),
+        "p50_ms": round(pick(0.50), 3),
+        "p90_ms": round(pick(0.90), 3),
+        "p99_ms": round(pick(0.99), 3),
+        "max_ms": round(ordered[-1] * 1000, 3),
+    }
+
+
+def _git_revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True, text=True, check=True, cwd=settings.BASE_DIR
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Command(BaseCommand):
+    help = (
+        "Generate a Zipf-distributed synthetic corpus, ingest it through Submit and "
+        "compute_frequency (Celery eager mode) and measure Search latency. "
+        "Runs in throwaway test databases for every configured alias (shards and "
+        "replicas included); set DJANGO_DB_ENGINE=sqlite to run "
+        "without PostgreSQL."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=3)
+        parser.add_argument("--paragraphs", type=int, default=2000, help="Paragraphs per user")
+        parser.add_argument("--paragraph-length", type=int, default=40, help="Mean words per paragraph")
+        parser.add_argument("--vocabulary", type=int, default=20000)
+        parser.add_argument("--zipf", type=float, default=1.1, help="Zipf exponent")
+        parser.add_argument("--batch-size", type=int, default=500, help="Paragraphs per Submit request")
+        parser.add_argument("--queries", type=int, default=500, help="Search requests per user")
+        parser.add_argument("--seed", type=int, default=42)
+        parser.add_argument("--output", help="Write the JSON results to this file")
+
+    def handle(self, *args, **options):
+        counts = ("users", "paragraphs", "paragraph_length", "vocabulary", "batch_size", "queries")
+        if any(options[name] < 1 for name in counts):
+            raise CommandError(
+                "--users, --paragraphs, --paragraph-length, --vocabulary, "
+                "--batch-size and --queries must be positive"
+            )
+
+        # Background work runs inline so no broker or worker is required
+        celery_app.conf.task_always_eager = True
+        celery_app.conf.task_eager_propagates = True
+
+        # Every alias (default, shards and their replica mirrors) gets a
+        # throwaway test database, and a local cache keeps the synthetic
+        # users' shard assignments out of the shared one
+        with override_settings(
+            MIGRATION_MODULES=UNMIGRATED_APPS,
+            TEXT_WORKER_MICROBATCH=False,
+            CACHES=BENCHMARK_CACHES,
+        ):
+            old_config = setup_databases(verbosity=0, interactive=False, serialized_aliases=set())
+            try:
+                results = self._run(options)
+            finally:
+                teardown_databases(old_config, verbosity=0)
+
+        output = json.dumps(results, indent=2)
+        if options["output"]:
+            with open(options["output"], "w") as f:
+                f.write(output + "\n")
+        self.stdout.write(output)
+
+    def _run(self, options):
+        corpus = ZipfCorpus(options["vocabulary"], options["zipf"], options["seed"])
+        User = get_user_model()
+        client = APIClient()
+
+        users = [
+            User.objects.create_user(username=f"bench{i}", password="Bench@12345")
+            for i in range(options["users"])
+        ]
+
+        # Ingestion: Submit requests, with compute_frequency running eagerly inside them
+        submit_latencies = []
+        total_words = 0
+        started = time.perf_counter()
+        for user in users:
+            client.force_authenticate(user)
+            remaining = options["paragraphs"]
+            while remaining > 0:
+                batch = [
+                    corpus.paragraph(options["paragraph_length"])
+                    for _ in range(min(options["batch_size"], remaining))
+                ]
+                total_words += sum(text.count(" ") + 1 for text in batch)
+                remaining -= len(batch)
+
+                request_started = time.perf_counter()
+                response = client.post("/api/text/submit/", {"paragraphs": batch}, format="json")
+                submit_latencies.append(time.perf_counter() - request_started)
+                if response.status_code != 202:
+                    raise CommandError(f"Submit failed: {response.status_code} {response.content[:200]}")
+        ingest_seconds = time.perf_counter() - started
+        paragraph_count = len(users) * options["paragraphs"]
+
+        # Worker throughput on its own: re-index everything through the batch
+        # task, one user (and so one shard) per batch as ingestion queues them
+        user_paragraphs = {}
+        for user in users:
+            with user_shard(user.id):
+                user_paragraphs[user.id] = list(
+                    Paragraph.objects.filter(user_id=user.id).order_by("id").values_list("id", flat=True)
+                )
+        paragraph_ids = [paragraph_id for ids in user_paragraphs.values() for paragraph_id in ids]
+        started = time.perf_counter()
+        chunk_size = settings.TEXT_INGEST_CHUNK_SIZE
+        for user_id, ids in user_paragraphs.items():
+            for start in range(0, len(ids), chunk_size):
+                compute_frequency_batch.apply(args=(ids[start:start + chunk_size],), kwargs={"user_id": user_id})
+        reindex_seconds = time.perf_counter() - started
+
+        # Search: query words follow the same Zipf distribution as the corpus
+        search_latencies = []
+        hits = 0
+        for user in users:
+            client.force_authenticate(user)
+            for word in corpus.sample_words(options["queries"]):
+                request_started = time.perf_counter()
+                response = client.get("/api/text/search/", {"word": word})
+                search_latencies.append(time.perf_counter() - request_started)
+                hits += response.data["total_results"]
+        client.force_authenticate(None)
+
+        return {
+            "revision": _git_revision(),
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "environment": {
+                "database": connection.vendor,
+                "python": platform.python_version(),
+                "django": django.get_version(),
+                "index_storage": settings.TEXT_INDEX_STORAGE,
+                "search_engine": getattr(settings, "TEXT_SEARCH_ENGINE", None),
+            },
+            "parameters": {
+                key: options[key]
+                for key in (
+                    "users", "paragraphs", "paragraph_length", "vocabulary",
+                    "zipf", "batch_size", "queries", "seed",
+                )
+            },
+            "ingest": {
+                "paragraphs": paragraph_count,
+                "words": total_words,
+                "seconds": round(ingest_seconds, 3),
+                "paragraphs_per_second": round(paragraph_count / ingest_seconds, 1),
+                "submit_latency": _percentiles(submit_latencies),
+            },
+            "compute_frequency": {
+                "seconds": round(reindex_seconds, 3),
+                "paragraphs_per_second": round(len(paragraph_ids) / reindex_seconds, 1),
+            },
+            "search": dict(
+                _percentiles(search_latencies),
+                mean_hits=round(hits / len(search_latencies), 2),
+            ),
+        }
@@ -0,0 +1,72 @@
+import json
+import statistics
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from http.cookiejar import CookieJar
+
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = (
+        "Fire concurrent Search requests at a running server and report "
+        "latency percentiles and throughput (compare WSGI and ASGI deployments)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--url", default="http://localhost:8000", help="Server base URL")
+        parser.add_argument("--path", default="/api/text/search/", help="Search endpoint path")
+        parser.add_argument("--word", default="the", help="Word to search for")
+        parser.add_argument("--username", required=True)
+        parser.add_argument("--password", required=True)
+        parser.add_argument("--concurrency", type=int, default=50)
+        parser.add_argument("--requests", type=int, default=2000)
+
+    def handle(self, *args, **options):
+        if options["concurrency"] < 1 or options["requests"] < 1:
+            raise CommandError("--concurrency and --requests must be positive")
+
+        base_url = options["url"].rstrip("/")
+        opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(CookieJar()))
+
+        # Log in once; the session cookie is shared by every worker thread
+        login = urllib.request.Request(
+            f"{base_url}/api/auth/login/",
+            data=json.dumps({
+                "username": options["username"],
+                "password": options["password"],
+            }).encode(),
+            headers={"Content-Type": "application/json"},
+        )
+        try:
+            opener.open(login).read()
+        except OSError as e:
+            raise CommandError(f"Login failed: {e}")
+
+        search_url = f"{base_url}{options['path']}?word={options['word']}"
+
+        def fetch(_):
+            start = time.perf_counter()
+            with opener.open(search_url) as response:
+                response.read()
+            return time.perf_counter() - start
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options["concurrency"]) as pool:
+            latencies = sorted(pool.map(fetch, range(options["requests"])))
+        elapsed = time.perf_counter() - started
+
+        def percentile(p):
+            return latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1000
+
+        self.stdout.write(json.dumps({
+            "url": search_url,
+            "concurrency": options["concurrency"],
+            "requests": len(latencies),
+            "throughput_rps": round(len(latencies) / elapsed, 1),
+            "mean_ms": round(statistics.mean(latencies) * 1000, 2),
+            "p50_ms": round(percentile(0.50), 2),
+            "p95_ms": round(percentile(0.95), 2),
+            "p99_ms": round(percentile(0.99), 2),
+        }, indent=2))
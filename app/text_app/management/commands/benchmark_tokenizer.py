@@ -0,0 +1,117 @@
+import json
+import os
+import platform
+import time
+import tracemalloc
+from collections import Counter
+from datetime import datetime, timezone
+
+from django.core.management.base import BaseCommand, CommandError
+
+from text_app.management.commands.benchmark import ZipfCorpus, _git_revision
+from text_app.tokenizer import WORD_RE, count_parallel, count_stream, tokenizer_pool
+
+
+def _findall(content):
+    # Single-pass path used before the streaming tokenizer
+    return Counter(WORD_RE.findall(content.lower()))
+
+
+def _measure(count, content, repeat):
+    # Best wall time over `repeat` runs, then one traced run for peak memory
+    # (tracemalloc only sees the calling process, not pool workers)
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        freq = count(content)
+        timings.append(time.perf_counter() - started)
+
+    tracemalloc.start()
+    count(content)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    seconds = min(timings)
+    return freq, {
+        "seconds": round(seconds, 4),
+        "mb_per_second": round(len(content) / seconds / 1e6, 1),
+        "peak_mb": round(peak / 1e6, 1),
+    }
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare the single-pass findall tokenizer with the streaming and "
+        "process-pool tokenizers on synthetic Zipf text of several sizes."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--sizes", default="100000,1000000,10000000",
+            help="Comma-separated text sizes in characters"
+        )
+        parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+        parser.add_argument("--repeat", type=int, default=3)
+        parser.add_argument("--vocabulary", type=int, default=20000)
+        parser.add_argument("--zipf", type=float, default=1.1, help="Zipf exponent")
+        parser.add_argument("--seed", type=int, default=42)
+        parser.add_argument("--output", help="Write the JSON results to this file")
+
+    def handle(self, *args, **options):
+        try:
+            sizes = [int(size) for size in options["sizes"].split(",")]
+        except ValueError:
+            raise CommandError("--sizes must be a comma-separated list of integers")
+        if options["workers"] < 1 or options["repeat"] < 1:
+            raise CommandError("--workers and --repeat must be positive")
+
+        corpus = ZipfCorpus(options["vocabulary"], options["zipf"], options["seed"])
+        methods = {
+            "findall": _findall,
+            "streaming": count_stream,
+            "parallel": lambda content: count_parallel(content, options["workers"]),
+        }
+
+        runs = []
+        try:
+            for size in sizes:
+                content = self._text(corpus, size)
+                run = {"size": len(content)}
+                expected = None
+                for name, count in methods.items():
+                    freq, run[name] = _measure(count, content, options["repeat"])
+                    if expected is None:
+                        expected = freq
+                    elif freq != expected:
+                        raise CommandError(f"{name} counts differ from findall at size {size}")
+                runs.append(run)
+        finally:
+            tokenizer_pool.reset()
+
+        results = {
+            "revision": _git_revision(),
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "environment": {
+                "python": platform.python_version(),
+                "cpus": os.cpu_count(),
+            },
+            "parameters": {
+                key: options[key] for key in ("workers", "repeat", "vocabulary", "zipf", "seed")
+            },
+            "runs": runs,
+        }
+
+        output = json.dumps(results, indent=2)
+        if options["output"]:
+            with open(options["output"], "w") as f:
+                f.write(output + "\n")
+        self.stdout.write(output)
+
+    def _text(self, corpus, size):
+        # Sentences of Zipf words with punctuation, cut to `size` characters
+        parts, length = [], 0
+        while length < size:
+            sentence = " ".join(corpus.sample_words(12)).capitalize() + ". "
+            parts.append(sentence)
+            length += len(sentence)
+        return "".join(parts)[:size]
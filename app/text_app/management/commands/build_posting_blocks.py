@@ -0,0 +1,95 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from text_app.models import Paragraph, PostingBlock, WordFrequency
+from text_app.postings import encode_postings, encode_terms
+from text_app.sharding import shard_aliases, use_shard
+
+
+class Command(BaseCommand):
+    help = "Convert WordFrequency rows into compressed PostingBlock rows"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--delete-rows",
+            action="store_true",
+            help="Delete each user's WordFrequency rows once their blocks are written",
+        )
+
+    def handle(self, *args, **options):
+        total_blocks = 0
+        for alias in shard_aliases():
+            with use_shard(alias):
+                total_blocks += self._convert_shard(alias, options)
+
+        self.stdout.write(self.style.SUCCESS(f"Wrote {total_blocks} posting blocks"))
+
+    def _convert_shard(self, alias, options):
+        block_size = settings.TEXT_POSTING_BLOCK_SIZE
+        user_ids = (
+            WordFrequency.objects
+            .order_by("user_id")
+            .values_list("user_id", flat=True)
+            .distinct()
+        )
+
+        total_blocks = 0
+        for user_id in list(user_ids):
+            # Convert one user at a time inside its own transaction
+            with transaction.atomic(using=alias):
+                PostingBlock.objects.filter(user_id=user_id).delete()
+
+                rows = (
+                    WordFrequency.objects
+                    .filter(user_id=user_id)
+                    .order_by("term_id", "-count", "paragraph_id")
+                    .values_list("term_id", "paragraph_id", "count")
+                    .iterator(chunk_size=10000)
+                )
+
+                blocks = []
+                paragraph_terms = {}
+                current_term, postings = None, []
+                for term_id, paragraph_id, count in rows:
+                    paragraph_terms.setdefault(paragraph_id, {})[term_id] = count
+                    if term_id != current_term or len(postings) == block_size:
+                        if postings:
+                            blocks.append(self._block(user_id, current_term, postings))
+                        current_term, postings = term_id, []
+                    postings.append((paragraph_id, count))
+                if postings:
+                    blocks.append(self._block(user_id, current_term, postings))
+
+                PostingBlock.objects.bulk_create(blocks, batch_size=1000)
+                total_blocks += len(blocks)
+
+                # Stored term lists let re-indexing replace these postings
+                Paragraph.objects.bulk_update(
+                    [
+                        Paragraph(id=paragraph_id, indexed_terms=encode_terms(terms))
+                        for paragraph_id, terms in paragraph_terms.items()
+                    ],
+                    ['indexed_terms'],
+                    batch_size=1000
+                )
+
+                if options["delete_rows"]:
+                    WordFrequency.objects.filter(user_id=user_id).delete()
+
+            self.stdout.write(f"User {user_id}: {len(blocks)} blocks")
+
+        return total_blocks
+
+    @staticmethod
+    def _block(user_id, term_id, postings):
+        return PostingBlock(
+            user_id=user_id,
+            term_id=term_id,
+            max_count=postings[0][1],
+            min_count=postings[-1][1],
+            first_id=postings[0][0],
+            last_id=postings[-1][0],
+            size=len(postings),
+            data=encode_postings(postings),
+        )
@@ -0,0 +1,209 @@
+import time
+from contextlib import contextmanager
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from text_app.models import (
+    CorpusStats, DocumentFrequency, IngestJob, Paragraph, PostingBlock, Term, WordFrequency,
+    WordSketch,
+)
+from text_app.sharding import assign_shard, set_moving, shard_aliases, shard_for_user, writers_in_flight
+from text_app.terms import TERM_DATABASE
+
+
+# Copied parents first, deleted children first
+MOVED_MODELS = [Paragraph, WordFrequency, PostingBlock, DocumentFrequency, CorpusStats, IngestJob, WordSketch]
+
+
+@contextmanager
+def _stored_timestamps():
+    # Copies keep created_at/updated_at as stored on the source instead of
+    # being stamped with the current time by auto_now(_add)
+    fields = [
+        field for model in MOVED_MODELS for field in model._meta.concrete_fields
+        if getattr(field, "auto_now", False) or getattr(field, "auto_now_add", False)
+    ]
+    flags = [(field.auto_now, field.auto_now_add) for field in fields]
+    for field in fields:
+        field.auto_now = field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, (auto_now, auto_now_add) in zip(fields, flags):
+            field.auto_now, field.auto_now_add = auto_now, auto_now_add
+
+
+def _row_values(row):
+    # Comparable column values (binary columns come back as memoryview)
+    return tuple(bytes(value) if isinstance(value, memoryview) else value for value in row)
+
+
+class Command(BaseCommand):
+    help = (
+        "Move a user's text data to another shard. Rows keep their ids. "
+        "A first pass copies the data while the user keeps writing; the "
+        "user's writes are then refused (views answer 503, tasks are queued "
+        "again) until the writes in flight are done, a second pass copies "
+        "every row changed or deleted since, and the user is re-pointed. "
+        "Requires a shared cache so every process sees the move."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("user_id", type=int)
+        parser.add_argument("target", help="Destination database alias from TEXT_SHARDS")
+        parser.add_argument("--chunk-size", type=int, default=5000)
+        parser.add_argument(
+            "--drain-timeout",
+            type=float,
+            default=60,
+            help="Seconds to wait for the user's writes in flight before giving up",
+        )
+
+    def handle(self, *args, **options):
+        user_id, target = options["user_id"], options["target"]
+        chunk_size = options["chunk_size"]
+
+        if target not in shard_aliases():
+            raise CommandError(f"{target} is not one of TEXT_SHARDS {shard_aliases()}")
+        source = shard_for_user(user_id)
+        if source == target:
+            raise CommandError(f"User {user_id} is already on {target}")
+
+        # Ids come from per-shard ranges, but SQLite keeps allocating above
+        # the highest id it has seen, so refuse to overwrite foreign rows
+        self._check_conflicts(user_id, source, target, chunk_size)
+
+        copied = self._sync(user_id, source, target, chunk_size)
+
+        # Second pass with the user's writes stopped: whatever changed on the
+        # source during the first pass (new, updated and deleted rows)
+        set_moving(user_id, True)
+        try:
+            self._drain(user_id, options["drain_timeout"])
+            copied += self._sync(user_id, source, target, chunk_size)
+
+            # New writes go to the target from here on
+            assign_shard(user_id, target)
+        finally:
+            set_moving(user_id, False)
+
+        with transaction.atomic(using=source):
+            for model in reversed(MOVED_MODELS):
+                model.objects.using(source).filter(user_id=user_id).delete()
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Moved user {user_id} from {source} to {target} ({copied} rows copied)"
+        ))
+
+    def _drain(self, user_id, timeout):
+        # Wait for requests and tasks that started writing before the stop
+        deadline = time.monotonic() + timeout
+        while writers_in_flight(user_id):
+            if time.monotonic() >= deadline:
+                raise CommandError(
+                    f"User {user_id} still has writes in flight after {timeout:g}s; nothing was moved"
+                )
+            time.sleep(0.1)
+
+    def _check_conflicts(self, user_id, source, target, chunk_size):
+        for model in MOVED_MODELS:
+            pks = list(
+                model.objects.using(source)
+                .filter(user_id=user_id)
+                .order_by("pk")
+                .values_list("pk", flat=True)
+            )
+            for start in range(0, len(pks), chunk_size):
+                taken = (
+                    model.objects.using(target)
+                    .filter(pk__in=pks[start:start + chunk_size])
+                    .exclude(user_id=user_id)
+                    .exists()
+                )
+                if taken:
+                    raise CommandError(
+                        f"{model.__name__} ids of user {user_id} are already used on {target}"
+                    )
+
+    def _sync(self, user_id, source, target, chunk_size):
+        # Make the user's rows on the target equal to those on the source,
+        # writing only rows that are missing, different or gone
+        copied = 0
+        with transaction.atomic(using=target), _stored_timestamps():
+            self._copy_terms(user_id, source, target, chunk_size)
+
+            # Rows deleted on the source first, so re-inserted rows (new id,
+            # same unique columns) cannot collide with their old copies
+            for model in reversed(MOVED_MODELS):
+                kept = set(
+                    model.objects.using(source).filter(user_id=user_id).values_list("pk", flat=True)
+                )
+                gone = [
+                    pk for pk in
+                    model.objects.using(target).filter(user_id=user_id).values_list("pk", flat=True)
+                    if pk not in kept
+                ]
+                for start in range(0, len(gone), chunk_size):
+                    model.objects.using(target).filter(pk__in=gone[start:start + chunk_size]).delete()
+
+            for model in MOVED_MODELS:
+                columns = [field.attname for field in model._meta.concrete_fields]
+                pk_index = columns.index(model._meta.pk.attname)
+                rows = (
+                    model.objects.using(source)
+                    .filter(user_id=user_id)
+                    .order_by("pk")
+                    .values_list(*columns)
+                    .iterator(chunk_size=chunk_size)
+                )
+                batch = []
+                for row in rows:
+                    batch.append(_row_values(row))
+                    if len(batch) >= chunk_size:
+                        copied += self._upsert(model, target, columns, pk_index, batch)
+                        batch = []
+                if batch:
+                    copied += self._upsert(model, target, columns, pk_index, batch)
+        return copied
+
+    def _copy_terms(self, user_id, source, target, chunk_size):
+        # Terms referenced by the user's rows must exist on the target first
+        term_ids = set()
+        for model in (WordFrequency, PostingBlock, DocumentFrequency):
+            term_ids.update(
+                model.objects.using(source)
+                .filter(user_id=user_id)
+                .values_list("term_id", flat=True)
+                .distinct()
+            )
+        term_ids = sorted(term_ids)
+        for start in range(0, len(term_ids), chunk_size):
+            terms = Term.objects.using(TERM_DATABASE).filter(
+                id__in=term_ids[start:start + chunk_size]
+            )
+            Term.objects.using(target).bulk_create(list(terms), ignore_conflicts=True)
+
+    def _upsert(self, model, target, columns, pk_index, rows):
+        # Write the source rows that the target lacks or holds differently
+        pk_name = model._meta.pk.name
+        existing = {
+            row[pk_index]: row for row in (
+                _row_values(row) for row in
+                model.objects.using(target)
+                .filter(pk__in=[row[pk_index] for row in rows])
+                .values_list(*columns)
+            )
+        }
+        changed = [
+            model(**dict(zip(columns, row)))
+            for row in rows if existing.get(row[pk_index]) != row
+        ]
+        if changed:
+            model.objects.using(target).bulk_create(
+                changed,
+                update_conflicts=True,
+                unique_fields=[pk_name],
+                update_fields=[field.name for field in model._meta.concrete_fields if not field.primary_key]
+            )
+        return len(changed)
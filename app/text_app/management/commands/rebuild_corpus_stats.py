@@ -0,0 +1,92 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from text_app.corpus import record_indexed
+from text_app.models import CorpusStats, DocumentFrequency, Paragraph, Term, WordFrequency, WordSketch
+from text_app.postings import decode_terms
+from text_app.sharding import shard_aliases, use_shard
+from text_app.sketches import counts_by_user, record_words
+from text_app.vocabulary import vocabulary_cache
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute BM25 corpus statistics (token counts, document frequencies) "
+        "and the top-words sketches from the stored postings. Paragraphs that "
+        "were never indexed are left to requeue_unindexed. Run it while the "
+        "indexing workers are stopped: statistics are rebuilt one batch at a time"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--chunk-size", type=int, default=2000)
+
+    def handle(self, *args, **options):
+        if options["chunk_size"] <= 0:
+            raise CommandError("--chunk-size must be positive")
+
+        counted = 0
+        for alias in shard_aliases():
+            with use_shard(alias):
+                counted += self._rebuild(alias, options["chunk_size"])
+
+        self.stdout.write(self.style.SUCCESS(f"Counted {counted} paragraphs"))
+
+    def _rebuild(self, alias, chunk_size):
+        with transaction.atomic(using=alias):
+            user_ids = list(CorpusStats.objects.values_list("user_id", flat=True))
+            DocumentFrequency.objects.all().delete()
+            CorpusStats.objects.all().delete()
+            WordSketch.objects.all().delete()
+        # Words left out of the rebuilt frequencies are never reported as removed
+        vocabulary_cache.invalidate(user_ids)
+
+        counted = 0
+        last_id = 0
+        while True:
+            # One short transaction per id range, so indexing and edits are
+            # never blocked behind the whole shard
+            with transaction.atomic(using=alias):
+                paragraphs = list(
+                    Paragraph.objects
+                    .select_for_update()
+                    .filter(id__gt=last_id, token_count__isnull=False)
+                    .order_by("id")
+                    .only("id", "user_id", "token_count", "indexed_terms")[:chunk_size]
+                )
+                if not paragraphs:
+                    break
+                last_id = paragraphs[-1].id
+
+                indexed, term_ids = _stored_counts(paragraphs)
+                for paragraph in paragraphs:
+                    # Count every paragraph again; record_indexed skips counted ones
+                    paragraph.token_count = None
+                fresh = record_indexed(indexed, term_ids)
+                record_words(counts_by_user(indexed, fresh))
+                counted += len(paragraphs)
+
+        return counted
+
+
+def _stored_counts(paragraphs):
+    # (paragraph, {word: count}) pairs read back from the stored postings,
+    # and the {word: term_id} mapping they use
+    if settings.TEXT_INDEX_STORAGE == "blocks":
+        by_paragraph = {paragraph.id: decode_terms(paragraph.indexed_terms) for paragraph in paragraphs}
+    else:
+        by_paragraph = {paragraph.id: {} for paragraph in paragraphs}
+        for paragraph_id, term_id, count in (
+            WordFrequency.objects
+            .filter(paragraph_id__in=list(by_paragraph))
+            .values_list("paragraph_id", "term_id", "count")
+        ):
+            by_paragraph[paragraph_id][term_id] = count
+
+    used = set().union(*by_paragraph.values())
+    words = dict(Term.objects.filter(id__in=list(used)).values_list("id", "text"))
+    indexed = [
+        (paragraph, {words[term_id]: count for term_id, count in by_paragraph[paragraph.id].items()})
+        for paragraph in paragraphs
+    ]
+    return indexed, {word: term_id for term_id, word in words.items()}
@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand, CommandError
+# Base class and error type for custom manage.py commands
+
+from django.utils.module_loading import import_string
+
+from text_app.search import get_search_engine
+# Engine configured through TEXT_SEARCH_ENGINE
+
+
+class Command(BaseCommand):
+    help = "Rebuild the configured search engine index from WordFrequency rows"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--engine",
+            help=(
+                "Dotted path of the engine to rebuild instead of TEXT_SEARCH_ENGINE, "
+                "e.g. text_app.search.segments.SegmentSearchEngine to write index "
+                "segments before switching to them"
+            )
+        )
+
+    def handle(self, *args, **options):
+        if options["engine"]:
+            try:
+                engine = import_string(options["engine"])()
+            except ImportError as e:
+                raise CommandError(str(e))
+        else:
+            engine = get_search_engine()
+        if engine is None:
+            raise CommandError("TEXT_SEARCH_ENGINE is not configured")
+
+        try:
+            postings = engine.rebuild()
+        except NotImplementedError:
+            raise CommandError(f"{type(engine).__name__} has no persistent index to rebuild")
+
+        self.stdout.write(self.style.SUCCESS(f"Indexed {postings} postings"))
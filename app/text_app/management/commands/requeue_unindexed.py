@@ -0,0 +1,65 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db.models.functions import Length
+from django.utils import timezone
+
+from text_app.ingest import _dispatch
+from text_app.models import Paragraph
+from text_app.sharding import shard_aliases, use_shard
+
+
+class Command(BaseCommand):
+    help = (
+        "Queue indexing again for paragraphs that were never indexed "
+        "(token_count is NULL), e.g. ids lost with a worker's micro-batch "
+        "collector (TEXT_WORKER_MICROBATCH). Run it periodically, but not "
+        "while rebuild_corpus_stats runs: that command clears token_count."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--older-than",
+            type=int,
+            default=600,
+            help="Only paragraphs created at least this many seconds ago (still queued otherwise)",
+        )
+        parser.add_argument("--chunk-size", type=int, default=2000)
+
+    def handle(self, *args, **options):
+        created_before = timezone.now() - timedelta(seconds=options["older_than"])
+        queued = 0
+        for alias in shard_aliases():
+            with use_shard(alias):
+                queued += self._requeue(created_before, options["chunk_size"])
+
+        self.stdout.write(self.style.SUCCESS(f"Queued {queued} unindexed paragraphs"))
+
+    def _requeue(self, created_before, chunk_size):
+        queued = 0
+        last_id = 0
+
+        while True:
+            # Walk the table by primary key; bodies are measured, not loaded
+            rows = list(
+                Paragraph.objects
+                .filter(token_count__isnull=True, created_at__lt=created_before, id__gt=last_id)
+                .order_by("id")
+                .annotate(length=Length("content"))
+                .values_list("id", "user_id", "length")[:chunk_size]
+            )
+            if not rows:
+                break
+            last_id = rows[-1][0]
+
+            # Same routing as a submission; the original job is unknown,
+            # so its progress counters are left as they are
+            by_user = {}
+            for paragraph_id, user_id, length in rows:
+                by_user.setdefault(user_id, []).append((paragraph_id, length))
+            for user_id, paragraphs in by_user.items():
+                ids, sizes = zip(*paragraphs)
+                _dispatch(list(ids), list(sizes), user_id)
+            queued += len(rows)
+
+        return queued
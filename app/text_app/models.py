@@ -10,12 +10,41 @@ class Paragraph(models.Model):
     user = models.ForeignKey(
         settings.AUTH_USER_MODEL,
         on_delete=models.CASCADE,
-        related_name='paragraphs'
+        related_name='paragraphs',
+        # Users live on "default"; shards cannot reference them
+        db_constraint=False
     )
 
     # Stores the raw paragraph text submitted by the user
     content = models.TextField()
 
+    # First 100 characters of the content (plus "..."), computed at ingest time
+    # so search results never need to load the full body
+    preview = models.CharField(max_length=103, blank=True)
+
+    # SHA-256 of the content, used to reuse frequency tables of duplicates
+    fingerprint = models.CharField(max_length=64, blank=True, db_index=True)
+
+    # Number of tokens in the content, set when the paragraph is indexed
+    # (None until then); used as the document length for BM25 ranking
+    token_count = models.PositiveIntegerField(null=True, blank=True)
+
+    # Varint encoded (term_id, count) pairs of the indexed content, kept with
+    # TEXT_INDEX_STORAGE = "blocks" so re-indexing can find the postings to replace
+    indexed_terms = models.BinaryField(null=True, blank=True)
+
+    # Submission whose progress still has to count this paragraph; cleared
+    # when the paragraph is first indexed, so it is counted exactly once
+    job = models.ForeignKey(
+        'IngestJob',
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='+',
+        # Rows are copied between shards in any order (rebalance_shard)
+        db_constraint=False
+    )
+
     # Timestamp used for ordering and audit purposes
     created_at = models.DateTimeField(auto_now_add=True)
     
@@ -33,12 +62,23 @@ class Paragraph(models.Model):
         return f"Paragraph {self.id} by {self.user.username}"
 
 
+class Term(models.Model):
+    # Normalized word token interned once and referenced by integer id
+    text = models.CharField(max_length=100, unique=True)
+
+    def __str__(self):
+        # Readable string for logging and debugging
+        return self.text
+
+
 class WordFrequency(models.Model):
     # Associate word frequency entries with the owning user
     user = models.ForeignKey(
         settings.AUTH_USER_MODEL,
         on_delete=models.CASCADE,
-        related_name='word_frequencies'
+        related_name='word_frequencies',
+        # Users live on "default"; shards cannot reference them
+        db_constraint=False
     )
 
     # Link frequency data back to the source paragraph
@@ -48,8 +88,14 @@ class WordFrequency(models.Model):
         related_name='word_frequencies'
     )
 
-    # Normalized word token used for search and indexing
-    word = models.CharField(max_length=100, db_index=True)
+    # Interned word token used for search and indexing
+    term = models.ForeignKey(
+        Term,
+        on_delete=models.PROTECT,
+        related_name='word_frequencies',
+        # Lookups always go through the (user, term, -count) index
+        db_index=False
+    )
 
     # Number of occurrences of the word within the paragraph
     count = models.IntegerField(default=0)
@@ -66,13 +112,192 @@ class WordFrequency(models.Model):
 
         # Composite indexes to efficiently support user-scoped word searches
         indexes = [
-            models.Index(fields=['user', 'word', '-count']),
-            models.Index(fields=['word']),
+            models.Index(fields=['user', 'term', '-count', 'paragraph']),
         ]
 
-        # Ensure a word is stored only once per paragraph
-        unique_together = ['paragraph', 'word']
+        # Ensure a term is stored only once per paragraph
+        unique_together = ['paragraph', 'term']
     
     def __str__(self):
         # Readable string for logging and debugging
-        return f"{self.word}: {self.count} in paragraph {self.paragraph.id}"
\ No newline at end of file
+        return f"{self.term.text}: {self.count} in paragraph {self.paragraph.id}"
+
+
+class CorpusStats(models.Model):
+    # Per-user corpus totals maintained by the indexing tasks
+    user = models.OneToOneField(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='corpus_stats',
+        # Users live on "default"; shards cannot reference them
+        db_constraint=False
+    )
+
+    # Number of indexed paragraphs and the sum of their token counts
+    paragraph_count = models.BigIntegerField(default=0)
+    total_tokens = models.BigIntegerField(default=0)
+
+    class Meta:
+        verbose_name_plural = 'Corpus Stats'
+
+    @property
+    def average_length(self):
+        # Mean paragraph length in tokens (BM25 avgdl)
+        if not self.paragraph_count:
+            return 0.0
+        return self.total_tokens / self.paragraph_count
+
+    def __str__(self):
+        # Readable string for logging and debugging
+        return f"{self.paragraph_count} paragraphs, {self.total_tokens} tokens for user {self.user_id}"
+
+
+class DocumentFrequency(models.Model):
+    # Number of a user's indexed paragraphs that contain a term
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='document_frequencies',
+        # Users live on "default"; shards cannot reference them
+        db_constraint=False
+    )
+
+    term = models.ForeignKey(
+        Term,
+        on_delete=models.PROTECT,
+        related_name='document_frequencies',
+        # Lookups always go through the (user, term) unique index
+        db_index=False
+    )
+
+    paragraph_count = models.IntegerField(default=0)
+
+    class Meta:
+        # One counter per (user, term), also serving as the lookup index
+        unique_together = ['user', 'term']
+
+    def __str__(self):
+        # Readable string for logging and debugging
+        return f"Term {self.term_id} in {self.paragraph_count} paragraphs of user {self.user_id}"
+
+
+class PostingBlock(models.Model):
+    # Owner of the postings stored in this block
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='posting_blocks',
+        # Users live on "default"; shards cannot reference them
+        db_constraint=False
+    )
+
+    # Term whose postings are stored in this block
+    term = models.ForeignKey(
+        Term,
+        on_delete=models.PROTECT,
+        related_name='posting_blocks',
+        db_index=False
+    )
+
+    # Key range covered by the block: postings are sorted by (-count, paragraph_id)
+    # and the blocks of a (user, term) pair split that order into disjoint ranges
+    # from (max_count, first_id) to (min_count, last_id)
+    max_count = models.IntegerField()
+    min_count = models.IntegerField()
+    first_id = models.BigIntegerField(default=0)
+    last_id = models.BigIntegerField(default=0)
+
+    # Number of postings encoded in `data`
+    size = models.IntegerField(default=0)
+
+    # Delta and varint encoded (paragraph_id, count) pairs
+    data = models.BinaryField()
+
+    class Meta:
+        # Blocks of a (user, term) pair are read from the highest counts down
+        indexes = [
+            models.Index(fields=['user', 'term', '-max_count', 'first_id']),
+        ]
+
+    def __str__(self):
+        # Readable string for logging and debugging
+        return f"Block {self.id}: {self.size} postings for term {self.term_id}"
+
+
+class ShardAssignment(models.Model):
+    # Explicit shard of a user, overriding placement by user id
+    # (written by the rebalance_shard command; stored on "default")
+    user = models.OneToOneField(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='shard_assignment'
+    )
+
+    # Database alias from TEXT_SHARDS
+    alias = models.CharField(max_length=100)
+
+    def __str__(self):
+        # Readable string for logging and debugging
+        return f"User {self.user_id} on {self.alias}"
+
+
+class IngestJob(models.Model):
+    # One submission and the indexing progress of its paragraphs,
+    # maintained by the indexing tasks with atomic increments
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='ingest_jobs',
+        # Users live on "default"; shards cannot reference them
+        db_constraint=False
+    )
+
+    # Paragraphs created by the submission (streamed uploads grow it chunk by chunk)
+    paragraph_count = models.PositiveIntegerField(default=0)
+
+    # Paragraphs indexed, given up on after their last retry, and waiting for a retry
+    completed = models.PositiveIntegerField(default=0)
+    failed = models.PositiveIntegerField(default=0)
+    retrying = models.PositiveIntegerField(default=0)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    @property
+    def pending(self):
+        # Paragraphs not yet completed or failed
+        return max(0, self.paragraph_count - self.completed - self.failed)
+
+    def __str__(self):
+        # Readable string for logging and debugging
+        return f"Job {self.id}: {self.completed}/{self.paragraph_count} paragraphs of user {self.user_id}"
+
+
+class WordSketch(models.Model):
+    # Approximate word counts of a user's corpus (see text_app.sketches),
+    # merged by the indexing tasks after every committed batch
+    user = models.OneToOneField(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='word_sketch',
+        # Users live on "default"; shards cannot reference them
+        db_constraint=False
+    )
+
+    # Count-Min Sketch dimensions and the sum of all counts added to it
+    width = models.PositiveIntegerField()
+    depth = models.PositiveIntegerField()
+    total = models.BigIntegerField(default=0)
+
+    # zlib-compressed little-endian int64 counters, depth rows of width cells
+    counts = models.BinaryField()
+
+    # Heavy-hitter candidates: {word: estimated count}
+    heavy_hitters = models.JSONField(default=dict)
+
+    def __str__(self):
+        # Readable string for logging and debugging
+        return f"Sketch of {self.total} words for user {self.user_id}"
@@ -0,0 +1,250 @@
+import heapq
+import re
+# Top-k selection and query tokenization
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db.models import Q
+
+from .models import Paragraph, WordFrequency
+from .postings import decode_terms, top_postings
+from .search import make_hit
+from .terms import lookup_term_id
+
+
+# Multi-word OR/AND queries ranked by the sum of the words' counts.
+#
+# Posting lists are read in (-count, paragraph_id) order, the order of the
+# (user, term, -count, paragraph) index, a page at a time (threshold
+# algorithm). Every newly seen paragraph is scored exactly with one random
+# access query on the stored postings (never the paragraph bodies). Unseen paragraphs cannot score more than the sum of the
+# last counts read from each list, so evaluation stops as soon as the k-th
+# best score reaches that threshold; common words are only read as far as
+# their prefix matters.
+
+MAX_QUERY_TERMS = 10
+
+# Rounds read `limit` postings from each list and double that up to this cap
+MAX_READ_SIZE = 1000
+
+QUERY_TOKEN_RE = re.compile(r'[a-zA-Z]+')
+
+
+class QuerySyntaxError(ValueError):
+    # Raised for queries the parser cannot turn into a flat OR/AND of words
+    pass
+
+
+def parse_query(query):
+    """
+    Parse "cat dog", "cat OR dog" or "cat AND dog" into (operator, words).
+
+    Words are combined with OR unless joined by AND; operators must be
+    upper case and cannot be mixed within one query.
+    """
+
+    words, operators = [], set()
+    expect_word = True
+    for token in query.split():
+        if token in ("AND", "OR"):
+            if expect_word:
+                raise QuerySyntaxError(f"Unexpected operator {token}")
+            operators.add(token)
+            expect_word = True
+            continue
+
+        parts = QUERY_TOKEN_RE.findall(token.lower())
+        if not parts:
+            raise QuerySyntaxError(f"Invalid word {token!r}")
+        words.extend(parts)
+        expect_word = False
+
+    if not words or expect_word and operators:
+        raise QuerySyntaxError("Query must start and end with a word")
+    if len(operators) > 1:
+        raise QuerySyntaxError("Mixing AND and OR is not supported")
+
+    words = list(dict.fromkeys(words))
+    if len(words) > MAX_QUERY_TERMS:
+        raise QuerySyntaxError(f"At most {MAX_QUERY_TERMS} words per query")
+
+    return (operators.pop() if operators else "OR"), words
+
+
+class _PostingCursor:
+    # Sorted access over one term's postings, a page at a time
+
+    def __init__(self, user_id, term_id):
+        self.user_id = user_id
+        self.term_id = term_id
+        self.after = None
+        self.exhausted = False
+
+    @property
+    def bound(self):
+        # Highest count an unread posting of this list can have
+        if self.exhausted:
+            return 0
+        return self.after[0] if self.after is not None else float("inf")
+
+    def read(self, size):
+        if settings.TEXT_INDEX_STORAGE == "blocks":
+            page = top_postings(self.user_id, self.term_id, size, self.after)
+        else:
+            qs = WordFrequency.objects.filter(user_id=self.user_id, term_id=self.term_id)
+            if self.after is not None:
+                count, paragraph_id = self.after
+                qs = qs.filter(Q(count__lt=count) | Q(count=count, paragraph_id__gt=paragraph_id))
+            page = list(
+                qs.order_by('-count', 'paragraph_id').values_list('paragraph_id', 'count')[:size]
+            )
+
+        if len(page) < size:
+            self.exhausted = True
+        if page:
+            self.after = (page[-1][1], page[-1][0])
+        return page
+
+
+def _random_access(user_id, paragraph_ids, terms):
+    # Exact {paragraph_id: {word: count}} for the query words
+    words = {term_id: word for word, term_id in terms.items()}
+    counts = {paragraph_id: {} for paragraph_id in paragraph_ids}
+
+    if settings.TEXT_INDEX_STORAGE == "blocks":
+        # Blocks have no per-paragraph lookup; every paragraph stores the
+        # {term_id: count} map its postings were written from
+        for paragraph_id, indexed_terms in (
+            Paragraph.objects
+            .filter(user_id=user_id, id__in=paragraph_ids)
+            .values_list('id', 'indexed_terms')
+        ):
+            term_counts = decode_terms(indexed_terms)
+            counts[paragraph_id] = {
+                word: term_counts[term_id] for term_id, word in words.items() if term_id in term_counts
+            }
+        return counts
+
+    # Served by the unique (paragraph, term) index
+    for paragraph_id, term_id, count in (
+        WordFrequency.objects
+        .filter(user_id=user_id, paragraph_id__in=paragraph_ids, term_id__in=list(words))
+        .values_list('paragraph_id', 'term_id', 'count')
+    ):
+        counts[paragraph_id][words[term_id]] = count
+    return counts
+
+
+def top_k(user_id, terms, operator, limit):
+    """
+    Best `limit` paragraphs for {word: term_id} as [(paragraph_id, {word: count})].
+
+    Ordered by (-sum of counts, paragraph_id). With AND only paragraphs
+    containing every word qualify.
+    """
+
+    cursors = [_PostingCursor(user_id, term_id) for term_id in terms.values()]
+    required = len(terms) if operator == "AND" else 1
+
+    top = []
+    # Min-heap of (score, -paragraph_id, counts) holding the best `limit` paragraphs
+    scored = set()
+    size = limit
+
+    while True:
+        new_ids = []
+        for cursor in cursors:
+            if cursor.exhausted:
+                continue
+            for paragraph_id, _ in cursor.read(size):
+                if paragraph_id not in scored:
+                    scored.add(paragraph_id)
+                    new_ids.append(paragraph_id)
+
+        if new_ids:
+            for paragraph_id, counts in _random_access(user_id, new_ids, terms).items():
+                if len(counts) < required:
+                    continue
+                entry = (sum(counts.values()), -paragraph_id, counts)
+                if len(top) < limit:
+                    heapq.heappush(top, entry)
+                elif entry[:2] > top[0][:2]:
+                    heapq.heapreplace(top, entry)
+
+        if _finished(cursors, top, limit, operator):
+            break
+        size = min(size * 2, MAX_READ_SIZE)
+
+    ranked = sorted(top, key=lambda entry: entry[:2], reverse=True)
+    return [(-negated_id, counts) for _, negated_id, counts in ranked]
+
+
+def _finished(cursors, top, limit, operator):
+    # True once no unread posting can enter the top `limit`
+    live = [cursor for cursor in cursors if not cursor.exhausted]
+    if not live:
+        return True
+    if operator == "AND" and len(live) < len(cursors):
+        # A paragraph unseen so far would have to appear in an exhausted list
+        return True
+    if len(top) < limit:
+        return False
+
+    threshold = sum(cursor.bound for cursor in live)
+    kth_score, kth_negated_id, _ = top[0]
+    if kth_score > threshold:
+        return True
+    # An unseen paragraph reaching the threshold sits at the current count in
+    # every live list, so its id is above every cursor; ties are broken by id
+    return kth_score == threshold and -kth_negated_id < max(cursor.after[1] for cursor in live)
+
+
+def multi_search_page(user_id, words, operator, limit):
+    # Hits for a parsed query; `count` is the summed count of the words
+    terms = {}
+    for word in words:
+        term_id = lookup_term_id(word)
+        if term_id is not None:
+            terms[word] = term_id
+        elif operator == "AND":
+            # A word that was never indexed matches nothing
+            return []
+    return terms_search_page(user_id, terms, operator, limit)
+
+
+def terms_search_page(user_id, terms, operator, limit):
+    # Hits for already resolved {word: term_id} terms
+    if not terms:
+        return []
+
+    ranked = top_k(user_id, terms, operator, limit)
+    paragraphs = (
+        Paragraph.objects
+        .only('id', 'preview', 'created_at')
+        .in_bulk([paragraph_id for paragraph_id, _ in ranked])
+    )
+
+    hits = []
+    for paragraph_id, counts in ranked:
+        paragraph = paragraphs.get(paragraph_id)
+        if paragraph is None:
+            continue
+        hit = make_hit(
+            paragraph_id,
+            paragraph.preview,
+            sum(counts.values()),
+            paragraph.created_at.isoformat()
+        )
+        hit["counts"] = counts
+        hits.append(hit)
+    return hits
+
+
+async def amulti_search_page(user_id, words, operator, limit):
+    # Async variant of multi_search_page() for ASGI views
+    return await sync_to_async(multi_search_page)(user_id, words, operator, limit)
+
+
+async def aterms_search_page(user_id, terms, operator, limit):
+    # Async variant of terms_search_page() for ASGI views
+    return await sync_to_async(terms_search_page)(user_id, terms, operator, limit)
@@ -0,0 +1,282 @@
+from bisect import bisect_left
+
+from django.conf import settings
+from django.db import connections, router
+from django.db.models import Q
+
+from .models import Paragraph, PostingBlock
+
+
+# ---------------------------------------------------------------------------
+# Encoding
+#
+# A block holds (paragraph_id, count) pairs sorted by count descending.
+# The first posting stores its count and paragraph id; each following
+# posting stores the drop in count (never negative) and the zigzag
+# encoded difference in paragraph id, all as LEB128 varints.
+# ---------------------------------------------------------------------------
+
+def _write_varint(out, value):
+    while value >= 0x80:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def _read_varint(data, pos):
+    result = 0
+    shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        result |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return result, pos
+        shift += 7
+
+
+def _zigzag(value):
+    return (value << 1) if value >= 0 else ((-value << 1) - 1)
+
+
+def _unzigzag(value):
+    return (value >> 1) if not value & 1 else -((value + 1) >> 1)
+
+
+def encode_postings(postings):
+    # Encode count-sorted (paragraph_id, count) pairs into bytes
+    out = bytearray()
+    prev_id, prev_count = 0, None
+    for paragraph_id, count in postings:
+        _write_varint(out, count if prev_count is None else prev_count - count)
+        _write_varint(out, _zigzag(paragraph_id - prev_id))
+        prev_id, prev_count = paragraph_id, count
+    return bytes(out)
+
+
+def decode_postings(data):
+    # Decode bytes produced by encode_postings
+    data = bytes(data)
+    postings = []
+    pos = 0
+    prev_id, prev_count = 0, None
+    while pos < len(data):
+        delta, pos = _read_varint(data, pos)
+        count = delta if prev_count is None else prev_count - delta
+        delta, pos = _read_varint(data, pos)
+        paragraph_id = prev_id + _unzigzag(delta)
+        postings.append((paragraph_id, count))
+        prev_id, prev_count = paragraph_id, count
+    return postings
+
+
+def encode_terms(term_counts):
+    # Encode a paragraph's {term_id: count} as varint (term id delta, count) pairs
+    out = bytearray()
+    prev_id = 0
+    for term_id in sorted(term_counts):
+        _write_varint(out, term_id - prev_id)
+        _write_varint(out, term_counts[term_id])
+        prev_id = term_id
+    return bytes(out)
+
+
+def decode_terms(data):
+    # Decode bytes produced by encode_terms ({} for None)
+    term_counts = {}
+    if not data:
+        return term_counts
+    data = bytes(data)
+    pos = 0
+    term_id = 0
+    while pos < len(data):
+        delta, pos = _read_varint(data, pos)
+        count, pos = _read_varint(data, pos)
+        term_id += delta
+        term_counts[term_id] = count
+    return term_counts
+
+
+# ---------------------------------------------------------------------------
+# Storage
+#
+# The postings of a (user, term) pair are kept in (-count, paragraph_id)
+# order and each block holds one contiguous range of that order, so
+# reading the blocks by (-max_count, first_id) yields the sorted list and
+# a posting belongs to the first block whose last posting is not before it.
+# ---------------------------------------------------------------------------
+
+def _key(paragraph_id, count):
+    # Sort key of a posting
+    return (-count, paragraph_id)
+
+
+def _fill(block, postings):
+    block.data = encode_postings(postings)
+    block.size = len(postings)
+    block.max_count, block.first_id = postings[0][1], postings[0][0]
+    block.min_count, block.last_id = postings[-1][1], postings[-1][0]
+
+
+def _split(user_id, term_id, postings, block_size):
+    # Cut sorted postings into new blocks of at most block_size entries
+    blocks = []
+    for start in range(0, len(postings), block_size):
+        block = PostingBlock(user_id=user_id, term_id=term_id)
+        _fill(block, postings[start:start + block_size])
+        blocks.append(block)
+    return blocks
+
+
+def _lock_terms(keys):
+    # Serialize writers of the same (user, term) posting lists, including
+    # pairs without any block yet, in one global order so batches cannot
+    # deadlock. Row locks alone cannot cover a block about to be created;
+    # SQLite serializes writers anyway.
+    connection = connections[router.db_for_write(PostingBlock)]
+    if connection.vendor != "postgresql" or not keys:
+        return
+    lock_ids = sorted({(user_id * 1000003 + term_id) % (1 << 63) for user_id, term_id in keys})
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT pg_advisory_xact_lock(lock_id)"
+            " FROM (SELECT unnest(%s::bigint[]) AS lock_id ORDER BY 1) AS ordered",
+            [lock_ids]
+        )
+
+
+def append_postings(indexed, term_ids):
+    # Store the postings of counted paragraphs, replacing those written for
+    # them before (redelivered or retried tasks, edits). Only the (user, term)
+    # pairs whose count changed are touched.
+    # `indexed` is a list of (paragraph, Counter) pairs
+    changes = {}
+    for paragraph, freq in indexed:
+        previous = decode_terms(paragraph.indexed_terms)
+        current = {term_ids[word]: count for word, count in freq.items()}
+        for term_id in previous.keys() | current.keys():
+            old, new = previous.get(term_id), current.get(term_id)
+            if old == new:
+                continue
+            removed, added = changes.setdefault((paragraph.user_id, term_id), (set(), []))
+            if old is not None:
+                removed.add(_key(paragraph.id, old))
+            if new is not None:
+                added.append((paragraph.id, new))
+        paragraph.indexed_terms = encode_terms(current)
+
+    _apply_changes(changes)
+    Paragraph.objects.bulk_update([paragraph for paragraph, _ in indexed], ['indexed_terms'])
+
+
+def _apply_changes(changes):
+    # Apply {(user_id, term_id): (removed keys, added postings)} to the blocks
+    if not changes:
+        return
+    block_size = settings.TEXT_POSTING_BLOCK_SIZE
+    keys = sorted(changes)
+    _lock_terms(keys)
+
+    # One query locks and lists the blocks of every pair in the batch
+    by_user = {}
+    for user_id, term_id in keys:
+        by_user.setdefault(user_id, []).append(term_id)
+    condition = Q()
+    for user_id, user_terms in by_user.items():
+        condition |= Q(user_id=user_id, term_id__in=user_terms)
+    ranges = {}
+    rows = (
+        PostingBlock.objects
+        .select_for_update()
+        .filter(condition)
+        .order_by('user_id', 'term_id', '-max_count', 'first_id')
+        .values_list('id', 'user_id', 'term_id', 'min_count', 'last_id')
+    )
+    for block_id, user_id, term_id, min_count, last_id in rows:
+        ranges.setdefault((user_id, term_id), []).append((_key(last_id, min_count), block_id))
+
+    # Route each change to its block; pairs without blocks get new ones
+    routed = {}
+    new_pairs = {}
+    for key in keys:
+        removed, added = changes[key]
+        blocks = ranges.get(key)
+        if not blocks:
+            if added:
+                new_pairs[key] = added
+            continue
+        lasts = [last for last, _ in blocks]
+
+        def target(posting_key):
+            return blocks[min(bisect_left(lasts, posting_key), len(blocks) - 1)][1]
+
+        for posting_key in removed:
+            routed.setdefault(target(posting_key), (key, set(), []))[1].add(posting_key)
+        for paragraph_id, count in added:
+            routed.setdefault(target(_key(paragraph_id, count)), (key, set(), []))[2].append(
+                (paragraph_id, count)
+            )
+
+    data = dict(PostingBlock.objects.filter(id__in=list(routed)).values_list('id', 'data'))
+    to_update, to_create, to_delete = [], [], []
+    for block_id, ((user_id, term_id), removed, added) in routed.items():
+        postings = [
+            posting for posting in decode_postings(data[block_id])
+            if _key(*posting) not in removed
+        ]
+        postings.extend(added)
+        if not postings:
+            to_delete.append(block_id)
+            continue
+        postings.sort(key=lambda posting: _key(*posting))
+
+        # The existing row keeps the first range, overflow goes to new blocks
+        block = PostingBlock(id=block_id, user_id=user_id, term_id=term_id)
+        _fill(block, postings[:block_size])
+        to_update.append(block)
+        to_create.extend(_split(user_id, term_id, postings[block_size:], block_size))
+
+    for (user_id, term_id), added in new_pairs.items():
+        added.sort(key=lambda posting: _key(*posting))
+        to_create.extend(_split(user_id, term_id, added, block_size))
+
+    if to_update:
+        PostingBlock.objects.bulk_update(
+            to_update, ['data', 'size', 'max_count', 'min_count', 'first_id', 'last_id']
+        )
+    if to_create:
+        PostingBlock.objects.bulk_create(to_create)
+    if to_delete:
+        PostingBlock.objects.filter(id__in=to_delete).delete()
+
+
+def top_postings(user_id, term_id, limit=10, after=None):
+    # Highest-count (paragraph_id, count) pairs ordered by (-count, paragraph_id),
+    # reading blocks in order until `limit` postings are found. `after` is an
+    # optional (count, paragraph_id) keyset cursor; only postings strictly
+    # after it are returned.
+    blocks = (
+        PostingBlock.objects
+        .filter(user_id=user_id, term_id=term_id)
+        .order_by('-max_count', 'first_id')
+        .values_list('data', flat=True)
+    )
+    if after is not None:
+        # Blocks ending before the cursor cannot contribute
+        count, paragraph_id = after
+        blocks = blocks.filter(Q(min_count__lt=count) | Q(min_count=count, last_id__gt=paragraph_id))
+        after = _key(paragraph_id, count)
+
+    postings = []
+    offset = 0
+    while len(postings) < limit:
+        page = list(blocks[offset:offset + 2])
+        if not page:
+            break
+        offset += len(page)
+        for data in page:
+            postings.extend(
+                posting for posting in decode_postings(data)
+                if after is None or _key(*posting) > after
+            )
+    return postings[:limit]
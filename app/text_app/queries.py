@@ -0,0 +1,139 @@
+import base64
+# Cursors are opaque, URL-safe tokens
+
+from itertools import groupby
+from operator import itemgetter
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db.models import Q
+
+from .models import Paragraph, PostingBlock, WordFrequency
+from .postings import decode_postings, top_postings
+from .search import make_hit
+
+
+DEFAULT_PAGE_SIZE = 10
+MAX_PAGE_SIZE = 100
+
+
+class InvalidCursor(ValueError):
+    # Raised when a client sends a cursor that was not produced by encode_cursor
+    pass
+
+
+def encode_cursor(count, paragraph_id):
+    # Keyset position of the last hit on a page
+    return base64.urlsafe_b64encode(f"{count}:{paragraph_id}".encode()).decode()
+
+
+def decode_cursor(cursor):
+    # Return the (count, paragraph_id) position encoded in a cursor
+    try:
+        count, paragraph_id = base64.urlsafe_b64decode(cursor.encode()).decode().split(":")
+        return int(count), int(paragraph_id)
+    except ValueError:
+        raise InvalidCursor(cursor)
+
+
+def next_cursor(hits, limit):
+    # Cursor for the following page, or None when this page is the last one
+    if len(hits) < limit:
+        return None
+    return encode_cursor(hits[-1]["count"], hits[-1]["paragraph_id"])
+
+
+def _rows_queryset(user_id, term_id, limit, after):
+    # Keyset page over the (user, term, -count, paragraph) index
+    # Only the precomputed preview is loaded, never the paragraph body
+    qs = WordFrequency.objects.filter(user_id=user_id, term_id=term_id)
+    if after is not None:
+        count, paragraph_id = after
+        qs = qs.filter(Q(count__lt=count) | Q(count=count, paragraph_id__gt=paragraph_id))
+    return (
+        qs
+        .select_related('paragraph')
+        .only('count', 'paragraph', 'paragraph__preview', 'paragraph__created_at')
+        .order_by('-count', 'paragraph_id')[:limit]
+    )
+
+
+def _row_hit(row):
+    return make_hit(
+        row.paragraph_id,                        # Reference to original paragraph
+        row.paragraph.preview,                   # Precomputed preview (first 100 characters)
+        row.count,                               # Frequency of searched word
+        row.paragraph.created_at.isoformat()     # ISO format ensures consistent datetime representation
+    )
+
+
+def _block_hits(top, paragraphs):
+    return [
+        make_hit(
+            paragraph_id,
+            paragraphs[paragraph_id].preview,
+            count,
+            paragraphs[paragraph_id].created_at.isoformat()
+        )
+        for paragraph_id, count in top
+        if paragraph_id in paragraphs
+    ]
+
+
+def search_page(user_id, term_id, limit=DEFAULT_PAGE_SIZE, after=None):
+    # One page of hits for a term, ordered by (-count, paragraph_id)
+    if settings.TEXT_INDEX_STORAGE == "blocks":
+        top = top_postings(user_id, term_id, limit, after)
+        paragraphs = (
+            Paragraph.objects
+            .only('id', 'preview', 'created_at')
+            .in_bulk([paragraph_id for paragraph_id, _ in top])
+        )
+        return _block_hits(top, paragraphs)
+
+    return [_row_hit(row) for row in _rows_queryset(user_id, term_id, limit, after)]
+
+
+async def asearch_page(user_id, term_id, limit=DEFAULT_PAGE_SIZE, after=None):
+    # Async variant of search_page() for ASGI views
+    if settings.TEXT_INDEX_STORAGE == "blocks":
+        top = await sync_to_async(top_postings)(user_id, term_id, limit, after)
+        paragraphs = await (
+            Paragraph.objects
+            .only('id', 'preview', 'created_at')
+            .ain_bulk([paragraph_id for paragraph_id, _ in top])
+        )
+        return _block_hits(top, paragraphs)
+
+    return [_row_hit(row) async for row in _rows_queryset(user_id, term_id, limit, after)]
+
+
+def iter_user_postings(user_id, chunk_size=10000):
+    # (word, [(paragraph_id, count), ...]) for every indexed term of a user,
+    # postings ordered by (-count, paragraph_id), from the configured storage.
+    # Used by the search engines to load or rebuild a user's index.
+    if settings.TEXT_INDEX_STORAGE == "blocks":
+        rows = (
+            PostingBlock.objects
+            .filter(user_id=user_id)
+            .order_by('term_id', '-max_count', 'first_id')
+            .values_list('term_id', 'term__text', 'data')
+            .iterator(chunk_size=chunk_size)
+        )
+        for _, term_rows in groupby(rows, key=itemgetter(0)):
+            term_rows = list(term_rows)
+            yield term_rows[0][1], [
+                posting for _, _, data in term_rows for posting in decode_postings(data)
+            ]
+        return
+
+    rows = (
+        WordFrequency.objects
+        .filter(user_id=user_id)
+        .order_by('term_id', '-count', 'paragraph_id')
+        .values_list('term_id', 'term__text', 'paragraph_id', 'count')
+        .iterator(chunk_size=chunk_size)
+    )
+    for _, term_rows in groupby(rows, key=itemgetter(0)):
+        term_rows = list(term_rows)
+        yield term_rows[0][1], [(paragraph_id, count) for _, _, paragraph_id, count in term_rows]
@@ -0,0 +1,206 @@
+import heapq
+import math
+# Top-k selection and the BM25 idf term
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db.models import Q
+
+from .models import CorpusStats, DocumentFrequency, Paragraph, PostingBlock, WordFrequency
+from .postings import decode_postings
+from .search import make_hit
+
+
+# BM25 ranking for single-word searches.
+# Document lengths and frequencies are read from the statistics kept by
+# the indexing tasks (see corpus.py), so a query costs two primary-key
+# lookups plus the head of the same (user, term) index range the count
+# ranking reads.
+
+
+def idf(paragraph_count, document_frequency):
+    # Probabilistic idf with the +1 smoothing that keeps it positive
+    return math.log(
+        1 + (paragraph_count - document_frequency + 0.5) / (document_frequency + 0.5)
+    )
+
+
+def _parameters():
+    return settings.TEXT_BM25_K1, settings.TEXT_BM25_B
+
+
+def _statistics(user_id, term_id):
+    # (paragraph count, average length, document frequency), or None when
+    # the user has no indexed paragraphs containing the term
+    stats = CorpusStats.objects.filter(user_id=user_id).first()
+    document_frequency = (
+        DocumentFrequency.objects
+        .filter(user_id=user_id, term_id=term_id)
+        .values_list('paragraph_count', flat=True)
+        .first()
+    )
+    if stats is None or not stats.paragraph_count or not document_frequency:
+        return None
+    return stats.paragraph_count, stats.average_length, document_frequency
+
+
+def _score_hit(paragraph_id, preview, count, created_at, score):
+    hit = make_hit(paragraph_id, preview, count, created_at.isoformat())
+    hit["score"] = round(score, 6)
+    return hit
+
+
+def bm25_page(user_id, term_id, limit):
+    # Top `limit` hits for a term ordered by (-BM25 score, paragraph_id)
+    statistics = _statistics(user_id, term_id)
+    if statistics is None:
+        return []
+    paragraph_count, average_length, document_frequency = statistics
+    weight = idf(paragraph_count, document_frequency)
+
+    if settings.TEXT_INDEX_STORAGE == "blocks":
+        return _bm25_blocks(user_id, term_id, limit, average_length, weight)
+    return _bm25_rows(user_id, term_id, limit, average_length, weight)
+
+
+async def abm25_page(user_id, term_id, limit):
+    # Async variant of bm25_page() for ASGI views
+    return await sync_to_async(bm25_page)(user_id, term_id, limit)
+
+
+# Postings read per query while walking a term in count order
+CANDIDATE_PAGE_SIZE = 200
+
+
+def _scorer(average_length):
+    # (saturation(count, length), bound(count)) for this corpus.
+    # A paragraph containing the word `count` times has at least `count`
+    # tokens, and paragraphs indexed before token_count existed are scored
+    # as average length, so no posting with that count scores above
+    # bound(count). The bound grows with the count, so once it falls below
+    # the k-th best score no posting further down the term can get in.
+    k1, b = _parameters()
+
+    def saturation(count, length):
+        return count * (k1 + 1) / (count + k1 * (1 - b + b * length / average_length))
+
+    def bound(count):
+        return saturation(count, min(count, average_length))
+
+    return saturation, bound
+
+
+def _push(top, limit, entry):
+    # Keep `entry` if it is among the best `limit` seen so far
+    if len(top) < limit:
+        heapq.heappush(top, entry)
+    elif entry > top[0]:
+        heapq.heapreplace(top, entry)
+
+
+def _bm25_rows(user_id, term_id, limit, average_length, weight):
+    # Read the term's rows in (-count, paragraph_id) order, the index the
+    # count ranking uses, and stop once no unread row can beat the current
+    # k-th score. Only the rows that can still rank are read, rather than
+    # scoring every posting of the term.
+    saturation, bound = _scorer(average_length)
+    rows = (
+        WordFrequency.objects
+        .filter(user_id=user_id, term_id=term_id)
+        .order_by('-count', 'paragraph_id')
+        .values_list('paragraph_id', 'count', 'paragraph__token_count')
+    )
+
+    top = []
+    # Min-heap of (score, -paragraph_id, count) holding the best `limit` postings
+    after = None
+    while True:
+        page = rows
+        if after is not None:
+            count, paragraph_id = after
+            page = page.filter(Q(count__lt=count) | Q(count=count, paragraph_id__gt=paragraph_id))
+        page = list(page[:CANDIDATE_PAGE_SIZE])
+
+        for paragraph_id, count, length in page:
+            if len(top) >= limit and bound(count) < top[0][0]:
+                return _ranked_hits(top, weight)
+            score = saturation(count, average_length if length is None else length)
+            _push(top, limit, (score, -paragraph_id, count))
+
+        if len(page) < CANDIDATE_PAGE_SIZE:
+            return _ranked_hits(top, weight)
+        after = page[-1][1], page[-1][0]
+
+
+def _bm25_blocks(user_id, term_id, limit, average_length, weight):
+    # Walk blocks from the highest counts down, stopping once no unread
+    # posting can beat the current k-th score (see _scorer()); a block's
+    # postings are bounded by its max_count.
+    saturation, bound = _scorer(average_length)
+
+    blocks = (
+        PostingBlock.objects
+        .filter(user_id=user_id, term_id=term_id)
+        .order_by('-max_count', 'first_id')
+        .values_list('max_count', 'data')
+    )
+
+    top = []
+    # Min-heap of (score, -paragraph_id, count) holding the best `limit` postings
+    offset = 0
+    exhausted = False
+    while not exhausted:
+        page = list(blocks[offset:offset + 4])
+        if not page:
+            break
+        offset += len(page)
+
+        for max_count, data in page:
+            if len(top) >= limit and bound(max_count) < top[0][0]:
+                exhausted = True
+                break
+            _score_block(data, top, limit, saturation, average_length)
+
+    return _ranked_hits(top, weight)
+
+
+def _ranked_hits(top, weight):
+    # Hits for the heap entries, best first
+    ranked = sorted(top, reverse=True)
+    paragraphs = (
+        Paragraph.objects
+        .only('id', 'preview', 'created_at')
+        .in_bulk([-negated_id for _, negated_id, _ in ranked])
+    )
+    return [
+        _score_hit(
+            -negated_id,
+            paragraphs[-negated_id].preview,
+            count,
+            paragraphs[-negated_id].created_at,
+            weight * score
+        )
+        for score, negated_id, count in ranked
+        if -negated_id in paragraphs
+    ]
+
+
+def _score_block(data, top, limit, saturation, average_length):
+    # Score the postings of one block into the `top` heap
+    postings = decode_postings(data)
+    lengths = dict(
+        Paragraph.objects
+        .filter(id__in=[paragraph_id for paragraph_id, _ in postings])
+        .values_list('id', 'token_count')
+    )
+
+    for paragraph_id, count in postings:
+        if paragraph_id not in lengths:
+            # Paragraph deleted after its postings were written
+            continue
+        length = lengths[paragraph_id]
+        _push(top, limit, (
+            saturation(count, average_length if length is None else length),
+            -paragraph_id,
+            count
+        ))
@@ -0,0 +1,14 @@
+from django.core.exceptions import ImproperlyConfigured
+
+
+def connect(url):
+    # Build a Redis client; "memory://" selects an in-process stand-in
+    if url.startswith("memory://"):
+        try:
+            import fakeredis
+        except ImportError:
+            raise ImproperlyConfigured("memory:// Redis URLs require the fakeredis package")
+        return fakeredis.FakeRedis()
+
+    import redis
+    return redis.Redis.from_url(url)
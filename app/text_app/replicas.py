@@ -0,0 +1,112 @@
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+# Replica reads are enabled per request and follow its context
+
+from django.conf import settings
+from django.core.cache import cache
+# "Recently wrote" markers shared by web and worker processes
+
+from .routers import is_sharded
+from .sharding import current_shard
+
+
+# Search reads may be served by read replicas (TEXT_READ_REPLICAS maps a
+# primary alias to its replicas). Everything else, including every task,
+# reads and writes the primary. Users who wrote within the last
+# TEXT_READ_YOUR_WRITES_SECONDS are pinned to the primary so that freshly
+# indexed paragraphs never disappear behind replication lag.
+
+RECENT_WRITE_KEY = "text:recent-write:{user_id}"
+
+_replica_reads = ContextVar("text_replica_reads", default=False)
+
+
+def replica_aliases(primary):
+    return list(getattr(settings, "TEXT_READ_REPLICAS", {}).get(primary, ()))
+
+
+def is_replica(alias):
+    return any(alias in replicas for replicas in getattr(settings, "TEXT_READ_REPLICAS", {}).values())
+
+
+def _window():
+    return getattr(settings, "TEXT_READ_YOUR_WRITES_SECONDS", 10)
+
+
+def mark_written(user_ids):
+    # Pin these users' reads to the primary for the read-your-writes window
+    keys = {RECENT_WRITE_KEY.format(user_id=user_id): 1 for user_id in set(user_ids)}
+    if keys and getattr(settings, "TEXT_READ_REPLICAS", None):
+        cache.set_many(keys, timeout=_window())
+
+
+async def amark_written(user_ids):
+    # Async variant of mark_written() for ASGI views
+    keys = {RECENT_WRITE_KEY.format(user_id=user_id): 1 for user_id in set(user_ids)}
+    if keys and getattr(settings, "TEXT_READ_REPLICAS", None):
+        await cache.aset_many(keys, timeout=_window())
+
+
+def recently_wrote(user_id):
+    return cache.get(RECENT_WRITE_KEY.format(user_id=user_id)) is not None
+
+
+@contextmanager
+def replica_reads(enabled=True):
+    # Allow reads in the block to go to replicas
+    token = _replica_reads.set(enabled)
+    try:
+        yield
+    finally:
+        _replica_reads.reset(token)
+
+
+def user_replica_reads(user_id):
+    # Replica reads for a user, unless they wrote within the window
+    if not getattr(settings, "TEXT_READ_REPLICAS", None):
+        return replica_reads(False)
+    return replica_reads(not recently_wrote(user_id))
+
+
+class ReplicaRouter:
+    """
+    Sends reads to a replica of the primary the other routers would pick,
+    but only inside replica_reads() blocks. Placed before UserShardRouter.
+    """
+
+    def db_for_read(self, model, **hints):
+        if not _replica_reads.get():
+            return None
+        instance = hints.get("instance")
+        if instance is not None and instance._state.db:
+            # Related objects follow the database their parent came from
+            return None
+
+        primary = current_shard() if is_sharded(model) else "default"
+        replicas = replica_aliases(primary)
+        return random.choice(replicas) if replicas else None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas receive their schema from the primary
+        if is_replica(db):
+            return False
+        return None
+
+
+class ReplicaReadMixin:
+    # APIView mixin serving read-only endpoints from replicas when the
+    # user has not written recently (list it after UserShardMixin)
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        if request.user and request.user.is_authenticated:
+            self._replica_reads = user_replica_reads(request.user.id)
+            self._replica_reads.__enter__()
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        reads = getattr(self, "_replica_reads", None)
+        if reads is not None:
+            reads.__exit__(None, None, None)
+            self._replica_reads = None
+        return super().finalize_response(request, response, *args, **kwargs)
@@ -0,0 +1,65 @@
+from django.conf import settings
+
+from .sharding import current_shard, shard_aliases
+
+
+# Models stored per user on the user's shard
+SHARDED_MODELS = {
+    "paragraph",
+    "wordfrequency",
+    "postingblock",
+    "corpusstats",
+    "documentfrequency",
+    "ingestjob",
+    "wordsketch",
+}
+
+# Allocated on "default" and copied to shards so joins stay local
+REPLICATED_MODELS = {"term"}
+
+
+def is_sharded(model):
+    # Accepts model classes and instances (including lazy request.user)
+    return model._meta.app_label == "text_app" and model._meta.model_name in SHARDED_MODELS
+
+
+def _is_user(obj):
+    return obj._meta.label == settings.AUTH_USER_MODEL
+
+
+class UserShardRouter:
+    """
+    Sends queries on per-user text models to the active user shard.
+
+    The shard is activated by views and tasks (see text_app.sharding);
+    related-object access follows the database the instance came from.
+    """
+
+    def db_for_read(self, model, **hints):
+        if not is_sharded(model):
+            return None
+        instance = hints.get("instance")
+        if instance is not None and instance._state.db and is_sharded(instance):
+            return instance._state.db
+        return current_shard()
+
+    db_for_write = db_for_read
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Sharded rows may point at users and terms stored on "default"
+        if is_sharded(obj1) or is_sharded(obj2):
+            if obj1._state.db == obj2._state.db:
+                return True
+            other = obj2 if is_sharded(obj1) else obj1
+            return _is_user(other) or other._meta.model_name in REPLICATED_MODELS
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db == "default":
+            return True
+        if db not in shard_aliases():
+            return None
+        # Shards only hold the per-user text tables and their copy of Term
+        return app_label == "text_app" and (
+            model_name in SHARDED_MODELS or model_name in REPLICATED_MODELS
+        )
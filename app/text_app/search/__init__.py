@@ -0,0 +1,51 @@
+from django.conf import settings
+from django.utils.module_loading import import_string
+# Resolve the configured engine class from its dotted path
+
+from .base import BaseSearchEngine, make_hit, make_preview, paragraph_preview
+
+
+_engines = {}
+
+
+def get_search_engine():
+    # Return the process-wide engine instance, or None when disabled
+    engine_path = getattr(settings, "TEXT_SEARCH_ENGINE", None)
+    if not engine_path:
+        return None
+    if engine_path not in _engines:
+        _engines[engine_path] = import_string(engine_path)()
+    return _engines[engine_path]
+
+
+def notify_indexed(entries):
+    # Forward freshly indexed paragraphs to the configured engine
+    engine = get_search_engine()
+    if engine is not None and entries:
+        engine.paragraphs_indexed(entries)
+
+
+def notify_terms_removed(paragraph, words):
+    # Forward words an edited paragraph no longer contains
+    engine = get_search_engine()
+    if engine is not None and words:
+        engine.terms_removed(paragraph, words)
+
+
+def notify_reindexed(paragraph, freq, changed, removed_words):
+    # Forward a committed edit of a paragraph
+    engine = get_search_engine()
+    if engine is not None:
+        engine.paragraph_reindexed(paragraph, freq, changed, removed_words)
+
+
+__all__ = (
+    "BaseSearchEngine",
+    "get_search_engine",
+    "make_hit",
+    "make_preview",
+    "paragraph_preview",
+    "notify_indexed",
+    "notify_reindexed",
+    "notify_terms_removed",
+)
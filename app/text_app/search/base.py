@@ -0,0 +1,57 @@
+PREVIEW_LENGTH = 100
+# Number of characters of paragraph content returned with each search hit
+
+
+def make_preview(content):
+    # Content preview capped at PREVIEW_LENGTH characters
+    if len(content) > PREVIEW_LENGTH:
+        return content[:PREVIEW_LENGTH] + "..."
+    return content
+
+
+def paragraph_preview(paragraph):
+    # Stored preview, computed on the fly for rows created before the column existed
+    return paragraph.preview or make_preview(paragraph.content)
+
+
+def make_hit(paragraph_id, preview, count, created_at):
+    # Single search result in the shape returned by the Search API
+    return {
+        "paragraph_id": paragraph_id,
+        "content": preview,
+        "count": count,
+        "created_at": created_at,
+    }
+
+
+class BaseSearchEngine:
+    """
+    Interface implemented by pluggable search engines.
+
+    The Search view asks the engine first and falls back to the ORM
+    query whenever the engine returns None (not warm for that user).
+    """
+
+    def search(self, user_id, word, limit=10):
+        # Return up to `limit` hits ordered by count, or None to fall back
+        raise NotImplementedError
+
+    def paragraphs_indexed(self, entries):
+        # Called after compute_frequency commits new frequencies
+        # `entries` is a list of (paragraph, Counter) pairs
+        raise NotImplementedError
+
+    def terms_removed(self, paragraph, words):
+        # Called after an edited paragraph lost some of its words
+        pass
+
+    def paragraph_reindexed(self, paragraph, freq, changed, removed_words):
+        # Called after an edit was committed; `freq` holds all new counts,
+        # `changed` only those that differ from the old content
+        self.terms_removed(paragraph, removed_words)
+        self.paragraphs_indexed([(paragraph, changed)])
+
+    def rebuild(self):
+        # Rebuild persistent index state from the database
+        # Returns the number of postings written
+        raise NotImplementedError
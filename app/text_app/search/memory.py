@@ -0,0 +1,213 @@
+from array import array
+# Compact typed arrays used for posting list storage
+
+from bisect import bisect_left, bisect_right
+# Keeps posting lists sorted by count on incremental inserts
+
+from collections import OrderedDict
+# LRU bookkeeping for the set of warm users
+
+import threading
+import uuid
+# Background warm-up threads and per-user version tokens
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections
+
+from ..models import Paragraph
+from ..queries import iter_user_postings
+from ..sharding import user_shard
+from .base import BaseSearchEngine, make_hit, paragraph_preview
+
+
+VERSION_KEY = "text:search:version:{user_id}"
+# Cache key holding a token that changes whenever a user's index changes
+
+
+class PostingList:
+    """
+    Posting list for one (user, word) pair.
+
+    Paragraph ids and counts are kept in two parallel arrays ordered by
+    count descending, then paragraph id (the order of the ORM query, so
+    its keyset pages continue the engine's first page). Counts are stored
+    negated so bisect can be used for ordered inserts.
+    """
+
+    __slots__ = ("neg_counts", "paragraph_ids")
+
+    def __init__(self):
+        self.neg_counts = array("q")
+        self.paragraph_ids = array("q")
+
+    def append(self, paragraph_id, count):
+        # Fast path used during bootstrap when rows already arrive sorted
+        self.neg_counts.append(-count)
+        self.paragraph_ids.append(paragraph_id)
+
+    def add(self, paragraph_id, count):
+        # Insert while preserving (count, paragraph id) ordering
+        low = bisect_left(self.neg_counts, -count)
+        high = bisect_right(self.neg_counts, -count, low)
+        pos = bisect_left(self.paragraph_ids, paragraph_id, low, high)
+        self.neg_counts.insert(pos, -count)
+        self.paragraph_ids.insert(pos, paragraph_id)
+
+    def top(self, limit):
+        # Highest-count (paragraph_id, count) pairs
+        return [
+            (self.paragraph_ids[i], -self.neg_counts[i])
+            for i in range(min(limit, len(self.paragraph_ids)))
+        ]
+
+
+class UserIndex:
+    # All postings and paragraph previews of a single user
+
+    __slots__ = ("version", "postings", "paragraphs")
+
+    def __init__(self, version):
+        self.version = version
+        self.postings = {}
+        self.paragraphs = {}
+
+    def add_paragraph(self, paragraph, freq):
+        self.paragraphs[paragraph.id] = (
+            paragraph_preview(paragraph),
+            paragraph.created_at.isoformat()
+        )
+        for word, count in freq.items():
+            posting = self.postings.get(word)
+            if posting is None:
+                posting = self.postings[word] = PostingList()
+            posting.add(paragraph.id, count)
+
+
+class InMemorySearchEngine(BaseSearchEngine):
+    """
+    Per-process inverted index answering top-k queries without the database.
+
+    Users are bootstrapped from the stored index (WordFrequency rows or
+    posting blocks, per TEXT_INDEX_STORAGE) on their first search and
+    kept in an LRU of TEXT_SEARCH_ENGINE_MAX_USERS entries. A version
+    token in the shared cache lets worker processes invalidate copies
+    held by web processes; paragraphs indexed in this process are
+    applied incrementally.
+    """
+
+    def __init__(self):
+        self.max_users = getattr(settings, "TEXT_SEARCH_ENGINE_MAX_USERS", 1000)
+        self._users = OrderedDict()
+        self._warming = set()
+        self._lock = threading.Lock()
+
+    def search(self, user_id, word, limit=10):
+        with self._lock:
+            index = self._users.get(user_id)
+            if index is not None:
+                self._users.move_to_end(user_id)
+
+        # Cold or stale users are answered by the ORM while warming up
+        if index is None or index.version != cache.get(self._version_key(user_id)):
+            self._schedule_warm(user_id)
+            return None
+
+        posting = index.postings.get(word)
+        if posting is None:
+            return []
+
+        hits = []
+        for paragraph_id, count in posting.top(limit):
+            paragraph = index.paragraphs.get(paragraph_id)
+            if paragraph is None:
+                # Paragraph deleted after its postings were loaded
+                continue
+            preview, created_at = paragraph
+            hits.append(make_hit(paragraph_id, preview, count, created_at))
+        return hits
+
+    def paragraphs_indexed(self, entries):
+        # Group fresh paragraphs by owner
+        by_user = {}
+        for paragraph, freq in entries:
+            by_user.setdefault(paragraph.user_id, []).append((paragraph, freq))
+
+        for user_id, user_entries in by_user.items():
+            key = self._version_key(user_id)
+            previous = cache.get(key)
+            current = uuid.uuid4().hex
+            cache.set(key, current, timeout=None)
+
+            with self._lock:
+                index = self._users.get(user_id)
+                if index is None:
+                    continue
+
+                # Re-indexed paragraphs or missed updates require a rebuild
+                if index.version != previous or any(
+                    paragraph.id in index.paragraphs for paragraph, _ in user_entries
+                ):
+                    del self._users[user_id]
+                    continue
+
+                for paragraph, freq in user_entries:
+                    index.add_paragraph(paragraph, freq)
+                index.version = current
+
+    def terms_removed(self, paragraph, words):
+        # Posting lists are not edited in place; rebuild the user instead
+        with self._lock:
+            self._users.pop(paragraph.user_id, None)
+
+    def warm(self, user_id):
+        # Build a user's index from the database
+        version = cache.get(self._version_key(user_id))
+        index = UserIndex(version)
+
+        # Postings arrive grouped by term and already in posting order
+        for word, postings in iter_user_postings(user_id):
+            posting = index.postings[word] = PostingList()
+            for paragraph_id, count in postings:
+                posting.append(paragraph_id, count)
+
+        # Previews are precomputed, so paragraph bodies are never loaded
+        paragraphs = (
+            Paragraph.objects
+            .filter(user_id=user_id)
+            .values_list("id", "preview", "created_at")
+            .iterator(chunk_size=10000)
+        )
+        for paragraph_id, preview, created_at in paragraphs:
+            index.paragraphs[paragraph_id] = (preview, created_at.isoformat())
+
+        with self._lock:
+            self._users[user_id] = index
+            self._users.move_to_end(user_id)
+            while len(self._users) > self.max_users:
+                self._users.popitem(last=False)
+        return index
+
+    def _schedule_warm(self, user_id):
+        # Warm a user on a background thread, at most once at a time
+        with self._lock:
+            if user_id in self._warming:
+                return
+            self._warming.add(user_id)
+
+        thread = threading.Thread(target=self._warm_in_background, args=(user_id,), daemon=True)
+        thread.start()
+
+    def _warm_in_background(self, user_id):
+        try:
+            # Context variables do not cross into the thread; route explicitly
+            with user_shard(user_id):
+                self.warm(user_id)
+        finally:
+            with self._lock:
+                self._warming.discard(user_id)
+            connections.close_all()
+
+    @staticmethod
+    def _version_key(user_id):
+        return VERSION_KEY.format(user_id=user_id)
@@ -0,0 +1,209 @@
+import json
+# Preview entries are stored as small JSON arrays in a Redis hash
+
+from django.conf import settings
+
+from ..models import Paragraph
+from ..queries import iter_user_postings
+from ..redis_client import connect
+from ..sharding import shard_aliases, use_shard
+from .base import BaseSearchEngine, make_hit, paragraph_preview
+
+
+KEY_PREFIX = "text:idx"
+READY_KEY = f"{KEY_PREFIX}:ready"
+# Set to INDEX_FORMAT once a full rebuild has backfilled every user
+
+INDEX_FORMAT = 3
+# Bumped whenever the layout of the keys changes; older indexes need a rebuild
+
+MEMBER_DIGITS = 20
+# Paragraph ids are zero-padded so members sort numerically
+
+
+class RedisSearchEngine(BaseSearchEngine):
+    """
+    Search index stored in Redis and maintained by the worker.
+
+    Every (user, word) pair is a sorted set of paragraph ids scored by
+    negated count, previews live in a per-user hash and every paragraph
+    has a set of the words it was indexed under, so indexing it again
+    (a redelivered task) first removes it from words it no longer
+    contains. ZRANGE returns
+    ties by member, so the zero-padded ids come out in the (-count,
+    paragraph_id) order of the ORM query and its keyset pages continue
+    the engine's first page. Searches are answered once a rebuild has
+    backfilled the stored index (rows or posting blocks).
+    """
+
+    def __init__(self, client=None):
+        self.client = client or connect(settings.TEXT_SEARCH_REDIS_URL)
+
+    def search(self, user_id, word, limit=10):
+        # Readiness check and top-k read share one round-trip
+        pipe = self.client.pipeline(transaction=False)
+        pipe.get(READY_KEY)
+        pipe.zrange(self._word_key(user_id, word), 0, limit - 1, withscores=True)
+        ready, top = pipe.execute()
+
+        if ready is None or int(ready) != INDEX_FORMAT:
+            return None
+        if not top:
+            return []
+
+        paragraph_ids = [int(member) for member, _ in top]
+        previews = self.client.hmget(self._preview_key(user_id), paragraph_ids)
+
+        hits = []
+        for paragraph_id, (_, score), preview in zip(paragraph_ids, top, previews):
+            if preview is None:
+                # Paragraph removed from the preview hash but not yet from the set
+                continue
+            content, created_at = json.loads(preview)
+            hits.append(make_hit(paragraph_id, content, -int(score), created_at))
+        return hits
+
+    def paragraphs_indexed(self, entries):
+        # Replace the postings and previews of the batch: one round-trip
+        # reads the words each paragraph was indexed under before, one
+        # pipelined call writes the new state
+        pipe = self.client.pipeline(transaction=False)
+        for paragraph, _ in entries:
+            pipe.smembers(self._paragraph_key(paragraph.user_id, paragraph.id))
+        previous = pipe.execute()
+
+        for (paragraph, freq), indexed_words in zip(entries, previous):
+            user_id = paragraph.user_id
+            member = self._member(paragraph.id)
+            for word in indexed_words:
+                word = word.decode()
+                if word not in freq:
+                    pipe.zrem(self._word_key(user_id, word), member)
+            for word, count in freq.items():
+                pipe.zadd(self._word_key(user_id, word), {member: -count})
+
+            paragraph_key = self._paragraph_key(user_id, paragraph.id)
+            pipe.delete(paragraph_key)
+            if freq:
+                pipe.sadd(paragraph_key, *freq)
+            pipe.hset(
+                self._preview_key(user_id),
+                paragraph.id,
+                self._encode_preview(paragraph_preview(paragraph), paragraph.created_at)
+            )
+        pipe.execute()
+
+    def terms_removed(self, paragraph, words):
+        # Drop the paragraph from the sorted sets of words it no longer contains
+        pipe = self.client.pipeline(transaction=False)
+        for word in words:
+            pipe.zrem(self._word_key(paragraph.user_id, word), self._member(paragraph.id))
+        if words:
+            pipe.srem(self._paragraph_key(paragraph.user_id, paragraph.id), *words)
+        pipe.execute()
+
+    def paragraph_reindexed(self, paragraph, freq, changed, removed_words):
+        # An edit only moves the changed words; the others keep their scores
+        user_id = paragraph.user_id
+        member = self._member(paragraph.id)
+        paragraph_key = self._paragraph_key(user_id, paragraph.id)
+
+        pipe = self.client.pipeline(transaction=False)
+        for word in removed_words:
+            pipe.zrem(self._word_key(user_id, word), member)
+        if removed_words:
+            pipe.srem(paragraph_key, *removed_words)
+        for word, count in changed.items():
+            pipe.zadd(self._word_key(user_id, word), {member: -count})
+        if changed:
+            pipe.sadd(paragraph_key, *changed)
+        pipe.hset(
+            self._preview_key(user_id),
+            paragraph.id,
+            self._encode_preview(paragraph_preview(paragraph), paragraph.created_at)
+        )
+        pipe.execute()
+
+    def rebuild(self, chunk_size=10000):
+        # Backfill the whole index from the stored postings and Paragraph rows
+        self.client.delete(READY_KEY)
+
+        pipe = self.client.pipeline(transaction=False)
+        pending = 0
+        postings = 0
+
+        # Drop every existing index key before reloading
+        for key in self.client.scan_iter(match=f"{KEY_PREFIX}:*", count=chunk_size):
+            pipe.unlink(key)
+            pending += 1
+            if pending >= chunk_size:
+                pipe.execute()
+                pending = 0
+
+        # Every shard holds a disjoint set of users
+        for alias in shard_aliases():
+            with use_shard(alias):
+                user_ids = list(
+                    Paragraph.objects
+                    .order_by("user_id")
+                    .values_list("user_id", flat=True)
+                    .distinct()
+                )
+                for user_id in user_ids:
+                    for word, word_postings in iter_user_postings(user_id, chunk_size):
+                        key = self._word_key(user_id, word)
+                        for start in range(0, len(word_postings), chunk_size):
+                            chunk = word_postings[start:start + chunk_size]
+                            pipe.zadd(key, {
+                                self._member(paragraph_id): -count for paragraph_id, count in chunk
+                            })
+                            for paragraph_id, _ in chunk:
+                                pipe.sadd(self._paragraph_key(user_id, paragraph_id), word)
+                            pending += 1 + len(chunk)
+                            if pending >= chunk_size:
+                                pipe.execute()
+                                pending = 0
+                        postings += len(word_postings)
+
+            # Previews are precomputed, so paragraph bodies are never loaded
+            paragraphs = (
+                Paragraph.objects
+                .using(alias)
+                .order_by()
+                .values_list("id", "user_id", "preview", "created_at")
+                .iterator(chunk_size=chunk_size)
+            )
+            for paragraph_id, user_id, preview, created_at in paragraphs:
+                pipe.hset(
+                    self._preview_key(user_id),
+                    paragraph_id,
+                    self._encode_preview(preview, created_at)
+                )
+                pending += 1
+                if pending >= chunk_size:
+                    pipe.execute()
+                    pending = 0
+
+        pipe.set(READY_KEY, INDEX_FORMAT)
+        pipe.execute()
+        return postings
+
+    @staticmethod
+    def _encode_preview(preview, created_at):
+        return json.dumps([preview, created_at.isoformat()])
+
+    @staticmethod
+    def _member(paragraph_id):
+        return f"{paragraph_id:0{MEMBER_DIGITS}d}"
+
+    @staticmethod
+    def _word_key(user_id, word):
+        return f"{KEY_PREFIX}:{user_id}:w:{word}"
+
+    @staticmethod
+    def _paragraph_key(user_id, paragraph_id):
+        return f"{KEY_PREFIX}:{user_id}:d:{paragraph_id}"
+
+    @staticmethod
+    def _preview_key(user_id):
+        return f"{KEY_PREFIX}:{user_id}:p"
@@ -0,0 +1,574 @@
+import fcntl
+import heapq
+import json
+import mmap
+import os
+import struct
+import threading
+import uuid
+from array import array
+from bisect import bisect_left
+from collections import OrderedDict
+from contextlib import contextmanager
+from itertools import groupby
+from operator import itemgetter
+# Segment files are read through mmap; manifests are swapped under file locks
+
+from django.conf import settings
+
+from ..models import Paragraph
+from ..queries import iter_user_postings
+from ..sharding import shard_aliases, use_shard
+from .base import BaseSearchEngine, make_hit, paragraph_preview
+
+
+# Segment file layout (native byte order, every section 8-byte aligned):
+#   header          HEADER
+#   postings        int64 (count, paragraph_id) pairs; the postings of a
+#                   term are contiguous, ordered by count desc, then id
+#   paragraph info  JSON [preview, created_at] of every covered paragraph
+#   term ranges     int64 (first posting, posting count) per term
+#   term offsets    int64 offsets of each term in the term blob (+ end)
+#   paragraph ids   int64 ids of the covered paragraphs, ascending
+#   info offsets    int64 offsets of each paragraph's info (+ end)
+#   term blob       UTF-8 terms in byte order
+MAGIC = b"TXTSEG01"
+HEADER = struct.Struct("=8s9q")
+# magic, byte order mark, user_id, postings, terms, paragraphs,
+# info offset, info size, term ranges offset, term blob offset
+
+MANIFEST = "MANIFEST"
+READY = "READY"
+# Created once a full rebuild has written a segment for every user
+
+
+class SegmentWriter:
+    """
+    Writes one immutable segment file.
+
+    Postings are streamed to disk term by term (in any term order), then
+    the covered paragraphs in ascending id order; finish() writes the
+    sorted term dictionary and renames the file into place, so readers
+    never see a partial segment.
+    """
+
+    def __init__(self, path, user_id):
+        self.path = path
+        self.user_id = user_id
+        self._tmp = f"{path}.tmp"
+        self._file = open(self._tmp, "wb")
+        self._file.write(bytes(HEADER.size))
+        self._terms = {}
+        self._postings = 0
+        self._info_start = None
+        self._paragraph_ids = array("q")
+        self._info_offsets = array("q", [0])
+
+    def add_term(self, word, postings):
+        # `postings`: (count, paragraph_id) pairs ordered by count desc, then id
+        if self._info_start is not None:
+            raise ValueError("Terms must be added before paragraphs")
+        values = array("q")
+        for count, paragraph_id in postings:
+            values.append(count)
+            values.append(paragraph_id)
+        if not values:
+            return
+
+        key = word if isinstance(word, bytes) else word.encode("utf-8")
+        if key in self._terms:
+            raise ValueError(f"Term {key!r} added twice")
+        self._terms[key] = (self._postings, len(values) // 2)
+        self._file.write(values.tobytes())
+        self._postings += len(values) // 2
+
+    def add_paragraph(self, paragraph_id, preview, created_at):
+        self.add_paragraph_info(paragraph_id, json.dumps([preview, created_at]).encode("utf-8"))
+
+    def add_paragraph_info(self, paragraph_id, info):
+        # `info`: encoded [preview, created_at] (copied as is when merging)
+        if self._info_start is None:
+            self._info_start = self._file.tell()
+        if self._paragraph_ids and paragraph_id <= self._paragraph_ids[-1]:
+            raise ValueError("Paragraphs must be added in ascending id order")
+        self._file.write(info)
+        self._paragraph_ids.append(paragraph_id)
+        self._info_offsets.append(self._info_offsets[-1] + len(info))
+
+    def finish(self):
+        # Complete the file and return its manifest entry
+        f = self._file
+        if self._info_start is None:
+            self._info_start = f.tell()
+        info_size = self._info_offsets[-1]
+        f.write(bytes(-f.tell() % 8))
+
+        ranges_offset = f.tell()
+        keys = sorted(self._terms)
+        ranges = array("q")
+        offsets = array("q", [0])
+        for key in keys:
+            ranges.extend(self._terms[key])
+            offsets.append(offsets[-1] + len(key))
+        for section in (ranges, offsets, self._paragraph_ids, self._info_offsets):
+            f.write(section.tobytes())
+
+        blob_offset = f.tell()
+        f.write(b"".join(keys))
+
+        f.seek(0)
+        f.write(HEADER.pack(
+            MAGIC, 1, self.user_id, self._postings, len(keys), len(self._paragraph_ids),
+            self._info_start, info_size, ranges_offset, blob_offset
+        ))
+        f.flush()
+        os.fsync(f.fileno())
+        f.close()
+        os.replace(self._tmp, self.path)
+        return {
+            "name": os.path.basename(self.path),
+            "postings": self._postings,
+            "paragraphs": len(self._paragraph_ids),
+        }
+
+    def abort(self):
+        self._file.close()
+        try:
+            os.unlink(self._tmp)
+        except FileNotFoundError:
+            pass
+
+
+class Segment:
+    """
+    Read-only, memory-mapped segment.
+
+    All sections are memoryviews over the mapping, so lookups read the
+    page cache directly and every process opening the same file shares
+    it. The mapping is released once the last reference is dropped.
+    """
+
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        (magic, mark, self.user_id, postings, terms, paragraphs,
+         info_offset, info_size, ranges_offset, blob_offset) = HEADER.unpack_from(self._map)
+        if magic != MAGIC or mark != 1:
+            raise ValueError(f"{path} is not a segment written on this platform")
+
+        view = memoryview(self._map)
+
+        def ints(start, count):
+            return view[start:start + 8 * count].cast("q")
+
+        self.postings = ints(HEADER.size, 2 * postings)
+        self.info = view[info_offset:info_offset + info_size]
+        self.term_ranges = ints(ranges_offset, 2 * terms)
+        self.term_offsets = ints(ranges_offset + 16 * terms, terms + 1)
+        self.paragraph_ids = ints(ranges_offset + 24 * terms + 8, paragraphs)
+        self.info_offsets = ints(ranges_offset + 24 * terms + 8 * paragraphs + 8, paragraphs + 1)
+        self.term_blob = view[blob_offset:]
+        self.term_count = terms
+
+    def _term(self, index):
+        return bytes(self.term_blob[self.term_offsets[index]:self.term_offsets[index + 1]])
+
+    def find(self, word):
+        # (first posting, posting count) of a term, or None
+        key = word if isinstance(word, bytes) else word.encode("utf-8")
+        lo, hi = 0, self.term_count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._term(mid) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < self.term_count and self._term(lo) == key:
+            return self.term_ranges[2 * lo], self.term_ranges[2 * lo + 1]
+        return None
+
+    def iter_postings(self, start, length):
+        # (count, paragraph_id) pairs, highest counts first
+        postings = self.postings
+        for i in range(2 * start, 2 * (start + length), 2):
+            yield postings[i], postings[i + 1]
+
+    def terms(self):
+        # (term, first posting, posting count) in term order
+        for index in range(self.term_count):
+            yield self._term(index), self.term_ranges[2 * index], self.term_ranges[2 * index + 1]
+
+    def _paragraph_index(self, paragraph_id):
+        index = bisect_left(self.paragraph_ids, paragraph_id)
+        if index < len(self.paragraph_ids) and self.paragraph_ids[index] == paragraph_id:
+            return index
+        return None
+
+    def covers(self, paragraph_id):
+        # Whether this segment holds the (complete) index of a paragraph
+        return self._paragraph_index(paragraph_id) is not None
+
+    def paragraph_info(self, paragraph_id):
+        # Encoded [preview, created_at] of a covered paragraph
+        index = self._paragraph_index(paragraph_id)
+        if index is None:
+            return None
+        return bytes(self.info[self.info_offsets[index]:self.info_offsets[index + 1]])
+
+
+def top_postings(segments, word, limit):
+    # Highest-count (paragraph_id, count, segment) hits over `segments`
+    # (newest first). A segment holds every posting of the paragraphs it
+    # covers, so a posting only counts if no newer segment covers its
+    # paragraph. Segments are merged lazily and stop after `limit` hits.
+    def ranked(rank, found):
+        for count, paragraph_id in segments[rank].iter_postings(*found):
+            yield -count, paragraph_id, rank
+
+    streams = []
+    for rank, segment in enumerate(segments):
+        found = segment.find(word)
+        if found is not None:
+            streams.append(ranked(rank, found))
+
+    hits = []
+    for negative, paragraph_id, rank in heapq.merge(*streams):
+        if any(newer.covers(paragraph_id) for newer in segments[:rank]):
+            continue
+        hits.append((paragraph_id, -negative, segments[rank]))
+        if len(hits) >= limit:
+            break
+    return hits
+
+
+def _tier(postings):
+    # Size tier of a segment: 0 up to TEXT_SEGMENT_TIER_POSTINGS, then one
+    # tier per TEXT_SEGMENT_MERGE_FACTOR-fold growth
+    tier, size = 0, settings.TEXT_SEGMENT_TIER_POSTINGS
+    while postings > size:
+        tier += 1
+        size *= settings.TEXT_SEGMENT_MERGE_FACTOR
+    return tier
+
+
+def pick_merge(entries):
+    # Smallest-tier run of at least TEXT_SEGMENT_MERGE_FACTOR adjacent
+    # segments (manifest order) no larger than that tier, or None
+    factor = settings.TEXT_SEGMENT_MERGE_FACTOR
+    tiers = [_tier(entry["postings"]) for entry in entries]
+    for tier in sorted(set(tiers)):
+        run = []
+        for entry, entry_tier in zip(entries, tiers):
+            if entry_tier <= tier:
+                run.append(entry)
+                continue
+            if len(run) >= factor:
+                return run
+            run = []
+        if len(run) >= factor:
+            return run
+    return None
+
+
+class SegmentStore:
+    """
+    Per-user segment files under TEXT_SEGMENT_DIR.
+
+    <root>/<user_id % 1000>/<user_id>/MANIFEST lists a user's live
+    segments oldest first. Workers append new segments and merges swap a
+    run of segments for their merged copy, both by rewriting the manifest
+    under an exclusive lock; replaced files are unlinked afterwards
+    (processes that still map them keep reading them until they reopen).
+    """
+
+    def __init__(self, root=None):
+        self.root = root or settings.TEXT_SEGMENT_DIR
+
+    def user_dir(self, user_id):
+        return os.path.join(self.root, f"{user_id % 1000:03d}", str(user_id))
+
+    def manifest_path(self, user_id):
+        return os.path.join(self.user_dir(user_id), MANIFEST)
+
+    def segment_path(self, user_id, name):
+        return os.path.join(self.user_dir(user_id), name)
+
+    def read_manifest(self, user_id):
+        # Manifest entries ({"name", "postings", "paragraphs"}), oldest first
+        try:
+            with open(self.manifest_path(user_id)) as f:
+                return json.load(f)["segments"]
+        except FileNotFoundError:
+            return []
+
+    def _write_manifest(self, user_id, entries):
+        path = self.manifest_path(user_id)
+        with open(f"{path}.tmp", "w") as f:
+            json.dump({"segments": entries}, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(f"{path}.tmp", path)
+
+    @contextmanager
+    def _locked(self, user_id, name="LOCK", blocking=True):
+        # Yields whether the lock was acquired (always True when blocking)
+        os.makedirs(self.user_dir(user_id), exist_ok=True)
+        with open(os.path.join(self.user_dir(user_id), name), "a") as f:
+            try:
+                fcntl.flock(f, fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+            except BlockingIOError:
+                yield False
+                return
+            try:
+                yield True
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def merging(self, user_id, blocking=True):
+        # Only one merge (or rebuild) per user at a time
+        return self._locked(user_id, "MERGE_LOCK", blocking)
+
+    def writer(self, user_id):
+        os.makedirs(self.user_dir(user_id), exist_ok=True)
+        return SegmentWriter(self.segment_path(user_id, f"{uuid.uuid4().hex}.seg"), user_id)
+
+    def add(self, user_id, entries):
+        # Write a segment for (paragraph, freq) entries of one user and make
+        # it the newest; returns the updated manifest entries
+        paragraphs = {paragraph.id: (paragraph, freq) for paragraph, freq in entries}
+        postings = {}
+        for paragraph_id, (_, freq) in paragraphs.items():
+            for word, count in freq.items():
+                postings.setdefault(word, []).append((count, paragraph_id))
+
+        writer = self.writer(user_id)
+        try:
+            for word, word_postings in postings.items():
+                word_postings.sort(key=lambda posting: (-posting[0], posting[1]))
+                writer.add_term(word, word_postings)
+            for paragraph_id in sorted(paragraphs):
+                paragraph = paragraphs[paragraph_id][0]
+                writer.add_paragraph(
+                    paragraph_id, paragraph_preview(paragraph), paragraph.created_at.isoformat()
+                )
+            entry = writer.finish()
+        except BaseException:
+            writer.abort()
+            raise
+
+        with self._locked(user_id):
+            manifest = self.read_manifest(user_id)
+            manifest.append(entry)
+            self._write_manifest(user_id, manifest)
+        return manifest
+
+    def replace(self, user_id, names, entry):
+        # Put `entry` where the oldest of the segments `names` was and drop them
+        names = set(names)
+        with self._locked(user_id):
+            manifest = self.read_manifest(user_id)
+            positions = [i for i, current in enumerate(manifest) if current["name"] in names]
+            position = positions[0] if positions else 0
+            kept = [current for current in manifest if current["name"] not in names]
+            kept.insert(position, entry)
+            self._write_manifest(user_id, kept)
+
+        for name in names:
+            try:
+                os.unlink(self.segment_path(user_id, name))
+            except FileNotFoundError:
+                pass
+
+    def merge(self, user_id):
+        # Merge runs of small segments until none is left; returns the
+        # number of merges (0 when another process is already merging)
+        merges = 0
+        with self.merging(user_id, blocking=False) as acquired:
+            if not acquired:
+                return 0
+            while True:
+                run = pick_merge(self.read_manifest(user_id))
+                if run is None:
+                    return merges
+                self._merge_run(user_id, run)
+                merges += 1
+
+    def _merge_run(self, user_id, run):
+        segments = [Segment(self.segment_path(user_id, entry["name"])) for entry in run]
+
+        # Within the run, each paragraph keeps the postings of its newest segment
+        owners = {}
+        for index in range(len(segments) - 1, -1, -1):
+            for paragraph_id in segments[index].paragraph_ids:
+                owners.setdefault(paragraph_id, index)
+
+        def tagged_terms(index):
+            for term, start, length in segments[index].terms():
+                yield term, start, length, index
+
+        def live_postings(index, start, length):
+            # Sort keys of the postings whose paragraph this segment owns
+            for count, paragraph_id in segments[index].iter_postings(start, length):
+                if owners[paragraph_id] == index:
+                    yield -count, paragraph_id
+
+        writer = self.writer(user_id)
+        try:
+            tagged = [tagged_terms(index) for index in range(len(segments))]
+            for term, parts in groupby(heapq.merge(*tagged), key=itemgetter(0)):
+                streams = [live_postings(index, start, length) for _, start, length, index in parts]
+                writer.add_term(
+                    term,
+                    ((-negative, paragraph_id) for negative, paragraph_id in heapq.merge(*streams))
+                )
+            for paragraph_id in sorted(owners):
+                writer.add_paragraph_info(
+                    paragraph_id, segments[owners[paragraph_id]].paragraph_info(paragraph_id)
+                )
+            entry = writer.finish()
+        except BaseException:
+            writer.abort()
+            raise
+
+        self.replace(user_id, [current["name"] for current in run], entry)
+
+    def is_ready(self):
+        return os.path.exists(os.path.join(self.root, READY))
+
+    def set_ready(self, ready):
+        path = os.path.join(self.root, READY)
+        if ready:
+            os.makedirs(self.root, exist_ok=True)
+            open(path, "a").close()
+        elif os.path.exists(path):
+            os.unlink(path)
+
+
+class SegmentSearchEngine(BaseSearchEngine):
+    """
+    Search index stored as immutable on-disk segments.
+
+    Workers write one segment per user for each committed batch, holding
+    that batch's term dictionary and count-sorted postings; the
+    merge_segments task compacts small segments LSM-style. Web processes
+    memory-map a user's live segments and keep them open until the
+    manifest changes (one stat per search). Searches are answered once a
+    rebuild has written segments for the stored index (rows or posting
+    blocks, per TEXT_INDEX_STORAGE).
+    """
+
+    def __init__(self, store=None):
+        self.store = store or SegmentStore()
+        self._users = OrderedDict()
+        self._lock = threading.Lock()
+
+    def search(self, user_id, word, limit=10):
+        if not self.store.is_ready():
+            return None
+        segments = self._segments(user_id)
+        if segments is None:
+            return None
+
+        hits = []
+        for paragraph_id, count, segment in top_postings(segments, word, limit):
+            preview, created_at = json.loads(segment.paragraph_info(paragraph_id))
+            hits.append(make_hit(paragraph_id, preview, count, created_at))
+        return hits
+
+    def _segments(self, user_id):
+        # Open segments of a user, newest first (None if they keep changing)
+        for _ in range(3):
+            try:
+                stat = os.stat(self.store.manifest_path(user_id))
+            except FileNotFoundError:
+                return []
+            key = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+            with self._lock:
+                cached = self._users.get(user_id)
+                if cached is not None and cached[0] == key:
+                    self._users.move_to_end(user_id)
+                    return cached[2]
+            opened = cached[1] if cached is not None else {}
+
+            try:
+                by_name = {
+                    entry["name"]: opened.get(entry["name"])
+                    or Segment(self.store.segment_path(user_id, entry["name"]))
+                    for entry in self.store.read_manifest(user_id)
+                }
+            except FileNotFoundError:
+                # Merged away between reading the manifest and opening; retry
+                continue
+            segments = list(reversed(by_name.values()))
+
+            with self._lock:
+                self._users[user_id] = (key, by_name, segments)
+                self._users.move_to_end(user_id)
+                while len(self._users) > settings.TEXT_SEGMENT_CACHE_USERS:
+                    self._users.popitem(last=False)
+            return segments
+        return None
+
+    def paragraphs_indexed(self, entries):
+        by_user = {}
+        for paragraph, freq in entries:
+            by_user.setdefault(paragraph.user_id, []).append((paragraph, freq))
+
+        for user_id, user_entries in by_user.items():
+            manifest = self.store.add(user_id, user_entries)
+            if pick_merge(manifest) is not None:
+                # Imported here: the tasks module imports the search package
+                from ..tasks import merge_segments
+                merge_segments.delay(user_id)
+
+    def paragraph_reindexed(self, paragraph, freq, changed, removed_words):
+        # A newer segment replaces all postings of the paragraph
+        self.paragraphs_indexed([(paragraph, freq)])
+
+    def rebuild(self, chunk_size=10000):
+        # Write one segment per user from the stored postings and Paragraph rows
+        self.store.set_ready(False)
+        postings = 0
+        for alias in shard_aliases():
+            user_ids = (
+                Paragraph.objects
+                .using(alias)
+                .order_by("user_id")
+                .values_list("user_id", flat=True)
+                .distinct()
+            )
+            for user_id in list(user_ids):
+                with use_shard(alias):
+                    postings += self._rebuild_user(alias, user_id, chunk_size)
+        self.store.set_ready(True)
+        return postings
+
+    def _rebuild_user(self, alias, user_id, chunk_size):
+        # Segments appended while the rows are read stay newer than the rebuilt one
+        with self.store.merging(user_id):
+            replaced = [entry["name"] for entry in self.store.read_manifest(user_id)]
+            writer = self.store.writer(user_id)
+            try:
+                for word, postings in iter_user_postings(user_id, chunk_size):
+                    writer.add_term(word, ((count, paragraph_id) for paragraph_id, count in postings))
+
+                # Previews are precomputed, so paragraph bodies are never loaded
+                paragraphs = (
+                    Paragraph.objects
+                    .using(alias)
+                    .filter(user_id=user_id)
+                    .order_by("id")
+                    .values_list("id", "preview", "created_at")
+                    .iterator(chunk_size=chunk_size)
+                )
+                for paragraph_id, preview, created_at in paragraphs:
+                    writer.add_paragraph(paragraph_id, preview, created_at.isoformat())
+                entry = writer.finish()
+            except BaseException:
+                writer.abort()
+                raise
+
+            self.store.replace(user_id, replaced, entry)
+        return entry["postings"]
@@ -0,0 +1,219 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+# The active shard follows the request, task or coroutine that set it
+
+from rest_framework import status
+from rest_framework.exceptions import APIException
+from rest_framework.permissions import SAFE_METHODS
+# Writes refused while a user is being moved surface as 503 responses
+
+from django.apps import apps
+from django.conf import settings
+from django.core.cache import cache
+# Shard assignments are cached so routing costs no query per request
+
+from django.db import connections
+
+
+# Per-user text data (Paragraph, WordFrequency and the tables derived from
+# them) lives on one of the TEXT_SHARDS database aliases. Views and tasks
+# activate the owning user's shard; UserShardRouter sends every query on
+# those models to the active shard. Everything else, including users and
+# the global Term table, stays on "default".
+
+SHARD_KEY = "text:shard:{user_id}"
+
+# Set while rebalance_shard moves a user; counts the user's writers in flight
+MOVING_KEY = "text:moving:{user_id}"
+WRITERS_KEY = "text:writers:{user_id}"
+
+# Upper bound on a single write, after which a stuck writer count expires
+WRITERS_TIMEOUT = 3600
+
+_active_shard = ContextVar("text_active_shard", default=None)
+
+
+def shard_aliases():
+    return list(getattr(settings, "TEXT_SHARDS", None) or ["default"])
+
+
+def home_shard(user_id):
+    # Placement used when no explicit assignment exists
+    aliases = shard_aliases()
+    return aliases[user_id % len(aliases)]
+
+
+def shard_for_user(user_id):
+    # Database alias holding the user's text data
+    aliases = shard_aliases()
+    if len(aliases) == 1:
+        return aliases[0]
+
+    key = SHARD_KEY.format(user_id=user_id)
+    alias = cache.get(key)
+    if alias is None:
+        from .models import ShardAssignment
+
+        alias = (
+            ShardAssignment.objects
+            .filter(user_id=user_id)
+            .values_list("alias", flat=True)
+            .first()
+        ) or home_shard(user_id)
+        cache.set(key, alias, timeout=None)
+    return alias
+
+
+def assign_shard(user_id, alias):
+    # Pin a user to a shard (used by the rebalancing command)
+    from .models import ShardAssignment
+
+    ShardAssignment.objects.update_or_create(user_id=user_id, defaults={"alias": alias})
+    cache.set(SHARD_KEY.format(user_id=user_id), alias, timeout=None)
+
+
+class ShardMoving(APIException):
+    # A user's data is being moved to another shard; retry shortly
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = "Your data is being moved, please retry shortly."
+    default_code = "shard_moving"
+
+
+def begin_writes(user_id):
+    # Register a writer of the user's text data, or raise ShardMoving.
+    # The writer is counted before the flag is checked, so rebalance_shard
+    # (which sets the flag, then waits for the count to drop to zero)
+    # either sees the writer or the writer sees the flag.
+    key = WRITERS_KEY.format(user_id=user_id)
+    cache.add(key, 0, timeout=WRITERS_TIMEOUT)
+    cache.incr(key)
+    if cache.get(MOVING_KEY.format(user_id=user_id)):
+        end_writes(user_id)
+        raise ShardMoving()
+
+
+def end_writes(user_id):
+    try:
+        cache.decr(WRITERS_KEY.format(user_id=user_id))
+    except ValueError:
+        # The count expired while the write ran
+        pass
+
+
+def writers_in_flight(user_id):
+    return cache.get(WRITERS_KEY.format(user_id=user_id)) or 0
+
+
+def set_moving(user_id, moving):
+    # Refuse (True) or allow again (False) writes of the user's text data
+    key = MOVING_KEY.format(user_id=user_id)
+    if moving:
+        cache.set(key, True, timeout=None)
+    else:
+        cache.delete(key)
+
+
+def current_shard():
+    # Alias of the active shard, or the first shard when none is active
+    return _active_shard.get() or shard_aliases()[0]
+
+
+@contextmanager
+def use_shard(alias):
+    # Route per-user text models to `alias` for the duration of the block
+    token = _active_shard.set(alias)
+    try:
+        yield alias
+    finally:
+        _active_shard.reset(token)
+
+
+def user_shard(user_id):
+    # Route per-user text models to the shard owning `user_id`
+    if user_id is None:
+        return use_shard(shard_aliases()[0])
+    return use_shard(shard_for_user(user_id))
+
+
+@contextmanager
+def user_write_shard(user_id):
+    # user_shard for code writing the user's text data: raises ShardMoving
+    # while the user is being moved, and resolves the shard only once
+    # registered as a writer so a finished move is always seen
+    if user_id is None:
+        with use_shard(shard_aliases()[0]) as alias:
+            yield alias
+        return
+
+    begin_writes(user_id)
+    try:
+        with use_shard(shard_for_user(user_id)) as alias:
+            yield alias
+    finally:
+        end_writes(user_id)
+
+
+class UserShardMixin:
+    # APIView mixin activating the authenticated user's shard for the request;
+    # unsafe methods are registered as writers (see begin_writes)
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        if request.user and request.user.is_authenticated:
+            if request.method not in SAFE_METHODS:
+                begin_writes(request.user.id)
+                self._writer_id = request.user.id
+            self._shard_token = _active_shard.set(shard_for_user(request.user.id))
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        token = getattr(self, "_shard_token", None)
+        if token is not None:
+            _active_shard.reset(token)
+            self._shard_token = None
+        writer_id = getattr(self, "_writer_id", None)
+        if writer_id is not None:
+            end_writes(writer_id)
+            self._writer_id = None
+        return super().finalize_response(request, response, *args, **kwargs)
+
+
+# Rows of shard k get ids from k * SHARD_ID_RANGE + 1 upwards, so a user's
+# rows keep their ids when moved to another shard
+SHARD_ID_RANGE = 2 ** 40
+
+
+def reserve_id_ranges(using, **kwargs):
+    # post_migrate handler moving the id sequences of a shard's tables to
+    # the start of its range (no-op for the first shard and for non-shards)
+    from .routers import SHARDED_MODELS
+
+    aliases = shard_aliases()
+    if using not in aliases or aliases.index(using) == 0:
+        return
+    start = aliases.index(using) * SHARD_ID_RANGE + 1
+
+    connection = connections[using]
+    with connection.cursor() as cursor:
+        for model_name in sorted(SHARDED_MODELS):
+            model = apps.get_model("text_app", model_name)
+            if not model._meta.pk.get_internal_type().endswith("AutoField"):
+                continue
+            table = model._meta.db_table
+
+            if connection.vendor == "sqlite":
+                cursor.execute("SELECT seq FROM sqlite_sequence WHERE name = %s", [table])
+                row = cursor.fetchone()
+                if row is None:
+                    cursor.execute(
+                        "INSERT INTO sqlite_sequence (name, seq) VALUES (%s, %s)", [table, start - 1]
+                    )
+                elif row[0] < start - 1:
+                    cursor.execute(
+                        "UPDATE sqlite_sequence SET seq = %s WHERE name = %s", [start - 1, table]
+                    )
+            elif connection.vendor == "postgresql":
+                cursor.execute("SELECT pg_get_serial_sequence(%s, 'id')", [table])
+                sequence = cursor.fetchone()[0]
+                cursor.execute(f"SELECT last_value FROM {sequence}")
+                if cursor.fetchone()[0] < start:
+                    cursor.execute("SELECT setval(%s, %s, false)", [sequence, start])
@@ -0,0 +1,230 @@
+import hashlib
+import math
+import sys
+import zlib
+from array import array
+from collections import Counter
+# Counters are stored as a compressed array of 64-bit integers
+
+from django.conf import settings
+from django.db import transaction
+
+from .models import WordSketch
+from .sharding import current_shard, use_shard
+
+
+# Approximate "top words" of a user's corpus without aggregating
+# WordFrequency. Every user has one WordSketch row holding a Count-Min
+# Sketch of the words indexed for them and a bounded set of heavy-hitter
+# candidates. The indexing tasks build a sketch of each committed batch
+# and merge it into the stored one; edits merge their (possibly negative)
+# count deltas the same way.
+
+
+def _hashes(word):
+    # Two independent 64-bit hashes; row i uses h1 + i * h2
+    digest = hashlib.blake2b(word.encode("utf-8"), digest_size=16).digest()
+    return int.from_bytes(digest[:8], "little"), int.from_bytes(digest[8:], "little") | 1
+
+
+class CountMinSketch:
+    """
+    Count-Min Sketch of word counts.
+
+    estimate(word) never underestimates a (non-negative) count and, with
+    probability at least 1 - delta, overestimates it by at most
+    epsilon * total, where epsilon = e / width and delta = e ** -depth.
+    Sketches of equal dimensions merge by adding their counters.
+    """
+
+    def __init__(self, width, depth, counts=None, total=0):
+        self.width = width
+        self.depth = depth
+        self.counts = counts if counts is not None else array("q", bytes(8 * width * depth))
+        self.total = total
+
+    def _cells(self, word):
+        h1, h2 = _hashes(word)
+        return [row * self.width + (h1 + row * h2) % self.width for row in range(self.depth)]
+
+    def add(self, word, count=1):
+        for cell in self._cells(word):
+            self.counts[cell] += count
+        self.total += count
+
+    def estimate(self, word):
+        return max(0, min(self.counts[cell] for cell in self._cells(word)))
+
+    def merge(self, other):
+        if (self.width, self.depth) != (other.width, other.depth):
+            raise ValueError("Cannot merge sketches of different dimensions")
+        for cell, count in enumerate(other.counts):
+            if count:
+                self.counts[cell] += count
+        self.total += other.total
+
+    @property
+    def epsilon(self):
+        return math.e / self.width
+
+    @property
+    def delta(self):
+        return math.exp(-self.depth)
+
+    def error_bound(self):
+        # Maximum overestimate of any count, holding with probability 1 - delta
+        return math.ceil(self.epsilon * self.total)
+
+    def to_bytes(self):
+        counts = array("q", self.counts)
+        if sys.byteorder == "big":
+            counts.byteswap()
+        return zlib.compress(counts.tobytes())
+
+    @classmethod
+    def from_bytes(cls, data, width, depth, total):
+        counts = array("q")
+        counts.frombytes(zlib.decompress(data))
+        if sys.byteorder == "big":
+            counts.byteswap()
+        return cls(width, depth, counts, total)
+
+
+class HeavyHitters:
+    """
+    Count-Min Sketch plus the `capacity` words with the highest estimates.
+
+    Candidates are re-estimated whenever their words are updated, so the
+    kept set follows the sketch; merging two of them merges the sketches
+    and re-ranks the union of both candidate sets.
+    """
+
+    def __init__(self, sketch, capacity, candidates=None):
+        self.sketch = sketch
+        self.capacity = capacity
+        self.candidates = dict(candidates or {})
+
+    def update(self, counts):
+        # Add {word: count} (counts may be negative for edits)
+        for word, count in counts.items():
+            if count:
+                self.sketch.add(word, count)
+        self._consider(counts)
+
+    def merge(self, other):
+        self.sketch.merge(other.sketch)
+        self._consider(set(self.candidates) | set(other.candidates), rescore=True)
+
+    def top(self, n):
+        # [(word, estimated count)] for the n words with the highest estimates
+        ranked = sorted(self.candidates.items(), key=lambda item: (-item[1], item[0]))
+        return ranked[:n]
+
+    def _consider(self, words, rescore=False):
+        touched = set(words)
+        for word in touched:
+            self.candidates[word] = self.sketch.estimate(word)
+        if rescore:
+            for word in self.candidates:
+                if word not in touched:
+                    self.candidates[word] = self.sketch.estimate(word)
+
+        # Keep the highest estimates; ties are broken by word for stable output
+        if len(self.candidates) > self.capacity or any(not count for count in self.candidates.values()):
+            kept = [item for item in self.top(self.capacity) if item[1] > 0]
+            self.candidates = dict(kept)
+
+
+def _dimensions():
+    return settings.TEXT_SKETCH_WIDTH, settings.TEXT_SKETCH_DEPTH
+
+
+def empty_sketch(width=None, depth=None):
+    if width is None:
+        width, depth = _dimensions()
+    return HeavyHitters(CountMinSketch(width, depth), settings.TEXT_SKETCH_HEAVY_HITTERS)
+
+
+def load_sketch(row):
+    # HeavyHitters of a stored WordSketch row
+    sketch = CountMinSketch.from_bytes(bytes(row.counts), row.width, row.depth, row.total)
+    return HeavyHitters(sketch, settings.TEXT_SKETCH_HEAVY_HITTERS, row.heavy_hitters)
+
+
+def save_sketch(row, hitters):
+    row.width = hitters.sketch.width
+    row.depth = hitters.sketch.depth
+    row.total = hitters.sketch.total
+    row.counts = hitters.sketch.to_bytes()
+    row.heavy_hitters = hitters.candidates
+    row.save()
+
+
+def user_sketch(user_id):
+    # Stored sketch of a user (an empty one if nothing was indexed yet)
+    row = WordSketch.objects.filter(user_id=user_id).first()
+    return load_sketch(row) if row is not None else empty_sketch()
+
+
+def counts_by_user(indexed, paragraphs):
+    # Summed word counts of `paragraphs` (a subset of the indexed
+    # (paragraph, freq) pairs, e.g. the fresh ones), per owner
+    ids = {paragraph.id for paragraph in paragraphs}
+    counts = {}
+    for paragraph, freq in indexed:
+        if paragraph.id in ids:
+            counts.setdefault(paragraph.user_id, Counter()).update(freq)
+    return counts
+
+
+def record_words(user_counts):
+    # Merge {user_id: {word: count}} into the users' stored sketches.
+    # Each row is locked only while its sketch is updated. Every call
+    # rewrites the whole stored sketch (see TEXT_SKETCH_WIDTH).
+    width, depth = _dimensions()
+    for user_id in sorted(user_counts):
+        counts = user_counts[user_id]
+        if not counts:
+            continue
+        with transaction.atomic(using=current_shard()):
+            WordSketch.objects.bulk_create(
+                [WordSketch(user_id=user_id, width=width, depth=depth, counts=empty_sketch().sketch.to_bytes())],
+                ignore_conflicts=True
+            )
+            row = WordSketch.objects.select_for_update().get(user_id=user_id)
+            # Sketch of the batch in the stored dimensions, merged in
+            batch = empty_sketch(row.width, row.depth)
+            batch.update(counts)
+            hitters = load_sketch(row)
+            hitters.merge(batch)
+            save_sketch(row, hitters)
+
+
+def record_words_on_commit(user_counts):
+    # Merge once the surrounding indexing transaction has committed
+    # (a worker dying in between loses the batch from the sketch only)
+    user_counts = {user_id: counts for user_id, counts in user_counts.items() if counts}
+    if not user_counts:
+        return
+    alias = current_shard()
+
+    def merge():
+        with use_shard(alias):
+            record_words(user_counts)
+
+    transaction.on_commit(merge, using=alias)
+
+
+def top_words(user_id, n):
+    # Approximate top-n words of a user with the bounds of their counts
+    hitters = user_sketch(user_id)
+    sketch = hitters.sketch
+    return {
+        "words": [{"word": word, "count": count} for word, count in hitters.top(n)],
+        "total_words": sketch.total,
+        # Each count overestimates the true count by at most error_bound
+        # with probability confidence (Count-Min Sketch guarantee)
+        "error_bound": sketch.error_bound(),
+        "confidence": round(1 - sketch.delta, 4),
+        "approximate": True,
+    }
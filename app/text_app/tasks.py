@@ -1,63 +1,455 @@
-from celery import shared_task
+from celery import chord, shared_task
 # Marks this function as a Celery task for asynchronous execution
+# (chords fan large paragraphs out into chunk tasks)
 
 from collections import Counter
 # Efficient utility for counting word frequencies
 
-import re
-# Regular expressions used for text normalization and tokenization
+import logging
+# Reports batch failures that fall back to single-paragraph tasks
 
-from django.db import transaction
+import threading
+# Detects flushes running on collector timer threads
+
+import time
+# Measures tokenization time saved by the duplicate cache
+
+from django.conf import settings
+# Project settings used for worker batching parameters
+
+from django.db import connections, transaction
 # Ensures database operations execute atomically
 
-from .models import Paragraph, WordFrequency
+from django.db.models.functions import Length, Substr
+# Large paragraphs are measured and read slice by slice in the database
+
+from .batching import ParagraphCollector
+# Worker-side collector that groups single-paragraph tasks into batches
+
+from .corpus import record_indexed, record_reindexed
+# Document lengths and frequencies maintained alongside the index for BM25
+
+from .dedup import content_fingerprint, frequency_cache
+# Reuses frequency tables of previously seen identical paragraphs
+
+from .jobs import complete_paragraphs, record_progress
+# Progress counters of the submission (IngestJob) a task belongs to
+
+from .models import Paragraph, Term, WordFrequency
 # Models used for paragraph storage and frequency indexing
 
+from .postings import append_postings, decode_terms
+# Compressed posting block storage used when TEXT_INDEX_STORAGE = "blocks"
+
+from .search import notify_indexed, notify_reindexed
+from .search.segments import SegmentStore
+# Keeps the configured search engine in sync with committed frequencies
+
+from .sharding import ShardMoving, current_shard, user_shard, user_write_shard
+# Tasks run against the shard holding the paragraph owner's data
+# (and are queued again while rebalance_shard moves that data)
+
+from .sketches import counts_by_user, record_words_on_commit
+# Approximate per-user word counts behind the top-words endpoint
+
+from .terms import resolve_term_ids
+# Interns words into integer term ids through an in-process LRU cache
+
+from .tokenizer import chunk_bounds, count_chunk, count_words, merge_chunks
+# Word counting, whole or in chunks for large paragraphs
+
+
+logger = logging.getLogger(__name__)
+
+# Fields needed to store the index of a paragraph without loading its content
+INDEX_FIELDS = (
+    'id', 'user_id', 'job_id', 'preview', 'fingerprint', 'token_count', 'indexed_terms', 'created_at'
+)
+
+
+def _count_paragraph(paragraph):
+    # Count words, reusing the table of an identical paragraph when cached
+    fingerprint = paragraph.fingerprint or content_fingerprint(paragraph.content)
+
+    cached = frequency_cache.get(fingerprint)
+    if cached is not None:
+        return cached
+
+    started = time.perf_counter()
+    total_words, freq = count_words(paragraph.content)
+    frequency_cache.set(fingerprint, total_words, freq, time.perf_counter() - started)
+    return total_words, freq
+
+
+def _build_rows(paragraph, freq, term_ids):
+    # Prepare frequency records for bulk insertion
+    return [
+        WordFrequency(
+            user_id=paragraph.user_id,
+            paragraph=paragraph,
+            term_id=term_ids[word],
+            count=count
+        )
+        for word, count in freq.items() if word.strip()
+    ]
+
+
+def _store_frequencies(indexed, term_ids):
+    # Persist counted paragraphs with the configured storage mode
+    if settings.TEXT_INDEX_STORAGE == "blocks":
+        append_postings(indexed, term_ids)
+        return
+
+    word_frequencies = []
+    for paragraph, freq in indexed:
+        word_frequencies.extend(_build_rows(paragraph, freq, term_ids))
+
+    # Replace previously stored frequencies of these paragraphs
+    WordFrequency.objects.filter(
+        paragraph_id__in=[paragraph.id for paragraph, _ in indexed]
+    ).delete()
+
+    # Bulk insert for performance when processing large paragraphs
+    if word_frequencies:
+        WordFrequency.objects.bulk_create(
+            word_frequencies,
+            batch_size=settings.TEXT_WORKER_INSERT_BATCH_SIZE
+        )
+
+
+def _index_paragraph(paragraph_id, job_id=None):
+    # Indexing routine for a single paragraph
+    # Raises Paragraph.DoesNotExist so callers can decide how to retry
+
+    # Execute all database operations atomically to maintain consistency
+    alias = current_shard()
+    with transaction.atomic(using=alias):
+        # Lock the paragraph row to prevent concurrent frequency updates
+        paragraph = Paragraph.objects.select_for_update().get(id=paragraph_id)
+        
+        # Compute word occurrence counts efficiently
+        total_words, freq = _count_paragraph(paragraph)
+        
+        # Replace any previously stored frequencies for this paragraph
+        _write_index(paragraph, freq, alias, job_id)
+        
+        # Return structured task result for observability and debugging
+        return {
+            'paragraph_id': paragraph_id,
+            'total_words': total_words,
+            'unique_words': len(freq),
+            'status': 'completed'
+        }
+
+
+def _write_index(paragraph, freq, alias, job_id=None):
+    # Store the counted words of a locked paragraph inside the open transaction
+    term_ids = resolve_term_ids(freq)
+    _store_frequencies([(paragraph, freq)], term_ids)
+    fresh = record_indexed([(paragraph, freq)], term_ids)
+    complete_paragraphs(job_id, [paragraph])
+    if fresh:
+        record_words_on_commit({paragraph.user_id: freq})
+
+    # Update the search engine only once the new rows are visible
+    transaction.on_commit(lambda: notify_indexed([(paragraph, freq)]), using=alias)
+
+
+def _plan_large_paragraph(paragraph_id, user_id, job_id=None):
+    # Count a large paragraph with one task per TEXT_LARGE_CHUNK_CHARS slice
+    # so no single task runs for long; the results are merged and stored
+    # by store_chunked_paragraph once every chunk is counted
+    paragraph = (
+        Paragraph.objects
+        .annotate(length=Length('content'))
+        .only('id', 'fingerprint')
+        .get(id=paragraph_id)
+    )
+
+    cached = frequency_cache.get(paragraph.fingerprint) if paragraph.fingerprint else None
+    if cached is not None:
+        return _store_counted(paragraph_id, paragraph.fingerprint, cached, job_id)
+
+    bounds = chunk_bounds(paragraph.length, settings.TEXT_LARGE_CHUNK_CHARS)
+    if not bounds:
+        return _store_counted(paragraph_id, paragraph.fingerprint, (0, Counter()), job_id)
+
+    store = store_chunked_paragraph.s(paragraph_id, paragraph.fingerprint, user_id=user_id, job_id=job_id)
+    store.on_error(chunked_paragraph_failed.si(paragraph_id, user_id=user_id, job_id=job_id))
+    chord(
+        count_paragraph_chunk.s(paragraph_id, start, length, user_id=user_id)
+        for start, length in bounds
+    )(store)
+    return {
+        'paragraph_id': paragraph_id,
+        'chunks': len(bounds),
+        'status': 'chunked'
+    }
+
+
+def _store_counted(paragraph_id, fingerprint, counted, job_id=None):
+    # Store counts computed outside the transaction, unless the paragraph
+    # was edited since (then None is returned and the caller starts over)
+    total_words, freq = counted
+    alias = current_shard()
+    with transaction.atomic(using=alias):
+        paragraph = (
+            Paragraph.objects
+            .select_for_update()
+            .only(*INDEX_FIELDS)
+            .get(id=paragraph_id)
+        )
+        if paragraph.fingerprint != fingerprint:
+            return None
+
+        _write_index(paragraph, freq, alias, job_id)
+        return {
+            'paragraph_id': paragraph_id,
+            'total_words': total_words,
+            'unique_words': len(freq),
+            'status': 'completed'
+        }
+
+
+def _reindex_paragraph(paragraph_id):
+    # Re-index an edited paragraph by writing only what changed
+    alias = current_shard()
+    with transaction.atomic(using=alias):
+        paragraph = Paragraph.objects.select_for_update().get(id=paragraph_id)
+        total_words, freq = _count_paragraph(paragraph)
+        term_ids = resolve_term_ids(freq)
+
+        if settings.TEXT_INDEX_STORAGE == "blocks":
+            changed, added_words, removed_words, previous_counts = _reindex_blocks(
+                paragraph, freq, term_ids
+            )
+        else:
+            changed, added_words, removed_words, previous_counts = _reindex_rows(
+                paragraph, freq, term_ids
+            )
+        record_reindexed(paragraph, freq, term_ids, added_words, removed_words)
+
+        # The sketch takes the difference between the old and new counts
+        delta = Counter(freq)
+        delta.subtract(previous_counts)
+        record_words_on_commit({paragraph.user_id: {word: count for word, count in delta.items() if count}})
+
+        # Update the search engine only once the new rows are visible
+        transaction.on_commit(
+            lambda: notify_reindexed(paragraph, freq, changed, removed_words),
+            using=alias
+        )
+
+        return {
+            'paragraph_id': paragraph_id,
+            'total_words': total_words,
+            'unique_words': len(freq),
+            'changed_words': len(changed),
+            'removed_words': len(removed_words),
+            'status': 'completed'
+        }
+
+
+def _reindex_rows(paragraph, freq, term_ids):
+    # Diff existing WordFrequency rows against the new counts
+    # Also returns the previous {word: count} of the paragraph
+    existing = {
+        term_id: (row_id, count, word)
+        for row_id, term_id, count, word in (
+            WordFrequency.objects
+            .filter(paragraph_id=paragraph.id)
+            .values_list('id', 'term_id', 'count', 'term__text')
+        )
+    }
+
+    previous_counts = {word: count for _, count, word in existing.values()}
+
+    to_create, to_update = [], []
+    changed = Counter()
+    added_words = []
+    for word, count in freq.items():
+        term_id = term_ids[word]
+        current = existing.pop(term_id, None)
+        if current is None:
+            to_create.append(WordFrequency(
+                user_id=paragraph.user_id, paragraph_id=paragraph.id,
+                term_id=term_id, count=count
+            ))
+            changed[word] = count
+            added_words.append(word)
+        elif current[1] != count:
+            to_update.append(WordFrequency(id=current[0], count=count))
+            changed[word] = count
+
+    # Whatever is left in `existing` disappeared from the paragraph
+    if existing:
+        WordFrequency.objects.filter(id__in=[row[0] for row in existing.values()]).delete()
+    if to_update:
+        WordFrequency.objects.bulk_update(to_update, ['count'])
+    if to_create:
+        WordFrequency.objects.bulk_create(to_create)
+
+    return changed, added_words, [row[2] for row in existing.values()], previous_counts
+
+
+def _reindex_blocks(paragraph, freq, term_ids):
+    # Diff the terms stored with the locked paragraph against the new
+    # counts; only postings whose count changed move.
+    # Also returns the previous {word: count} of the paragraph
+    indexed_terms = decode_terms(paragraph.indexed_terms)
+    words = dict(Term.objects.filter(id__in=list(indexed_terms)).values_list('id', 'text'))
+    previous_counts = {words[term_id]: count for term_id, count in indexed_terms.items()}
+
+    removed_words = [word for word in previous_counts if word not in freq]
+    changed = Counter({
+        word: count for word, count in freq.items()
+        if previous_counts.get(word) != count
+    })
+
+    append_postings([(paragraph, freq)], term_ids)
+
+    added_words = [word for word in freq if word not in previous_counts]
+    return changed, added_words, removed_words, previous_counts
+
+
+def _index_batch(paragraph_ids, job_id=None):
+    # Indexing routine for many paragraphs at once:
+    # one SELECT, one DELETE and one bulk INSERT for the whole batch
+    # Returns the ids that were indexed and the ids that were not found
+
+    alias = current_shard()
+    with transaction.atomic(using=alias):
+        # Lock all paragraph rows of the batch in a single query
+        paragraphs = list(
+            Paragraph.objects
+            .select_for_update()
+            .filter(id__in=paragraph_ids)
+            .only('content', *INDEX_FIELDS)
+        )
+
+        # Tokenize every paragraph before touching the frequency table
+        indexed = []
+        for paragraph in paragraphs:
+            _, freq = _count_paragraph(paragraph)
+            indexed.append((paragraph, freq))
+
+        # Resolve term ids for the whole batch at once
+        term_ids = resolve_term_ids(set().union(*(freq for _, freq in indexed)))
+
+        # Replace previously stored frequencies for the whole batch
+        _store_frequencies(indexed, term_ids)
+        fresh = record_indexed(indexed, term_ids)
+        complete_paragraphs(job_id, paragraphs)
+        record_words_on_commit(counts_by_user(indexed, fresh))
+        indexed_ids = [paragraph.id for paragraph in paragraphs]
+
+        # Update the search engine only once the new rows are visible
+        transaction.on_commit(lambda: notify_indexed(indexed), using=alias)
+
+    missing_ids = sorted(set(paragraph_ids) - set(indexed_ids))
+    return indexed_ids, missing_ids
+
+
+def _flush_collected(entries):
+    # Flush callback of the worker collector; entries are (paragraph_id, user_id,
+    # job_id) tuples, indexed with one batch per owning user and job
+    by_owner = {}
+    for paragraph_id, user_id, job_id in entries:
+        by_owner.setdefault((user_id, job_id), []).append(paragraph_id)
+
+    for (user_id, job_id), paragraph_ids in by_owner.items():
+        try:
+            with user_write_shard(user_id):
+                _, missing_ids = _index_batch(paragraph_ids, job_id)
+        except ShardMoving:
+            missing_ids = paragraph_ids
+        except Exception:
+            logger.exception("Batch indexing failed, falling back to single tasks")
+            missing_ids = paragraph_ids
+
+        # Unresolved paragraphs go back through the regular retrying task
+        for paragraph_id in missing_ids:
+            compute_frequency.delay(paragraph_id, allow_batching=False, user_id=user_id, job_id=job_id)
+
+    # Timer-triggered flushes run on short-lived threads; release their connection
+    if threading.current_thread() is not threading.main_thread():
+        connections.close_all()
+
+
+_collector = None
+
+
+def _defer(task):
+    # Queue the running task again once its user's move to another shard
+    # is expected to be over; a move is not a failure, so the copy keeps
+    # the retry count of this attempt
+    task.apply_async(
+        task.request.args,
+        task.request.kwargs,
+        countdown=settings.TEXT_SHARD_MOVE_RETRY_SECONDS,
+        retries=task.request.retries,
+        queue=(task.request.delivery_info or {}).get('routing_key')
+    )
+    return {'status': 'deferred'}
+
+
+def _retry(task, countdown, user_id=None, job_id=None, exc=None):
+    # Retry a single-paragraph task, counting the paragraph as retrying on
+    # its first retry and as failed once its retries are exhausted
+    retries = task.request.retries
+    try:
+        with user_write_shard(user_id):
+            if retries >= task.max_retries:
+                record_progress(job_id, failed=1, retrying=-1 if retries else 0)
+            elif retries == 0:
+                record_progress(job_id, retrying=1)
+    except ShardMoving:
+        _defer(task)
+        return
+    task.retry(countdown=countdown, exc=exc)
+
+
+def get_collector():
+    # Lazily create one collector per worker process
+    # (prefork children each build their own after fork)
+    global _collector
+    if _collector is None:
+        _collector = ParagraphCollector(
+            _flush_collected,
+            max_size=settings.TEXT_WORKER_BATCH_MAX_SIZE,
+            max_wait_ms=settings.TEXT_WORKER_BATCH_WAIT_MS
+        )
+    return _collector
+
 
 @shared_task(bind=True, max_retries=3)
 # bind=True allows access to task instance for retries and metadata
-def compute_frequency(self, paragraph_id):
+def compute_frequency(self, paragraph_id, allow_batching=True, user_id=None, job_id=None):
+    # user_id selects the owner's shard (None: the first shard)
+    # job_id is the submission whose progress counters are updated
+    # Optionally group single-paragraph tasks into worker-side micro-batches
+    # (the task is acknowledged before the batch is written; see
+    # TEXT_WORKER_MICROBATCH and the requeue_unindexed command)
+    if allow_batching and settings.TEXT_WORKER_MICROBATCH:
+        get_collector().add((paragraph_id, user_id, job_id))
+        return {
+            'paragraph_id': paragraph_id,
+            'status': 'batched'
+        }
+
     try:
-        # Execute all database operations atomically to maintain consistency
-        with transaction.atomic():
-            # Lock the paragraph row to prevent concurrent frequency updates
-            paragraph = Paragraph.objects.select_for_update().get(id=paragraph_id)
-            
-            # Normalize text and extract alphabetic words only
-            words = re.findall(r'\b[a-zA-Z]+\b', paragraph.content.lower())
-            
-            # Compute word occurrence counts efficiently
-            freq = Counter(words)
-            
-            # Remove any previously stored frequencies for this paragraph
-            WordFrequency.objects.filter(paragraph=paragraph).delete()
-            
-            # Prepare new frequency records for bulk insertion
-            word_frequencies = [
-                WordFrequency(
-                    user=paragraph.user,
-                    paragraph=paragraph,
-                    word=word,
-                    count=count
-                )
-                for word, count in freq.items() if word.strip()
-            ]
-            
-            # Bulk insert for performance when processing large paragraphs
-            if word_frequencies:
-                WordFrequency.objects.bulk_create(word_frequencies)
-            
-            # Return structured task result for observability and debugging
-            return {
-                'paragraph_id': paragraph_id,
-                'total_words': len(words),
-                'unique_words': len(freq),
-                'status': 'completed'
-            }
+        with user_write_shard(user_id):
+            result = _index_paragraph(paragraph_id, job_id)
+            if self.request.retries:
+                record_progress(job_id, retrying=-1)
+            return result
+
+    except ShardMoving:
+        return _defer(self)
     
     except Paragraph.DoesNotExist:
         # Retry task if paragraph is not yet committed or temporarily unavailable
-        self.retry(countdown=5, max_retries=3)
+        _retry(self, 5, user_id, job_id)
         return {
             'paragraph_id': paragraph_id,
             'status': 'retrying',
@@ -66,9 +458,154 @@ def compute_frequency(self, paragraph_id):
     
     except Exception as e:
         # Retry on unexpected failures with backoff for resilience
-        self.retry(countdown=10, max_retries=3, exc=e)
+        _retry(self, 10, user_id, job_id, exc=e)
         return {
             'paragraph_id': paragraph_id,
             'status': 'error',
             'error': str(e)
-        }
\ No newline at end of file
+        }
+
+
+@shared_task(bind=True, max_retries=3)
+# Re-indexes an edited paragraph with delta writes
+def reindex_paragraph(self, paragraph_id, previous_counts=None, user_id=None):
+    # previous_counts is ignored; it is still accepted for messages queued
+    # before the old counts were read from the paragraph's stored terms
+    try:
+        with user_write_shard(user_id):
+            return _reindex_paragraph(paragraph_id)
+
+    except ShardMoving:
+        return _defer(self)
+
+    except Paragraph.DoesNotExist:
+        # The paragraph was deleted after the edit; nothing left to index
+        return {
+            'paragraph_id': paragraph_id,
+            'status': 'missing'
+        }
+
+    except Exception as e:
+        # Retry on unexpected failures with backoff for resilience
+        self.retry(countdown=10, max_retries=3, exc=e)
+
+
+@shared_task
+# Processes many paragraph ids delivered in a single broker message
+def compute_frequency_batch(paragraph_ids, user_id=None, job_id=None):
+    # All paragraphs of a batch belong to `user_id` (None: the first shard)
+    # and to the submission `job_id`
+    try:
+        with user_write_shard(user_id):
+            indexed_ids, missing_ids = _index_batch(paragraph_ids, job_id)
+    except ShardMoving:
+        return _defer(compute_frequency_batch)
+    except Exception:
+        # Fall back to single-paragraph tasks so one bad row
+        # does not fail the whole batch
+        logger.exception("Batch indexing failed, falling back to single tasks")
+        indexed_ids, missing_ids = [], list(paragraph_ids)
+
+    # Hand unresolved paragraphs to the single-paragraph task
+    # so they get the same retry and backoff behaviour as before
+    for paragraph_id in missing_ids:
+        compute_frequency.delay(paragraph_id, allow_batching=False, user_id=user_id, job_id=job_id)
+
+    # Summarize the batch instead of returning one result per paragraph
+    return {
+        'paragraph_count': len(paragraph_ids),
+        'completed': len(indexed_ids),
+        'requeued': missing_ids,
+        'status': 'completed'
+    }
+
+
+@shared_task(bind=True, max_retries=3, acks_late=True)
+# Indexes a paragraph above TEXT_LARGE_PARAGRAPH_CHARS on the "large" queue
+def index_large_paragraph(self, paragraph_id, user_id=None, job_id=None):
+    try:
+        with user_write_shard(user_id):
+            result = _plan_large_paragraph(paragraph_id, user_id, job_id)
+            if self.request.retries:
+                record_progress(job_id, retrying=-1)
+            return result
+
+    except ShardMoving:
+        return _defer(self)
+
+    except Paragraph.DoesNotExist:
+        # Retry task if paragraph is not yet committed or temporarily unavailable
+        _retry(self, 5, user_id, job_id)
+
+
+@shared_task(acks_late=True, ignore_result=False)
+# Counts the words of one slice (results are collected by the chord) of a large paragraph
+def count_paragraph_chunk(paragraph_id, start, length, user_id=None):
+    # Only the slice is read, never the whole content
+    with user_shard(user_id):
+        text = (
+            Paragraph.objects
+            .filter(id=paragraph_id)
+            .annotate(part=Substr('content', start + 1, length))
+            .values_list('part', flat=True)
+            .first()
+        ) or ""
+
+    started = time.perf_counter()
+    part = count_chunk(text)
+    part['seconds'] = time.perf_counter() - started
+    return part
+
+
+@shared_task(acks_late=True)
+# Merges the chunk counts of a large paragraph and stores its index
+def store_chunked_paragraph(parts, paragraph_id, fingerprint, user_id=None, job_id=None):
+    total_words, freq = merge_chunks(parts)
+    try:
+        with user_write_shard(user_id):
+            result = _store_counted(paragraph_id, fingerprint, (total_words, freq), job_id)
+    except ShardMoving:
+        return _defer(store_chunked_paragraph)
+    except Paragraph.DoesNotExist:
+        # Deleted while its chunks were being counted
+        with user_write_shard(user_id):
+            record_progress(job_id, failed=1)
+        return {
+            'paragraph_id': paragraph_id,
+            'status': 'missing'
+        }
+
+    if result is None:
+        # Edited while its chunks were being counted: count the new content
+        index_large_paragraph.delay(paragraph_id, user_id=user_id, job_id=job_id)
+        return {
+            'paragraph_id': paragraph_id,
+            'status': 'replanned'
+        }
+
+    if fingerprint:
+        seconds = sum(part.get('seconds', 0) for part in parts)
+        frequency_cache.set(fingerprint, total_words, freq, seconds)
+    return result
+
+
+@shared_task(acks_late=True)
+# Error callback of the chunk chord: the large paragraph could not be indexed
+def chunked_paragraph_failed(paragraph_id, user_id=None, job_id=None):
+    logger.error("Chunked indexing of paragraph %s failed", paragraph_id)
+    try:
+        with user_write_shard(user_id):
+            record_progress(job_id, failed=1)
+    except ShardMoving:
+        _defer(chunked_paragraph_failed)
+
+
+@shared_task
+# Compacts a user's small index segments (SegmentSearchEngine) in the background
+def merge_segments(user_id):
+    merges = SegmentStore().merge(user_id)
+    return {
+        'user_id': user_id,
+        'merges': merges,
+        'status': 'completed'
+    }
@@ -0,0 +1,130 @@
+from collections import OrderedDict
+# Ordered mapping used as a least-recently-used cache
+
+import threading
+# Protects the cache when resolved from several threads
+
+from django.conf import settings
+from django.db import transaction
+
+from .models import Term
+from .sharding import current_shard
+
+# Database allocating term ids; shards hold copies of the terms they use
+TERM_DATABASE = "default"
+
+
+class TermCache:
+    """
+    Bounded in-process LRU cache mapping normalized words to Term ids.
+
+    Misses are resolved in bulk: one SELECT for known terms and one
+    INSERT for new ones, so a paragraph costs at most two queries no
+    matter how many distinct words it contains.
+    """
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self._ids = OrderedDict()
+        self._lock = threading.Lock()
+
+    def resolve(self, words):
+        # Return {word: term_id} for every word, creating missing terms
+        term_ids, missing = self._lookup(words)
+
+        if missing:
+            found = dict(Term.objects.filter(text__in=missing).values_list("text", "id"))
+
+            # Sorted so concurrent inserts of overlapping words take their
+            # unique-index locks in the same order and cannot deadlock
+            new_words = sorted(word for word in missing if word not in found)
+            if new_words:
+                # Concurrent workers may insert the same terms; conflicts are ignored
+                Term.objects.bulk_create(
+                    [Term(text=word) for word in new_words],
+                    ignore_conflicts=True
+                )
+                created = dict(Term.objects.filter(text__in=new_words).values_list("text", "id"))
+
+                # Ids inserted by this transaction are cached only once committed
+                transaction.on_commit(lambda: self._store(created))
+                term_ids.update(created)
+
+            self._store(found)
+            term_ids.update(found)
+
+        self._replicate(term_ids)
+        return term_ids
+
+    def lookup(self, word):
+        # Return the id of an existing term, or None if the word was never indexed
+        term_ids, missing = self._lookup([word])
+        if not missing:
+            return term_ids[word]
+
+        term_id = Term.objects.filter(text=word).values_list("id", flat=True).first()
+        if term_id is not None:
+            self._store({word: term_id})
+        return term_id
+
+    async def alookup(self, word):
+        # Async variant of lookup() for ASGI views
+        term_ids, missing = self._lookup([word])
+        if not missing:
+            return term_ids[word]
+
+        term_id = await Term.objects.filter(text=word).values_list("id", flat=True).afirst()
+        if term_id is not None:
+            self._store({word: term_id})
+        return term_id
+
+    def clear(self):
+        with self._lock:
+            self._ids.clear()
+
+    def _replicate(self, term_ids):
+        # Copy terms to the active shard so its frequency rows can reference
+        # and join them locally (ids are always allocated on TERM_DATABASE)
+        alias = current_shard()
+        if alias == TERM_DATABASE or not term_ids:
+            return
+        Term.objects.using(alias).bulk_create(
+            [Term(id=term_id, text=word) for word, term_id in sorted(term_ids.items())],
+            ignore_conflicts=True
+        )
+
+    def _lookup(self, words):
+        # Split words into cached ids and misses
+        term_ids = {}
+        missing = []
+        with self._lock:
+            for word in words:
+                term_id = self._ids.get(word)
+                if term_id is None:
+                    missing.append(word)
+                else:
+                    self._ids.move_to_end(word)
+                    term_ids[word] = term_id
+        return term_ids, missing
+
+    def _store(self, term_ids):
+        with self._lock:
+            self._ids.update(term_ids)
+            while len(self._ids) > self.max_size:
+                self._ids.popitem(last=False)
+
+
+term_cache = TermCache(getattr(settings, "TEXT_TERM_CACHE_SIZE", 100000))
+# Process-wide cache shared by the worker tasks and the Search view
+
+
+def resolve_term_ids(words):
+    return term_cache.resolve(words)
+
+
+def lookup_term_id(word):
+    return term_cache.lookup(word)
+
+
+async def alookup_term_id(word):
+    return await term_cache.alookup(word)
@@ -0,0 +1,30 @@
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import TransactionTestCase
+
+from core.celery import app as celery_app
+
+from text_app.dedup import frequency_cache
+from text_app.terms import term_cache
+
+
+class ShardedTestCase(TransactionTestCase):
+    # Runs on every configured database (see core.test_settings) with
+    # Celery tasks executed in the calling thread. Writes are committed so
+    # the read replicas (separate connections) see them.
+    databases = "__all__"
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        celery_app.conf.task_always_eager = True
+        celery_app.conf.task_eager_propagates = True
+
+    def setUp(self):
+        # Process-wide caches would otherwise keep ids of rolled back rows
+        cache.clear()
+        term_cache.clear()
+        frequency_cache.clear()
+
+    def create_user(self, username="alice"):
+        return get_user_model().objects.create_user(username, password="Secret@12345")
@@ -0,0 +1,34 @@
+from django.test import Client
+
+from auth_app.tokens import issue_token
+
+from .base import ShardedTestCase
+
+
+class AsyncSubmitTests(ShardedTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.user = self.create_user()
+        self.client = Client(enforce_csrf_checks=True)
+
+    def post(self, **headers):
+        return self.client.post(
+            "/api/text/async/submit/", {"paragraphs": ["alpha beta"]},
+            content_type="application/json", headers=headers
+        )
+
+    def test_session_requests_need_a_csrf_token(self):
+        self.client.force_login(self.user)
+        self.assertEqual(self.post().status_code, 403)
+
+        # Cookie and header carrying the same secret pass the check
+        self.client.cookies["csrftoken"] = "a" * 32
+        self.assertEqual(self.post(**{"X-CSRFToken": "a" * 32}).status_code, 202)
+
+    def test_bearer_tokens_need_no_csrf_token(self):
+        response = self.post(Authorization=f"Bearer {issue_token(self.user)}")
+        self.assertEqual(response.status_code, 202)
+
+    def test_anonymous_requests_are_rejected(self):
+        self.assertEqual(self.post().status_code, 403)
@@ -0,0 +1,35 @@
+from unittest import mock
+
+from text_app.dedup import FREQ_CACHE_LOOKUPS, FrequencyCache
+
+from .base import ShardedTestCase
+
+
+class FrequencyCacheStatsTests(ShardedTestCase):
+
+    def test_lookups_reach_redis_in_batches(self):
+        cache = FrequencyCache(10, 100, redis_url="memory://")
+        cache.redis.delete(cache.STATS_KEY)
+        cache.set("a", 3, {"x": 3}, 0.5)
+
+        with mock.patch.object(cache.redis, "pipeline", wraps=cache.redis.pipeline) as pipeline:
+            for _ in range(cache.STATS_FLUSH_LOOKUPS - 1):
+                cache.get("a")
+            cache.get("b")
+        self.assertEqual(pipeline.call_count, 1)
+
+        cache.get("a")
+        stats = cache.stats()
+        self.assertEqual((stats["hits"], stats["misses"]), (cache.STATS_FLUSH_LOOKUPS, 1))
+        self.assertEqual(stats["saved_seconds"], cache.STATS_FLUSH_LOOKUPS * 0.5)
+
+    def test_lookups_are_exported_as_metrics(self):
+        before = FREQ_CACHE_LOOKUPS._values.get(("hit",), 0)
+        cache = FrequencyCache(10, 100)
+        cache.set("a", 3, {"x": 3}, 0.5)
+        cache.get("a")
+        self.assertEqual(FREQ_CACHE_LOOKUPS._values[("hit",)] - before, 1)
+
+    def test_endpoint_requires_the_shared_tier(self):
+        self.client.force_login(self.create_user())
+        self.assertEqual(self.client.get("/api/text/stats/dedup/").status_code, 503)
@@ -0,0 +1,53 @@
+from unittest import mock
+
+from django.core.management import call_command
+
+from text_app.tasks import compute_frequency_batch
+
+from .base import ShardedTestCase
+
+
+class IngestJobProgressTests(ShardedTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.user = self.create_user()
+        self.client.force_login(self.user)
+
+    def submit_queued(self, texts):
+        # Submit while holding back the indexing tasks
+        with mock.patch.object(compute_frequency_batch, "delay") as delay:
+            response = self.client.post(
+                "/api/text/submit/", {"paragraphs": texts}, content_type="application/json"
+            ).json()
+        return response, [call.args + (call.kwargs,) for call in delay.call_args_list]
+
+    def run_queued(self, queued):
+        for paragraph_ids, kwargs in queued:
+            compute_frequency_batch.apply((paragraph_ids,), kwargs)
+
+    def status(self, job_id):
+        return self.client.get(f"/api/text/jobs/{job_id}/").json()
+
+    def test_redelivered_batches_count_once(self):
+        response, queued = self.submit_queued(["alpha", "beta"])
+        self.run_queued(queued)
+        self.run_queued(queued)
+        status = self.status(response["job_id"])
+        self.assertEqual((status["completed"], status["done"]), (2, True))
+
+    def test_paragraph_edited_before_indexing_completes_the_job(self):
+        response, queued = self.submit_queued(["alpha", "beta"])
+        edited = self.client.patch(
+            f"/api/text/paragraphs/{response['paragraph_ids'][0]}/", {"content": "gamma"},
+            content_type="application/json"
+        )
+        self.assertEqual(edited.status_code, 202)
+        self.run_queued(queued)
+        self.assertTrue(self.status(response["job_id"])["done"])
+
+    def test_paragraph_recounted_before_indexing_completes_the_job(self):
+        response, queued = self.submit_queued(["alpha", "beta"])
+        call_command("rebuild_corpus_stats", stdout=mock.Mock())
+        self.run_queued(queued)
+        self.assertTrue(self.status(response["job_id"])["done"])
@@ -0,0 +1,77 @@
+from django.test import AsyncClient, SimpleTestCase, override_settings
+
+from auth_app.tokens import issue_token
+from core.metrics import REQUEST_LATENCY, REQUEST_QUERIES, QueryRecorder, record_queries
+from text_app.models import Paragraph
+from text_app.sharding import shard_aliases
+
+from .base import ShardedTestCase
+
+
+def _queries(view):
+    return REQUEST_QUERIES._values.get((view,), 0)
+
+
+def _requests(view):
+    state = REQUEST_LATENCY._values.get((view, "GET", 200))
+    return state[2] if state else 0
+
+
+class MetricsMiddlewareTests(ShardedTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.user = self.create_user()
+        self.token = issue_token(self.user)
+
+    def test_recorder_wraps_every_database(self):
+        recorder = QueryRecorder()
+        with record_queries(recorder):
+            for alias in shard_aliases():
+                Paragraph.objects.using(alias).count()
+        self.assertEqual(recorder.queries, len(shard_aliases()))
+
+        # Removed again on exit
+        Paragraph.objects.using(shard_aliases()[-1]).count()
+        self.assertEqual(recorder.queries, len(shard_aliases()))
+
+    def test_counts_request_queries(self):
+        self.client.force_login(self.user)
+        view = "api/text/search/"
+        before = _queries(view)
+        response = self.client.get("/api/text/search/", {"word": "alpha"})
+        self.assertEqual(response.status_code, 200)
+        self.assertGreater(_queries(view) - before, 1)
+
+    async def test_records_async_requests(self):
+        view = "api/text/async/search/"
+        before_queries, before_requests = _queries(view), _requests(view)
+        response = await AsyncClient().get(
+            "/api/text/async/search/", {"word": "alpha"}, headers={"Authorization": f"Bearer {self.token}"}
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(_requests(view) - before_requests, 1)
+        self.assertGreater(_queries(view) - before_queries, 0)
+
+
+@override_settings(METRICS_ALLOWED_IPS=["10.0.0.5"], METRICS_TOKEN="scrape-secret")
+class MetricsEndpointTests(SimpleTestCase):
+
+    def test_hidden_from_other_clients(self):
+        self.assertEqual(self.client.get("/metrics").status_code, 404)
+        response = self.client.get("/metrics", headers={"Authorization": "Bearer wrong"})
+        self.assertEqual(response.status_code, 404)
+
+    def test_served_to_allowed_addresses(self):
+        response = self.client.get("/metrics", REMOTE_ADDR="10.0.0.5")
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b"http_request_duration_seconds", response.content)
+
+    def test_served_with_the_token(self):
+        response = self.client.get("/metrics", headers={"Authorization": "Bearer scrape-secret"})
+        self.assertEqual(response.status_code, 200)
+
+    @override_settings(METRICS_TOKEN=None)
+    def test_no_token_configured(self):
+        response = self.client.get("/metrics", headers={"Authorization": "Bearer "})
+        self.assertEqual(response.status_code, 404)
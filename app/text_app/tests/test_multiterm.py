@@ -0,0 +1,65 @@
+import random
+from collections import Counter
+
+from django.test import override_settings
+
+from text_app.models import Paragraph, Term
+from text_app.multiterm import top_k
+from text_app.sharding import user_shard
+
+from .base import ShardedTestCase
+
+
+WORDS = ["alpha", "beta", "gamma", "delta"]
+
+
+class TopKTests(ShardedTestCase):
+    # The early-terminating top-k must return what scoring every paragraph would
+
+    def setUp(self):
+        super().setUp()
+        self.user = self.create_user()
+        self.client.force_login(self.user)
+        generator = random.Random(3)
+        # Few words and short paragraphs: many equal sums, broken by paragraph id
+        self.texts = [
+            " ".join(generator.choice(WORDS) for _ in range(generator.randint(1, 4)))
+            for _ in range(60)
+        ]
+        self.ids = self.client.post(
+            "/api/text/submit/", {"paragraphs": self.texts}, content_type="application/json"
+        ).json()["paragraph_ids"]
+
+    def exhaustive(self, words, operator, limit):
+        ranked = []
+        for paragraph_id, text in zip(self.ids, self.texts):
+            freq = Counter(text.split())
+            counts = {word: freq[word] for word in words if freq[word]}
+            if len(counts) < (len(words) if operator == "AND" else 1):
+                continue
+            ranked.append((-sum(counts.values()), paragraph_id, counts))
+        return [(paragraph_id, counts) for _, paragraph_id, counts in sorted(ranked, key=lambda e: e[:2])[:limit]]
+
+    def test_matches_exhaustive_ranking(self):
+        with user_shard(self.user.id):
+            terms = dict(Term.objects.filter(text__in=WORDS).values_list("text", "id"))
+            for words in (["alpha"], ["alpha", "beta"], ["beta", "gamma", "delta"]):
+                for operator in ("OR", "AND"):
+                    for limit in (1, 3, 10, 100):
+                        with self.subTest(words=words, operator=operator, limit=limit):
+                            found = top_k(self.user.id, {word: terms[word] for word in words}, operator, limit)
+                            self.assertEqual(found, self.exhaustive(words, operator, limit))
+
+    def test_scores_come_from_the_postings_not_the_bodies(self):
+        with user_shard(self.user.id):
+            terms = dict(Term.objects.filter(text__in=["alpha", "beta"]).values_list("text", "id"))
+            # Bodies changed behind the index's back are not re-read
+            Paragraph.objects.filter(user_id=self.user.id).update(content="omega")
+            found = top_k(self.user.id, terms, "OR", 5)
+        self.assertEqual(found, self.exhaustive(["alpha", "beta"], "OR", 5))
+
+
+@override_settings(TEXT_INDEX_STORAGE="blocks", TEXT_POSTING_BLOCK_SIZE=4)
+class BlockTopKTests(TopKTests):
+    # Counts of candidates come from the paragraphs' stored terms
+    pass
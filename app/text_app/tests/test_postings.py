@@ -0,0 +1,97 @@
+from django.test import SimpleTestCase, override_settings
+
+from text_app.ingest import create_paragraphs
+from text_app.models import PostingBlock
+from text_app.postings import decode_postings, decode_terms, encode_postings, encode_terms, top_postings
+from text_app.sharding import user_shard, user_write_shard
+from text_app.terms import lookup_term_id
+
+from .base import ShardedTestCase
+
+
+class EncodingTests(SimpleTestCase):
+
+    def test_postings_round_trip(self):
+        # Counts only drop; ids jump both ways and cross varint byte boundaries
+        postings = [(2 ** 40, 2 ** 21), (5, 16384), (16388, 16384), (127, 128), (128, 127), (1, 1), (0, 0)]
+        self.assertEqual(decode_postings(encode_postings(postings)), postings)
+        self.assertEqual(decode_postings(encode_postings([])), [])
+
+    def test_postings_are_delta_encoded(self):
+        # One byte per field once the first posting is written
+        postings = [(1000, 500)] + [(1000 + i, 500 - i) for i in range(1, 50)]
+        self.assertEqual(len(encode_postings(postings)), 4 + 2 * 49)
+
+    def test_terms_round_trip(self):
+        terms = {300: 1, 5: 70000, 128: 2, 2 ** 33: 4}
+        data = encode_terms(terms)
+        self.assertEqual(decode_terms(data), terms)
+        self.assertEqual(list(decode_terms(data)), sorted(terms))
+        self.assertEqual(decode_terms(memoryview(data)), terms)
+        self.assertEqual(decode_terms(None), {})
+
+
+@override_settings(TEXT_INDEX_STORAGE="blocks", TEXT_POSTING_BLOCK_SIZE=2)
+class PostingBlockTests(ShardedTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.user = self.create_user()
+        self.client.force_login(self.user)
+
+    def submit(self, texts):
+        with user_write_shard(self.user.id):
+            return create_paragraphs(self.user, texts)
+
+    def blocks(self, word):
+        with user_shard(self.user.id):
+            return list(
+                PostingBlock.objects
+                .filter(user_id=self.user.id, term_id=lookup_term_id(word))
+                .order_by('-max_count', 'first_id')
+            )
+
+    def assert_blocks(self, word, expected):
+        blocks = self.blocks(word)
+        postings = []
+        for block in blocks:
+            decoded = decode_postings(block.data)
+            self.assertTrue(1 <= len(decoded) <= 2)
+            self.assertEqual(block.size, len(decoded))
+            self.assertEqual((block.first_id, block.max_count), decoded[0])
+            self.assertEqual((block.last_id, block.min_count), decoded[-1])
+            postings.extend(decoded)
+        self.assertEqual(postings, expected)
+        return blocks
+
+    def test_posting_lists_are_split_into_sorted_blocks(self):
+        ids = self.submit(["alpha", "alpha alpha alpha", "alpha alpha", "alpha", "alpha alpha"])
+        expected = [(ids[1], 3), (ids[2], 2), (ids[4], 2), (ids[0], 1), (ids[3], 1)]
+        self.assertEqual(len(self.assert_blocks("alpha", expected)), 3)
+
+        # Overflowing blocks split again as later batches arrive
+        more = self.submit(["alpha alpha alpha alpha", "alpha alpha"])
+        expected = [(more[0], 4), (ids[1], 3), (ids[2], 2), (ids[4], 2), (more[1], 2), (ids[0], 1), (ids[3], 1)]
+        self.assert_blocks("alpha", expected)
+
+        with user_shard(self.user.id):
+            self.assertEqual(top_postings(self.user.id, lookup_term_id("alpha"), limit=3), expected[:3])
+            self.assertEqual(
+                top_postings(self.user.id, lookup_term_id("alpha"), limit=10, after=(2, ids[4])),
+                expected[4:]
+            )
+
+    def test_edits_move_postings_between_blocks(self):
+        ids = self.submit(["alpha", "alpha alpha", "alpha alpha alpha"])
+        self.client.patch(
+            f"/api/text/paragraphs/{ids[0]}/", {"content": "alpha alpha alpha alpha"}, content_type="application/json"
+        )
+        self.assert_blocks("alpha", [(ids[0], 4), (ids[2], 3), (ids[1], 2)])
+
+        # Removing every posting of a block deletes it
+        for paragraph_id in ids:
+            self.client.patch(
+                f"/api/text/paragraphs/{paragraph_id}/", {"content": "beta"}, content_type="application/json"
+            )
+        self.assertEqual(self.blocks("alpha"), [])
+        self.assert_blocks("beta", [(ids[0], 1), (ids[1], 1), (ids[2], 1)])
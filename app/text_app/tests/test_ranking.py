@@ -0,0 +1,85 @@
+import random
+
+from django.conf import settings
+from django.db import connections
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+
+from text_app import ranking
+from text_app.models import CorpusStats, DocumentFrequency, Paragraph, Term
+from text_app.sharding import shard_for_user, user_shard
+
+from .base import ShardedTestCase
+
+
+class BM25Tests(ShardedTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.user = self.create_user()
+        self.client.force_login(self.user)
+        generator = random.Random(7)
+        texts = [
+            " ".join(["alpha"] * generator.randint(1, 6) + ["filler"] * generator.randint(0, 30))
+            for _ in range(40)
+        ]
+        response = self.client.post(
+            "/api/text/submit/", {"paragraphs": texts}, content_type="application/json"
+        )
+        self.assertEqual(response.status_code, 202)
+
+    def expected(self, limit):
+        # Every posting scored, best first
+        stats = CorpusStats.objects.get(user_id=self.user.id)
+        average = stats.average_length
+        k1, b = settings.TEXT_BM25_K1, settings.TEXT_BM25_B
+        scored = []
+        for paragraph in Paragraph.objects.filter(user_id=self.user.id):
+            count = paragraph.content.split().count("alpha")
+            score = count * (k1 + 1) / (count + k1 * (1 - b + b * paragraph.token_count / average))
+            scored.append((-score, paragraph.id))
+        return [paragraph_id for _, paragraph_id in sorted(scored)[:limit]]
+
+    def ranked(self, limit):
+        with user_shard(self.user.id):
+            term_id = Term.objects.get(text="alpha").id
+            hits = ranking.bm25_page(self.user.id, term_id, limit)
+            expected = self.expected(limit)
+        return [hit["paragraph_id"] for hit in hits], expected
+
+    def test_rows_match_scoring_every_posting(self):
+        for limit in (1, 5, 40):
+            with self.subTest(limit=limit):
+                hits, expected = self.ranked(limit)
+                self.assertEqual(hits, expected)
+
+    def test_rows_stop_before_the_end_of_the_term(self):
+        # Two rows per page: reading the whole term would take 20 pages
+        original = ranking.CANDIDATE_PAGE_SIZE
+        ranking.CANDIDATE_PAGE_SIZE = 2
+        try:
+            with user_shard(self.user.id):
+                term_id = Term.objects.get(text="alpha").id
+                with CaptureQueriesContext(connections[shard_for_user(self.user.id)]) as queries:
+                    hits = ranking.bm25_page(self.user.id, term_id, 3)
+                expected = self.expected(3)
+        finally:
+            ranking.CANDIDATE_PAGE_SIZE = original
+        self.assertEqual([hit["paragraph_id"] for hit in hits], expected)
+        self.assertLess(len(queries), 20)
+
+    def test_document_frequencies(self):
+        with user_shard(self.user.id):
+            frequencies = dict(
+                DocumentFrequency.objects.filter(user_id=self.user.id)
+                .values_list("term__text", "paragraph_count")
+            )
+            with_filler = Paragraph.objects.filter(content__contains="filler").count()
+        self.assertEqual(frequencies["alpha"], 40)
+        self.assertEqual(frequencies.get("filler", 0), with_filler)
+
+
+@override_settings(TEXT_INDEX_STORAGE="blocks", TEXT_POSTING_BLOCK_SIZE=2)
+class BlockBM25Tests(BM25Tests):
+    # The same rankings read from posting blocks
+    pass
@@ -0,0 +1,152 @@
+from unittest import mock
+
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db.models import F
+
+from text_app.management.commands.rebalance_shard import Command
+from text_app.models import CorpusStats, IngestJob, Paragraph, Term, WordFrequency
+from text_app.sharding import (
+    ShardMoving, begin_writes, end_writes, set_moving, shard_aliases, shard_for_user, use_shard,
+    user_write_shard,
+)
+from text_app.tasks import _index_batch, compute_frequency
+
+from .base import ShardedTestCase
+
+
+# Columns compared between the source and the target after a move
+COMPARED = {
+    Paragraph: ("id", "content", "token_count", "created_at"),
+    WordFrequency: ("id", "paragraph_id", "term_id", "count", "created_at"),
+    CorpusStats: ("user_id", "paragraph_count", "total_tokens"),
+    IngestJob: ("id", "completed", "failed", "created_at", "updated_at"),
+}
+
+
+class RebalanceShardTests(ShardedTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.user = self.create_user()
+        self.source = shard_for_user(self.user.id)
+        self.target = next(alias for alias in shard_aliases() if alias != self.source)
+        self.client.force_login(self.user)
+
+    def submit(self, texts):
+        response = self.client.post(
+            "/api/text/submit/", {"paragraphs": texts}, content_type="application/json"
+        )
+        self.assertEqual(response.status_code, 202)
+        return response.json()["paragraph_ids"]
+
+    def rows(self, alias, model, *fields):
+        return sorted(model.objects.using(alias).filter(user_id=self.user.id).values_list(*fields))
+
+    def test_moves_rows_with_their_ids_and_timestamps(self):
+        ids = self.submit(["alpha beta beta", "beta gamma"])
+        paragraphs = self.rows(self.source, Paragraph, "id", "content", "created_at")
+        frequencies = self.rows(self.source, WordFrequency, "id", "term__text", "count", "created_at")
+
+        call_command("rebalance_shard", self.user.id, self.target, stdout=mock.Mock())
+
+        self.assertEqual(shard_for_user(self.user.id), self.target)
+        self.assertEqual(self.rows(self.target, Paragraph, "id", "content", "created_at"), paragraphs)
+        self.assertEqual(
+            self.rows(self.target, WordFrequency, "id", "term__text", "count", "created_at"), frequencies
+        )
+        self.assertFalse(Paragraph.objects.using(self.source).filter(user_id=self.user.id).exists())
+
+        # Searches and new submissions follow the user to the target
+        results = self.client.get("/api/text/search/", {"word": "beta"}).json()["results"]
+        self.assertEqual([result["paragraph_id"] for result in results], ids)
+        self.submit(["delta"])
+        self.assertTrue(
+            Term.objects.using(self.target).filter(text="delta").exists()
+        )
+
+    def test_second_pass_copies_changes_made_during_the_first(self):
+        ids = self.submit(["alpha beta beta", "beta gamma"])
+        job_id = IngestJob.objects.using(self.source).get(user_id=self.user.id).id
+
+        def write_during_copy(command, user_id, timeout):
+            # Source writes racing the first pass: an edit, counter
+            # increments and a frequency row deleted and inserted again
+            # (new id, same paragraph and term)
+            with use_shard(self.source):
+                Paragraph.objects.filter(id=ids[0]).update(content="alpha alpha", token_count=2)
+                CorpusStats.objects.filter(user_id=self.user.id).update(total_tokens=F("total_tokens") + 7)
+                IngestJob.objects.filter(id=job_id).update(completed=F("completed") + 1)
+                row = WordFrequency.objects.get(paragraph_id=ids[1], term__text="gamma")
+                row.delete()
+                row.pk = None
+                row.count = 5
+                row.save()
+            self.expected = {
+                model: self.rows(self.source, model, *fields) for model, fields in COMPARED.items()
+            }
+
+        with mock.patch.object(Command, "_drain", write_during_copy):
+            call_command("rebalance_shard", self.user.id, self.target, stdout=mock.Mock())
+
+        for model, fields in COMPARED.items():
+            self.assertEqual(self.rows(self.target, model, *fields), self.expected[model], model.__name__)
+
+    def test_writes_are_refused_while_moving(self):
+        set_moving(self.user.id, True)
+        response = self.client.post(
+            "/api/text/submit/", {"paragraphs": ["alpha"]}, content_type="application/json"
+        )
+        self.assertEqual(response.status_code, 503)
+        with self.assertRaises(ShardMoving):
+            with user_write_shard(self.user.id):
+                pass
+
+        # Reads keep being served from the source
+        self.assertEqual(self.client.get("/api/text/search/", {"word": "alpha"}).status_code, 200)
+
+        set_moving(self.user.id, False)
+        self.submit(["alpha"])
+
+    def test_tasks_are_queued_again_while_moving(self):
+        with use_shard(self.source):
+            paragraph = Paragraph.objects.create(user=self.user, content="alpha")
+        set_moving(self.user.id, True)
+        with mock.patch.object(compute_frequency, "apply_async") as apply_async:
+            result = compute_frequency.apply(
+                (paragraph.id,), {"allow_batching": False, "user_id": self.user.id}
+            ).get()
+        set_moving(self.user.id, False)
+
+        self.assertEqual(result["status"], "deferred")
+        args, kwargs = apply_async.call_args
+        self.assertEqual(list(args[0]), [paragraph.id])
+        self.assertEqual(kwargs["retries"], 0)
+        self.assertFalse(WordFrequency.objects.using(self.source).exists())
+
+    def test_gives_up_when_writes_do_not_drain(self):
+        self.submit(["alpha"])
+        begin_writes(self.user.id)
+        try:
+            with self.assertRaises(CommandError):
+                call_command(
+                    "rebalance_shard", self.user.id, self.target, "--drain-timeout", "0",
+                    stdout=mock.Mock()
+                )
+        finally:
+            end_writes(self.user.id)
+
+        # Nothing moved and the user can write again
+        self.assertEqual(shard_for_user(self.user.id), self.source)
+        self.submit(["beta"])
+        self.assertEqual(Paragraph.objects.using(self.source).filter(user_id=self.user.id).count(), 2)
+
+    def test_batch_indexed_on_the_target_after_the_move(self):
+        with user_write_shard(self.user.id):
+            paragraph = Paragraph.objects.create(user=self.user, content="alpha alpha")
+        call_command("rebalance_shard", self.user.id, self.target, stdout=mock.Mock())
+
+        with user_write_shard(self.user.id):
+            indexed_ids, _ = _index_batch([paragraph.id])
+        self.assertEqual(indexed_ids, [paragraph.id])
+        self.assertEqual(self.rows(self.target, WordFrequency, "paragraph_id", "count"), [(paragraph.id, 2)])
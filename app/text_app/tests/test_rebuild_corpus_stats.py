@@ -0,0 +1,68 @@
+from unittest import mock
+
+from django.core.management import call_command
+from django.test import override_settings
+
+from text_app.ingest import create_paragraphs
+from text_app.models import CorpusStats, DocumentFrequency, Paragraph
+from text_app.sharding import user_shard, user_write_shard
+from text_app.tasks import compute_frequency_batch
+
+from .base import ShardedTestCase
+
+
+class RebuildCorpusStatsTests(ShardedTestCase):
+
+    def _stats(self, user):
+        with user_shard(user.id):
+            return (
+                sorted(Paragraph.objects.values_list("id", "token_count")),
+                list(CorpusStats.objects.values_list("paragraph_count", "total_tokens")),
+                sorted(DocumentFrequency.objects.values_list("term__text", "paragraph_count"))
+            )
+
+    def submit(self, user, texts):
+        with user_write_shard(user.id):
+            return create_paragraphs(user, texts)
+
+    def test_rebuilds_the_statistics_the_indexing_wrote(self):
+        user = self.create_user()
+        self.submit(user, ["alpha beta beta", "beta gamma", "alpha"])
+        expected = self._stats(user)
+
+        with user_shard(user.id):
+            CorpusStats.objects.update(paragraph_count=0, total_tokens=0)
+            DocumentFrequency.objects.all().delete()
+        call_command("rebuild_corpus_stats", "--chunk-size", "2", stdout=mock.Mock())
+
+        self.assertEqual(self._stats(user), expected)
+
+    def test_counts_the_stored_postings_not_the_bodies(self):
+        user = self.create_user()
+        self.submit(user, ["alpha beta"])
+        with user_shard(user.id):
+            Paragraph.objects.update(content="omega omega omega")
+
+        call_command("rebuild_corpus_stats", stdout=mock.Mock())
+
+        paragraphs, corpus, frequencies = self._stats(user)
+        self.assertEqual(corpus, [(1, 2)])
+        self.assertEqual(frequencies, [("alpha", 1), ("beta", 1)])
+
+    def test_leaves_paragraphs_that_were_never_indexed(self):
+        user = self.create_user()
+        with mock.patch.object(compute_frequency_batch, "delay"):
+            pending = self.submit(user, ["gamma delta"])[0]
+        self.submit(user, ["alpha"])
+
+        call_command("rebuild_corpus_stats", stdout=mock.Mock())
+
+        paragraphs, corpus, frequencies = self._stats(user)
+        self.assertIn((pending, None), paragraphs)
+        self.assertEqual(corpus, [(1, 1)])
+        self.assertEqual(frequencies, [("alpha", 1)])
+
+
+@override_settings(TEXT_INDEX_STORAGE="blocks")
+class BlockRebuildCorpusStatsTests(RebuildCorpusStatsTests):
+    pass
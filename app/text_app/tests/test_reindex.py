@@ -0,0 +1,44 @@
+from django.test import override_settings
+
+from .base import ShardedTestCase
+
+
+class ReindexTests(ShardedTestCase):
+    # Edits rewrite only changed postings; searches see the new counts
+
+    def setUp(self):
+        super().setUp()
+        self.user = self.create_user()
+        self.client.force_login(self.user)
+        self.ids = self.client.post(
+            "/api/text/submit/", {"paragraphs": ["alpha beta beta", "beta gamma"]},
+            content_type="application/json"
+        ).json()["paragraph_ids"]
+
+    def search(self, word):
+        results = self.client.get("/api/text/search/", {"word": word}).json()["results"]
+        return [(hit["paragraph_id"], hit["count"]) for hit in results]
+
+    def edit(self, paragraph_id, content):
+        response = self.client.patch(
+            f"/api/text/paragraphs/{paragraph_id}/", {"content": content}, content_type="application/json"
+        )
+        self.assertEqual(response.status_code, 202)
+
+    def test_edits_replace_the_old_counts(self):
+        self.edit(self.ids[0], "gamma gamma beta")
+        self.assertEqual(self.search("alpha"), [])
+        self.assertEqual(self.search("beta"), [(self.ids[0], 1), (self.ids[1], 1)])
+        self.assertEqual(self.search("gamma"), [(self.ids[0], 2), (self.ids[1], 1)])
+
+        # A second edit diffs against the first one, not the original text
+        self.edit(self.ids[0], "alpha")
+        self.assertEqual(self.search("alpha"), [(self.ids[0], 1)])
+        self.assertEqual(self.search("beta"), [(self.ids[1], 1)])
+        self.assertEqual(self.search("gamma"), [(self.ids[1], 1)])
+
+
+@override_settings(TEXT_INDEX_STORAGE="blocks", TEXT_POSTING_BLOCK_SIZE=2)
+class BlockReindexTests(ReindexTests):
+    # The previous counts come from the paragraph's stored terms
+    pass
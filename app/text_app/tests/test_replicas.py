@@ -0,0 +1,46 @@
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connections, router
+from django.test.utils import CaptureQueriesContext
+
+from text_app.models import Paragraph
+from text_app.replicas import RECENT_WRITE_KEY, mark_written, replica_reads
+from text_app.sharding import shard_for_user, user_shard
+
+from .base import ShardedTestCase
+
+
+class ReplicaRoutingTests(ShardedTestCase):
+    # core.test_settings configures one replica per primary
+    # (default_replica1, shard1_replica1, ...), mirrors of the primaries
+
+    def setUp(self):
+        super().setUp()
+        self.user = self.create_user()
+        self.shard = shard_for_user(self.user.id)
+        self.replica = f"{self.shard}_replica1"
+
+    def test_reads_go_to_replicas_only_when_enabled(self):
+        with user_shard(self.user.id):
+            self.assertEqual(router.db_for_read(Paragraph), self.shard)
+            with replica_reads():
+                self.assertEqual(router.db_for_read(Paragraph), self.replica)
+                self.assertEqual(router.db_for_read(get_user_model()), "default_replica1")
+                # Writes always go to the primary
+                self.assertEqual(router.db_for_write(Paragraph), self.shard)
+
+    def test_search_reads_a_replica_unless_the_user_wrote(self):
+        self.client.force_login(self.user)
+        self.client.post("/api/text/submit/", {"paragraphs": ["alpha"]}, content_type="application/json")
+        # Submitting pinned the user to the primary; let the window pass
+        cache.delete(RECENT_WRITE_KEY.format(user_id=self.user.id))
+
+        with CaptureQueriesContext(connections[self.replica]) as replica_queries:
+            response = self.client.get("/api/text/search/", {"word": "alpha"})
+        self.assertEqual(len(response.json()["results"]), 1)
+        self.assertTrue(replica_queries)
+
+        mark_written([self.user.id])
+        with CaptureQueriesContext(connections[self.replica]) as replica_queries:
+            self.client.get("/api/text/search/", {"word": "alpha"})
+        self.assertFalse(replica_queries)
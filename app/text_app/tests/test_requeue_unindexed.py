@@ -0,0 +1,30 @@
+from datetime import timedelta
+from unittest import mock
+
+from django.core.management import call_command
+from django.utils import timezone
+
+from text_app.models import Paragraph, WordFrequency
+from text_app.sharding import user_shard
+
+from .base import ShardedTestCase
+
+
+class RequeueUnindexedTests(ShardedTestCase):
+
+    def test_queues_paragraphs_left_without_token_count(self):
+        user = self.create_user()
+        with user_shard(user.id):
+            lost = Paragraph.objects.create(user=user, content="alpha beta")
+            recent = Paragraph.objects.create(user=user, content="gamma")
+            Paragraph.objects.filter(id=lost.id).update(created_at=timezone.now() - timedelta(hours=1))
+
+        call_command("requeue_unindexed", stdout=mock.Mock())
+
+        with user_shard(user.id):
+            self.assertEqual(Paragraph.objects.get(id=lost.id).token_count, 2)
+            self.assertIsNone(Paragraph.objects.get(id=recent.id).token_count)
+            self.assertEqual(
+                sorted(WordFrequency.objects.values_list("paragraph_id", "term__text")),
+                [(lost.id, "alpha"), (lost.id, "beta")]
+            )
@@ -0,0 +1,90 @@
+from unittest import mock
+
+from django.test import SimpleTestCase, override_settings
+
+from core.celery import QUEUE_WORKER_SETTINGS, _configure_queue_worker, app
+from text_app.ingest import _dispatch
+from text_app.models import Paragraph
+from text_app.sharding import shard_aliases, shard_for_user, user_shard
+from text_app.tasks import (
+    compute_frequency_batch, count_paragraph_chunk, index_large_paragraph, reindex_paragraph,
+    store_chunked_paragraph
+)
+from text_app.tokenizer import count_words
+
+from .base import ShardedTestCase
+
+
+@override_settings(TEXT_INGEST_CHUNK_SIZE=3, TEXT_INGEST_CHUNK_CHARS=10, TEXT_LARGE_PARAGRAPH_CHARS=20)
+class SizeRoutingTests(SimpleTestCase):
+
+    def dispatch(self, sizes):
+        with mock.patch.object(compute_frequency_batch, "delay") as small, \
+                mock.patch.object(index_large_paragraph, "delay") as large:
+            _dispatch(list(range(1, len(sizes) + 1)), sizes, user_id=7, job_id=9)
+        return [call.args[0] for call in small.call_args_list], [call.args[0] for call in large.call_args_list]
+
+    def test_batches_by_count_and_characters(self):
+        self.assertEqual(self.dispatch([1, 1, 1, 1]), ([[1, 2, 3], [4]], []))
+        self.assertEqual(self.dispatch([4, 4, 4, 1]), ([[1, 2], [3, 4]], []))
+        # A paragraph over the character budget still travels, alone
+        self.assertEqual(self.dispatch([15, 1]), ([[1], [2]], []))
+
+    def test_large_paragraphs_skip_the_batches(self):
+        self.assertEqual(self.dispatch([1, 21, 1, 5]), ([[1, 3, 4]], [2]))
+        self.assertEqual(self.dispatch([20, 21]), ([[1]], [2]))
+
+    def test_large_tasks_are_routed_to_the_large_queue(self):
+        for task in (index_large_paragraph, count_paragraph_chunk, store_chunked_paragraph):
+            self.assertEqual(app.amqp.router.route({}, task.name)["queue"].name, "large")
+        for task in (compute_frequency_batch, reindex_paragraph):
+            self.assertEqual(app.amqp.router.route({}, task.name)["queue"].name, "small")
+
+    def test_single_queue_workers_get_their_settings(self):
+        conf = mock.Mock()
+        _configure_queue_worker(conf=conf, options={"queues": ["large"]})
+        conf.update.assert_called_once_with(QUEUE_WORKER_SETTINGS["large"])
+
+        conf = mock.Mock()
+        _configure_queue_worker(conf=conf, options={"queues": ["small", "large"]})
+        conf.update.assert_not_called()
+
+
+@override_settings(TEXT_LARGE_PARAGRAPH_CHARS=40, TEXT_LARGE_CHUNK_CHARS=16)
+class LargeParagraphTests(ShardedTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.user = self.create_user()
+        self.client.force_login(self.user)
+
+    def test_large_paragraphs_are_counted_in_slices_on_the_owners_shard(self):
+        text = "alpha beta gamma alphabet " * 10 + "beta"
+        with mock.patch.object(count_paragraph_chunk, "s", wraps=count_paragraph_chunk.s) as slices:
+            paragraph_id = self.client.post(
+                "/api/text/submit/", {"paragraphs": [text, "beta"]}, content_type="application/json"
+            ).json()["paragraph_ids"][0]
+        self.assertEqual(slices.call_count, -(-len(text) // 16))
+
+        with user_shard(self.user.id):
+            paragraph = Paragraph.objects.get(id=paragraph_id)
+        self.assertEqual(paragraph._state.db, shard_for_user(self.user.id))
+        self.assertEqual(paragraph.token_count, count_words(text)[0])
+        for alias in shard_aliases():
+            if alias != paragraph._state.db:
+                self.assertFalse(Paragraph.objects.using(alias).filter(user_id=self.user.id).exists())
+
+        results = self.client.get("/api/text/search/", {"word": "beta"}).json()["results"]
+        self.assertEqual(results[0]["paragraph_id"], paragraph_id)
+        self.assertEqual(results[0]["count"], count_words(text)[1]["beta"])
+
+    def test_edits_of_large_paragraphs_go_to_the_large_queue(self):
+        paragraph_id = self.client.post(
+            "/api/text/submit/", {"paragraphs": ["alpha"]}, content_type="application/json"
+        ).json()["paragraph_ids"][0]
+        with mock.patch.object(reindex_paragraph, "apply_async") as apply_async:
+            for content in ("beta", "beta " * 10):
+                self.client.patch(
+                    f"/api/text/paragraphs/{paragraph_id}/", {"content": content}, content_type="application/json"
+                )
+        self.assertEqual([call.kwargs["queue"] for call in apply_async.call_args_list], ["small", "large"])
@@ -0,0 +1,164 @@
+import tempfile
+from collections import Counter
+
+from django.test import override_settings
+
+from text_app.models import Paragraph
+from text_app.search import get_search_engine
+from text_app.search.memory import InMemorySearchEngine
+from text_app.search.redis_index import RedisSearchEngine
+from text_app.search.segments import SegmentSearchEngine, SegmentStore
+from text_app.sharding import user_shard
+
+from .base import ShardedTestCase
+
+
+REDIS_ENGINE = {
+    "TEXT_SEARCH_ENGINE": "text_app.search.redis_index.RedisSearchEngine",
+    "TEXT_SEARCH_REDIS_URL": "memory://",
+}
+
+
+class SearchEngineOrderTests(ShardedTestCase):
+    # Engines answer the first page, the ORM the following ones, so both
+    # must order hits by (-count, paragraph_id)
+
+    def setUp(self):
+        super().setUp()
+        self.user = self.create_user()
+        self.client.force_login(self.user)
+
+    def search_pages(self, word, limit):
+        hits, cursor = [], None
+        while True:
+            params = {"word": word, "limit": limit}
+            if cursor:
+                params["cursor"] = cursor
+            page = self.client.get("/api/text/search/", params).json()
+            hits.extend((hit["paragraph_id"], hit["count"]) for hit in page["results"])
+            cursor = page["next_cursor"]
+            if not cursor:
+                return hits
+
+    @override_settings(**REDIS_ENGINE)
+    def test_redis_first_page_continues_with_the_orm(self):
+        get_search_engine().rebuild()
+        texts = ["tie", "tie tie", "tie", "tie", "tie tie", "tie", "tie", "tie", "tie", "tie", "tie"]
+        ids = self.client.post(
+            "/api/text/submit/", {"paragraphs": texts}, content_type="application/json"
+        ).json()["paragraph_ids"]
+
+        expected = sorted(
+            ((paragraph_id, text.count("tie")) for paragraph_id, text in zip(ids, texts)),
+            key=lambda hit: (-hit[1], hit[0])
+        )
+        first_page = get_search_engine().search(self.user.id, "tie", 3)
+        self.assertEqual([(hit["paragraph_id"], hit["count"]) for hit in first_page], expected[:3])
+        self.assertEqual(self.search_pages("tie", 3), expected)
+
+    def test_memory_engine_orders_ties_by_paragraph_id(self):
+        engine = InMemorySearchEngine()
+        with user_shard(self.user.id):
+            engine.warm(self.user.id)
+            paragraphs = [Paragraph.objects.create(user=self.user, content="tie") for _ in range(4)]
+
+        # Indexed out of id order, as concurrent batches may commit
+        engine.paragraphs_indexed([(paragraph, Counter({"tie": 1})) for paragraph in reversed(paragraphs)])
+        hits = engine.search(self.user.id, "tie", 10)
+        self.assertEqual([hit["paragraph_id"] for hit in hits], [paragraph.id for paragraph in paragraphs])
+
+
+@override_settings(TEXT_INDEX_STORAGE="blocks", TEXT_POSTING_BLOCK_SIZE=2)
+class BlockStorageEngineTests(ShardedTestCase):
+    # Engines load and rebuild from posting blocks when no rows are written
+
+    def setUp(self):
+        super().setUp()
+        self.user = self.create_user()
+        self.client.force_login(self.user)
+        self.client.post(
+            "/api/text/submit/",
+            {"paragraphs": ["alpha beta", "beta beta", "alpha", "beta gamma alpha alpha", "beta"]},
+            content_type="application/json"
+        )
+        self.expected = {
+            word: [
+                (hit["paragraph_id"], hit["count"])
+                for hit in self.client.get("/api/text/search/", {"word": word}).json()["results"]
+            ]
+            for word in ("alpha", "beta", "gamma")
+        }
+        self.assertEqual(len(self.expected["beta"]), 4)
+
+    def assertEngineMatches(self, engine):
+        for word, hits in self.expected.items():
+            found = engine.search(self.user.id, word, 10)
+            self.assertEqual([(hit["paragraph_id"], hit["count"]) for hit in found], hits, word)
+
+    def test_memory_engine_warms_from_blocks(self):
+        engine = InMemorySearchEngine()
+        with user_shard(self.user.id):
+            engine.warm(self.user.id)
+        self.assertEngineMatches(engine)
+
+    @override_settings(TEXT_SEARCH_REDIS_URL="memory://")
+    def test_redis_engine_rebuilds_from_blocks(self):
+        engine = RedisSearchEngine()
+        self.assertEqual(engine.rebuild(), 8)
+        self.assertEngineMatches(engine)
+
+    def test_segment_engine_rebuilds_from_blocks(self):
+        with tempfile.TemporaryDirectory() as root, self.settings(TEXT_SEGMENT_DIR=root):
+            engine = SegmentSearchEngine(SegmentStore())
+            self.assertEqual(engine.rebuild(), 8)
+            self.assertEngineMatches(engine)
+
+
+@override_settings(**REDIS_ENGINE)
+class RedisEngineTests(ShardedTestCase):
+    # Runs against the in-process "memory://" stand-in (fakeredis)
+
+    def setUp(self):
+        super().setUp()
+        self.user = self.create_user()
+        self.engine = RedisSearchEngine()
+        self.engine.rebuild()
+        with user_shard(self.user.id):
+            self.paragraph = Paragraph.objects.create(user=self.user, content="alpha beta beta")
+
+    def search(self, word):
+        return [(hit["paragraph_id"], hit["count"]) for hit in self.engine.search(self.user.id, word, 10)]
+
+    def test_indexing_again_drops_words_the_paragraph_lost(self):
+        self.engine.paragraphs_indexed([(self.paragraph, Counter({"alpha": 1, "beta": 2}))])
+        # A redelivered task indexing newer content
+        self.engine.paragraphs_indexed([(self.paragraph, Counter({"beta": 3}))])
+
+        self.assertEqual(self.search("alpha"), [])
+        self.assertEqual(self.search("beta"), [(self.paragraph.id, 3)])
+
+    def test_edits_keep_unchanged_words(self):
+        self.engine.paragraphs_indexed([(self.paragraph, Counter({"alpha": 1, "beta": 2}))])
+        self.engine.paragraph_reindexed(
+            self.paragraph, Counter({"beta": 2, "gamma": 1}), Counter({"gamma": 1}), ["alpha"]
+        )
+        self.assertEqual(self.search("alpha"), [])
+        self.assertEqual(self.search("beta"), [(self.paragraph.id, 2)])
+        self.assertEqual(self.search("gamma"), [(self.paragraph.id, 1)])
+
+        # The next full indexing knows about gamma
+        self.engine.paragraphs_indexed([(self.paragraph, Counter({"beta": 1}))])
+        self.assertEqual(self.search("gamma"), [])
+
+    def test_rebuild_records_the_words_of_each_paragraph(self):
+        self.client.force_login(self.user)
+        ids = self.client.post(
+            "/api/text/submit/", {"paragraphs": ["alpha gamma"]}, content_type="application/json"
+        ).json()["paragraph_ids"]
+        self.engine.rebuild()
+        with user_shard(self.user.id):
+            paragraph = Paragraph.objects.get(id=ids[0])
+
+        self.engine.paragraphs_indexed([(paragraph, Counter({"alpha": 1}))])
+        self.assertEqual(self.search("gamma"), [])
+        self.assertEqual(self.search("alpha"), [(paragraph.id, 1)])
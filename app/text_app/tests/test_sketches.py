@@ -0,0 +1,45 @@
+from collections import Counter
+
+from text_app.sketches import CountMinSketch, HeavyHitters, record_words, user_sketch
+from text_app.sharding import user_shard
+
+from .base import ShardedTestCase
+
+
+WORDS = Counter({"alpha": 40, "beta": 25, "gamma": 9, "delta": 3, "epsilon": 1})
+
+
+def _hitters(counts, width=64, depth=4, capacity=3):
+    hitters = HeavyHitters(CountMinSketch(width, depth), capacity)
+    hitters.update(counts)
+    return hitters
+
+
+class SketchMergeTests(ShardedTestCase):
+
+    def test_merge_adds_counters(self):
+        first, second = Counter(alpha=40, gamma=9, epsilon=1), Counter(beta=25, delta=3)
+        merged = _hitters(first)
+        merged.merge(_hitters(second))
+        whole = _hitters(WORDS)
+
+        self.assertEqual(list(merged.sketch.counts), list(whole.sketch.counts))
+        self.assertEqual(merged.sketch.total, sum(WORDS.values()))
+        self.assertEqual(merged.top(3), whole.top(3))
+        self.assertEqual([word for word, _ in merged.top(2)], ["alpha", "beta"])
+
+    def test_merge_rejects_other_dimensions(self):
+        with self.assertRaises(ValueError):
+            _hitters(WORDS).merge(_hitters(WORDS, width=32))
+
+    def test_recorded_batches_merge_into_the_stored_sketch(self):
+        user = self.create_user()
+        with user_shard(user.id):
+            record_words({user.id: Counter(alpha=2, beta=1)})
+            record_words({user.id: Counter(alpha=3, gamma=1)})
+            # Edits merge negative deltas
+            record_words({user.id: Counter(beta=-1)})
+            hitters = user_sketch(user.id)
+
+        self.assertEqual(hitters.sketch.total, 6)
+        self.assertEqual(hitters.top(3), [("alpha", 5), ("gamma", 1)])
@@ -0,0 +1,108 @@
+import json
+from unittest import mock
+
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import SimpleTestCase, override_settings
+
+from text_app.ingest import _flush_chunk, ingest_stream, iter_ndjson, iter_text_blocks
+from text_app.models import Paragraph
+from text_app.sharding import user_shard
+
+from .base import ShardedTestCase
+
+
+class StreamParsingTests(SimpleTestCase):
+
+    def test_ndjson_records(self):
+        lines = [
+            '"alpha"\n',
+            '{"content": "beta", "source": "x"}\n',
+            '\n',
+            '{not json\n',
+            '{"title": "no content"}\n',
+            '42\n',
+            '"   "\n',
+            '"gamma"',
+        ]
+        self.assertEqual(list(iter_ndjson(lines)), ["alpha", "beta", None, None, None, None, "gamma"])
+
+    def test_text_blocks(self):
+        lines = ["alpha\r\n", "beta\r\n", "\r\n", "\r\n", "  \n", "gamma\n", "delta"]
+        self.assertEqual(list(iter_text_blocks(lines)), ["alpha\r\nbeta", "gamma\ndelta"])
+        self.assertEqual(list(iter_text_blocks(["\n", "\n"])), [])
+
+
+class FlushChunkTests(SimpleTestCase):
+
+    def flush(self, stats, created_ids):
+        with mock.patch("text_app.ingest.add_paragraphs"), \
+                mock.patch("text_app.ingest.create_paragraphs", return_value=created_ids):
+            _flush_chunk(None, ["text"] * len(created_ids), None, stats)
+
+    def test_id_ranges_extend_across_chunks(self):
+        stats = {"created": 0, "id_ranges": []}
+        self.flush(stats, [3, 4, 5])
+        self.flush(stats, [6, 7])
+        self.flush(stats, [9, 11, 12])
+        self.assertEqual(stats["id_ranges"], [[3, 7], [9, 9], [11, 12]])
+        self.assertEqual(stats["created"], 8)
+
+    def test_ingest_stream_flushes_bounded_chunks(self):
+        with mock.patch("text_app.ingest.start_job") as start_job, \
+                mock.patch("text_app.ingest._flush_chunk") as flush:
+            stats = ingest_stream(None, iter(["a", None, "b", "c", "d", None, "e"]), chunk_size=2)
+        self.assertEqual([call.args[1] for call in flush.call_args_list], [["a", "b"], ["c", "d"], ["e"]])
+        self.assertEqual(stats["skipped"], 2)
+        self.assertEqual(stats["job_id"], start_job.return_value.id)
+
+
+@override_settings(TEXT_INGEST_CHUNK_SIZE=2)
+class SubmitStreamTests(ShardedTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.user = self.create_user()
+        self.client.force_login(self.user)
+
+    def contents(self, response):
+        self.assertEqual(response.status_code, 202)
+        body = response.json()
+        ids = [i for first, last in body["id_ranges"] for i in range(first, last + 1)]
+        self.assertEqual(len(ids), body["paragraph_count"])
+        with user_shard(self.user.id):
+            return [Paragraph.objects.get(id=i).content for i in ids], body
+
+    def test_ndjson_body(self):
+        body = "\n".join(json.dumps(record) for record in ["alpha", {"content": "beta"}, 7, "gamma", "delta beta"])
+        contents, response = self.contents(
+            self.client.post("/api/text/submit/stream/", body, content_type="application/x-ndjson")
+        )
+        self.assertEqual(contents, ["alpha", "beta", "gamma", "delta beta"])
+        self.assertEqual(response["skipped"], 1)
+
+        job = self.client.get(f"/api/text/jobs/{response['job_id']}/").json()
+        self.assertEqual((job["paragraph_count"], job["completed"], job["done"]), (4, 4, True))
+        results = self.client.get("/api/text/search/", {"word": "beta"}).json()["results"]
+        self.assertEqual(len(results), 2)
+
+    def test_plain_text_body(self):
+        contents, _ = self.contents(
+            self.client.post("/api/text/submit/stream/", "alpha\nbeta\n\ngamma\n", content_type="text/plain")
+        )
+        self.assertEqual(contents, ["alpha\nbeta", "gamma"])
+
+    def test_file_uploads(self):
+        for name, data, expected in (
+            ("paragraphs.jsonl", b'"alpha"\n{"content": "beta"}\n', ["alpha", "beta"]),
+            ("paragraphs.txt", b"alpha\n\nbeta\n", ["alpha", "beta"]),
+        ):
+            with self.subTest(name=name):
+                contents, _ = self.contents(
+                    self.client.post("/api/text/submit/stream/", {"file": SimpleUploadedFile(name, data)})
+                )
+                self.assertEqual(contents, expected)
+
+    def test_rejects_other_content(self):
+        response = self.client.post("/api/text/submit/stream/", {"paragraphs": ["alpha"]}, content_type="application/json")
+        self.assertEqual(response.status_code, 415)
+        self.assertEqual(self.client.post("/api/text/submit/stream/", {}).status_code, 400)
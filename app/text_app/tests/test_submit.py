@@ -0,0 +1,56 @@
+from unittest import mock
+
+from django.db import connections
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+
+from text_app.models import Paragraph
+from text_app.sharding import shard_for_user, user_shard
+from text_app.tasks import compute_frequency_batch
+
+from .base import ShardedTestCase
+
+
+@override_settings(TEXT_INGEST_CHUNK_SIZE=2)
+class BulkSubmitTests(ShardedTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.user = self.create_user()
+        self.client.force_login(self.user)
+
+    def submit(self, paragraphs):
+        response = self.client.post("/api/text/submit/", {"paragraphs": paragraphs}, content_type="application/json")
+        self.assertEqual(response.status_code, 202)
+        return response.json()
+
+    def test_one_insert_and_one_message_per_chunk(self):
+        texts = ["alpha", "beta", "gamma", "delta", "epsilon"]
+        with mock.patch.object(compute_frequency_batch, "delay") as delay, \
+                CaptureQueriesContext(connections[shard_for_user(self.user.id)]) as queries:
+            response = self.submit(texts)
+
+        ids = response["paragraph_ids"]
+        inserts = [query for query in queries if query["sql"].startswith('INSERT INTO "text_app_paragraph"')]
+        self.assertEqual(len(inserts), 1)
+        self.assertEqual(
+            [(call.args, call.kwargs) for call in delay.call_args_list],
+            [
+                ((chunk,), {"user_id": self.user.id, "job_id": response["job_id"]})
+                for chunk in (ids[0:2], ids[2:4], ids[4:5])
+            ]
+        )
+        with user_shard(self.user.id):
+            self.assertEqual([Paragraph.objects.get(id=i).content for i in ids], texts)
+
+    def test_skips_entries_that_are_not_text(self):
+        response = self.submit(["alpha", "", 3, None, "beta"])
+        self.assertEqual(len(response["paragraph_ids"]), 2)
+        self.assertEqual(response["message"], "Processing 2 paragraphs")
+
+    def test_every_chunk_is_indexed(self):
+        self.submit(["alpha beta", "beta", "beta gamma", "alpha"])
+        results = self.client.get("/api/text/search/", {"word": "beta"}).json()["results"]
+        self.assertEqual(len(results), 3)
+        with user_shard(self.user.id):
+            self.assertFalse(Paragraph.objects.filter(token_count__isnull=True).exists())
@@ -0,0 +1,62 @@
+from django.db import connections, transaction
+from django.test.utils import CaptureQueriesContext
+
+from text_app.models import Term
+from text_app.sharding import shard_aliases, use_shard
+from text_app.terms import TERM_DATABASE, TermCache
+
+from .base import ShardedTestCase
+
+
+class TermCacheTests(ShardedTestCase):
+
+    def test_words_are_interned_once(self):
+        terms = TermCache(100)
+        first = terms.resolve(["alpha", "beta"])
+        self.assertEqual(terms.resolve(["beta", "alpha", "gamma"]), {**first, "gamma": terms.lookup("gamma")})
+        self.assertEqual(Term.objects.using(TERM_DATABASE).filter(text__in=["alpha", "beta", "gamma"]).count(), 3)
+
+        # Another process starts with an empty cache and finds the same ids
+        self.assertEqual(TermCache(100).resolve(["alpha", "beta"]), first)
+
+    def test_cached_words_cost_no_queries(self):
+        terms = TermCache(100)
+        words = [f"word{i}" for i in range(50)]
+        with CaptureQueriesContext(connections[TERM_DATABASE]) as queries:
+            term_ids = terms.resolve(words)
+        # Misses are resolved in bulk, whatever their number
+        statements = [query["sql"].split()[0] for query in queries]
+        self.assertEqual([sql for sql in statements if sql in ("SELECT", "INSERT")], ["SELECT", "INSERT", "SELECT"])
+
+        with self.assertNumQueries(0, using=TERM_DATABASE):
+            self.assertEqual(terms.resolve(words), term_ids)
+            self.assertEqual(terms.lookup("word7"), term_ids["word7"])
+
+    def test_rolled_back_ids_are_not_cached(self):
+        terms = TermCache(100)
+        with self.assertRaises(RuntimeError):
+            with transaction.atomic(using=TERM_DATABASE):
+                terms.resolve(["alpha"])
+                raise RuntimeError
+        self.assertEqual(terms._lookup(["alpha"]), ({}, ["alpha"]))
+        self.assertIsNone(terms.lookup("alpha"))
+
+        term_id = terms.resolve(["alpha"])["alpha"]
+        self.assertEqual(Term.objects.using(TERM_DATABASE).get(id=term_id).text, "alpha")
+
+    def test_least_recently_used_words_are_evicted(self):
+        terms = TermCache(2)
+        terms.resolve(["alpha", "beta"])
+        terms.lookup("alpha")
+        terms.resolve(["gamma"])
+        self.assertEqual(sorted(terms._lookup(["alpha", "beta", "gamma"])[1]), ["beta"])
+
+    def test_shards_receive_copies_of_the_terms_they_use(self):
+        shard = shard_aliases()[-1]
+        with use_shard(shard):
+            term_ids = TermCache(100).resolve(["alpha", "beta"])
+        self.assertEqual(
+            dict(Term.objects.using(shard).values_list("text", "id")),
+            dict(Term.objects.using(TERM_DATABASE).values_list("text", "id")),
+        )
+        self.assertEqual(dict(Term.objects.using(shard).values_list("text", "id")), term_ids)
@@ -0,0 +1,34 @@
+from django.test import SimpleTestCase
+
+from text_app.tokenizer import chunk_bounds, count_chunk, count_stream, count_words, merge_chunks
+
+
+# Case changes that alter the length or the word characters of a text:
+# "İ" lowercases to "i" plus a combining dot (not a word character),
+# "ẞ" and "K" (Kelvin sign) to one letter, final sigma depends on context
+SAMPLE = (
+    "İstanbul İİ Kİ naïve café ΣΟΦΟΣ KELVİN K ẞtraße straße\n"
+    "hello, World! hello_world a1b 日本語 text İ\tİx xİ end"
+)
+
+
+def count_chunked(text, chunk_size):
+    parts = [count_chunk(text[start:start + length]) for start, length in chunk_bounds(len(text), chunk_size)]
+    return merge_chunks(parts)
+
+
+class TokenizerTests(SimpleTestCase):
+
+    def test_streaming_matches_count_words(self):
+        expected = count_words(SAMPLE)[1]
+        for piece_size in range(1, 12):
+            self.assertEqual(count_stream(SAMPLE, piece_size), expected, piece_size)
+
+    def test_chunks_match_count_words(self):
+        expected = count_words(SAMPLE)
+        for chunk_size in range(1, len(SAMPLE) + 1):
+            self.assertEqual(count_chunked(SAMPLE, chunk_size), expected, chunk_size)
+
+    def test_dotted_capital_i_splits_words(self):
+        self.assertEqual(count_words("İstanbul")[1], {"i": 1, "stanbul": 1})
+        self.assertEqual(count_chunked("İstanbul", 3)[1], {"i": 1, "stanbul": 1})
@@ -0,0 +1,81 @@
+from unittest import mock
+
+from django.core.cache import cache
+from django.core.management import call_command
+
+from text_app.sharding import user_shard
+from text_app.vocabulary import CHANGES_KEY, VocabularyCache
+
+from .base import ShardedTestCase
+
+
+class VocabularyCacheTests(ShardedTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.user = self.create_user()
+        self.client.force_login(self.user)
+        self.client.post("/api/text/submit/", {"paragraphs": ["running runner"]}, content_type="application/json")
+
+    def test_other_processes_add_new_words_without_reloading(self):
+        web, worker = VocabularyCache(10), VocabularyCache(10)
+        with user_shard(self.user.id):
+            self.assertEqual(set(web.get(self.user.id).prefix("run", 10)), {"running", "runner"})
+
+            worker.words_changed({self.user.id: {"runway": 901}})
+            worker.words_changed({self.user.id: {"rung": 902}})
+            with mock.patch.object(web, "load", wraps=web.load) as load:
+                words = web.get(self.user.id).prefix("run", 10)
+            load.assert_not_called()
+        self.assertEqual(set(words), {"running", "runner", "runway", "rung"})
+
+    def test_reloads_when_added_words_expired(self):
+        web, worker = VocabularyCache(10), VocabularyCache(10)
+        with user_shard(self.user.id):
+            web.get(self.user.id)
+            worker.words_changed({self.user.id: {"runway": 901}})
+            version = cache.get(worker._version_key(self.user.id))
+            cache.delete(CHANGES_KEY.format(user_id=self.user.id, version=version))
+            with mock.patch.object(web, "load", wraps=web.load) as load:
+                web.get(self.user.id)
+            load.assert_called_once_with(self.user.id)
+
+    def test_bm25_is_rejected_for_patterns(self):
+        for path in ("/api/text/search/", "/api/text/async/search/"):
+            with self.subTest(path=path):
+                response = self.client.get(path, {"word": "run*", "rank": "bm25"})
+                self.assertEqual(response.status_code, 400)
+                self.assertEqual(self.client.get(path, {"word": "run*"}).status_code, 200)
+
+    def edit(self, paragraph_id, content):
+        self.client.patch(
+            f"/api/text/paragraphs/{paragraph_id}/", {"content": content}, content_type="application/json"
+        )
+
+    def test_words_leave_when_no_paragraph_contains_them(self):
+        web = VocabularyCache(10)
+        paragraph_id = self.client.post(
+            "/api/text/submit/", {"paragraphs": ["runway"]}, content_type="application/json"
+        ).json()["paragraph_ids"][0]
+        with user_shard(self.user.id):
+            self.assertEqual(set(web.get(self.user.id).prefix("run", 10)), {"running", "runner", "runway"})
+
+        with mock.patch("text_app.corpus.vocabulary_cache", web):
+            self.edit(paragraph_id, "rung")
+            with user_shard(self.user.id), mock.patch.object(web, "load", wraps=web.load) as load:
+                self.assertEqual(set(web.get(self.user.id).prefix("run", 10)), {"running", "runner", "rung"})
+            load.assert_not_called()
+
+            # Back from a document frequency of 0
+            self.edit(paragraph_id, "runway")
+            with user_shard(self.user.id):
+                self.assertEqual(set(web.get(self.user.id).prefix("run", 10)), {"running", "runner", "runway"})
+
+    def test_rebuild_reloads_cached_copies(self):
+        web = VocabularyCache(10)
+        with user_shard(self.user.id):
+            web.get(self.user.id)
+        call_command("rebuild_corpus_stats", stdout=mock.Mock())
+        with user_shard(self.user.id), mock.patch.object(web, "load", wraps=web.load) as load:
+            web.get(self.user.id)
+        load.assert_called_once_with(self.user.id)
@@ -0,0 +1,182 @@
+import logging
+# Reports a process pool that cannot be used (the serial path takes over)
+
+import multiprocessing
+import re
+# Regular expressions used for text normalization and tokenization
+
+import threading
+from collections import Counter
+# Efficient utility for counting word frequencies
+
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+# Very large texts are counted on several cores
+
+from django.conf import settings
+
+
+logger = logging.getLogger(__name__)
+
+# Precompiled tokenizer pattern shared by all indexing paths
+WORD_RE = re.compile(r'\b[a-zA-Z]+\b')
+
+# A token is a maximal run of word characters made of ASCII letters only;
+# these find the runs cut by chunk boundaries
+LEADING_RUN_RE = re.compile(r'\w*')
+TRAILING_RUN_RE = re.compile(r'\w*\Z')
+LETTERS_RE = re.compile(r'[a-zA-Z]+')
+NON_WORD_RE = re.compile(r'\W')
+
+
+def _piece_chars():
+    return getattr(settings, "TEXT_TOKENIZER_PIECE_CHARS", 65536)
+
+
+def count_words(content):
+    # Normalize text, extract alphabetic words only and count occurrences.
+    # Texts longer than TEXT_TOKENIZER_PIECE_CHARS are counted piece by
+    # piece, so neither a lowercased copy nor a token list of the whole
+    # text is built; above TEXT_TOKENIZER_PARALLEL_CHARS the pieces are
+    # counted in a process pool when TEXT_TOKENIZER_WORKERS is set.
+    if len(content) <= _piece_chars():
+        words = WORD_RE.findall(content.lower())
+        return len(words), Counter(words)
+
+    workers = getattr(settings, "TEXT_TOKENIZER_WORKERS", 0)
+    if workers > 1 and len(content) >= getattr(settings, "TEXT_TOKENIZER_PARALLEL_CHARS", 2000000):
+        freq = count_parallel(content, workers)
+    else:
+        freq = count_stream(content)
+    return sum(freq.values()), freq
+
+
+def iter_pieces(content, piece_size):
+    # Slices of at least `piece_size` characters, each ending right before
+    # a non-word character so that no word is split between two slices
+    start, length = 0, len(content)
+    while start < length:
+        end = start + piece_size
+        if end < length:
+            match = NON_WORD_RE.search(content, end)
+            end = match.start() if match else length
+        yield content[start:end]
+        start = end
+
+
+def count_stream(content, piece_size=None):
+    # Count words one bounded piece at a time: memory stays proportional
+    # to the piece size and the vocabulary, not to the text
+    freq = Counter()
+    for piece in iter_pieces(content, piece_size or _piece_chars()):
+        freq.update(WORD_RE.findall(piece.lower()))
+    return freq
+
+
+def _count_piece(piece):
+    # Runs in the pool's worker processes
+    return Counter(WORD_RE.findall(piece.lower()))
+
+
+class TokenizerPool:
+    """
+    Lazily started process pool counting the pieces of very large texts.
+
+    Each process (web worker or Celery child) starts its own pool on first
+    use. Pool processes come from a fork server rather than forking the
+    (multi-threaded) web or worker process itself. If the pool cannot be
+    started or breaks, counting falls back to the serial streaming path.
+    """
+
+    def __init__(self):
+        self._executor = None
+        self._workers = 0
+        self._lock = threading.Lock()
+
+    def executor(self, workers):
+        with self._lock:
+            if self._executor is None or self._workers != workers:
+                if self._executor is not None:
+                    self._executor.shutdown(wait=False)
+                self._executor = ProcessPoolExecutor(
+                    max_workers=workers,
+                    mp_context=multiprocessing.get_context("forkserver")
+                )
+                self._workers = workers
+            return self._executor
+
+    def reset(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+            self._workers = 0
+
+
+tokenizer_pool = TokenizerPool()
+
+
+def count_parallel(content, workers):
+    # Count `content` in about 4 pieces per worker process and merge the
+    # partial counters (pieces never split a word, so the sum is exact)
+    piece_size = max(_piece_chars(), len(content) // (workers * 4) + 1)
+    try:
+        partials = tokenizer_pool.executor(workers).map(_count_piece, iter_pieces(content, piece_size))
+        freq = Counter()
+        for partial in partials:
+            freq.update(partial)
+        return freq
+    except (BrokenProcessPool, OSError, AssertionError):
+        # AssertionError: daemonic processes may not start children
+        logger.exception("Tokenizer pool unavailable, counting serially")
+        tokenizer_pool.reset()
+        return count_stream(content)
+
+
+def chunk_bounds(length, chunk_size):
+    # (start, length) character slices covering a text of `length` characters
+    return [(start, min(chunk_size, length - start)) for start in range(0, length, chunk_size)]
+
+
+def count_chunk(text):
+    # Count the words of one slice of a larger text.
+    # Words cut by the slice boundaries are returned as "head"/"tail"
+    # fragments and completed by merge_chunks().
+    # Runs are found in the lowercased slice, as count_words() does: lowering
+    # can turn a word character into several characters, not all of them
+    # word characters ("İ" becomes "i" and U+0307)
+    text = text.lower()
+    head = LEADING_RUN_RE.match(text).group()
+    if len(head) == len(text):
+        # No boundary inside: the whole slice continues the current run
+        return {"head": text, "tail": "", "counts": {}, "whole": True}
+
+    tail = TRAILING_RUN_RE.search(text).group()
+    middle = text[len(head):len(text) - len(tail)]
+    return {
+        "head": head,
+        "tail": tail,
+        "counts": count_stream(middle),
+        "whole": False
+    }
+
+
+def merge_chunks(parts):
+    # Combine count_chunk() results, in text order, into the counts
+    # count_words() would give for the whole text
+    freq = Counter()
+    carry = ""
+    for part in parts:
+        if part["whole"]:
+            carry += part["head"]
+            continue
+        _count_run(freq, carry + part["head"])
+        freq.update(part["counts"])
+        carry = part["tail"]
+    _count_run(freq, carry)
+    return sum(freq.values()), freq
+
+
+def _count_run(freq, run):
+    if run and LETTERS_RE.fullmatch(run):
+        freq[run] += 1
@@ -1,14 +1,36 @@
 from django.urls import path
 # URL routing utility for mapping endpoints to view classes
 
-from .views import Submit, Search
+from .views import Submit, SubmitStream, ParagraphDetail, JobDetail, TopWords, Search, DedupStats
 # Import API views responsible for paragraph submission and search
 
+from . import async_views
+# Coroutine versions of Submit and Search for ASGI deployments
+
 
 urlpatterns = [
     # Endpoint for submitting multiple paragraphs for processing
     path("submit/", Submit.as_view()),
 
+    # Endpoint for streaming NDJSON / plain-text uploads in bounded chunks
+    path("submit/stream/", SubmitStream.as_view()),
+
+    # Endpoint for editing a paragraph (re-indexed with delta writes)
+    path("paragraphs/<int:pk>/", ParagraphDetail.as_view()),
+
+    # Indexing progress of a submission (job_id returned by the submit endpoints)
+    path("jobs/<int:pk>/", JobDetail.as_view()),
+
+    # Approximate top words of the user's corpus with their error bounds
+    path("analytics/top-words/", TopWords.as_view()),
+
     # Endpoint for searching top paragraphs by word frequency
     path("search/", Search.as_view()),
+
+    # Duplicate-paragraph cache hit rate and saved CPU time
+    path("stats/dedup/", DedupStats.as_view()),
+
+    # Async variants served efficiently under ASGI (core.asgi)
+    path("async/submit/", async_views.submit),
+    path("async/search/", async_views.search),
 ]
\ No newline at end of file
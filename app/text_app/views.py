@@ -8,12 +8,51 @@ from rest_framework.response import Response
 from rest_framework import status
 # Response helper and HTTP status codes for consistent API replies
 
-from .models import Paragraph, WordFrequency
-# Paragraph: stores raw user text
-# WordFrequency: stores computed word counts per paragraph per user
+from .models import IngestJob, Paragraph
+# Paragraph: stores raw user text; IngestJob: indexing progress of a submission
 
-from .tasks import compute_frequency
-# Celery background task used to compute word frequency asynchronously
+from .ingest import create_paragraphs, ingest_stream, is_large, iter_lines, iter_ndjson, iter_text_blocks
+# Bulk paragraph creation and streaming readers that queue background indexing
+
+from .jobs import job_status, start_job
+# Submissions are tracked by one IngestJob each
+
+from .dedup import content_fingerprint
+from .tasks import reindex_paragraph
+# Edited paragraphs are re-indexed in the background with delta writes
+
+from .search import get_search_engine, make_preview
+# Pluggable search engine consulted before the ORM query
+
+from .terms import lookup_term_id
+# Resolves the searched word to its interned term id
+
+from .queries import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, decode_cursor, next_cursor, search_page
+# Keyset-paginated hit queries shared by the sync and async Search views
+
+from .ranking import bm25_page
+# BM25 ranking over the precomputed corpus statistics
+
+from .multiterm import QuerySyntaxError, multi_search_page, parse_query, terms_search_page
+# OR/AND queries evaluated with an early-terminating top-k over posting lists
+
+from .vocabulary import InvalidPattern, expand_pattern, is_pattern
+# Prefix and fuzzy words expanded against the user's vocabulary
+
+from .dedup import frequency_cache
+# Duplicate-paragraph cache whose hit statistics are exposed below
+
+from .sketches import top_words
+# Approximate top words from the user's Count-Min Sketch
+
+from .sharding import UserShardMixin
+# Routes each request's text queries to the authenticated user's shard
+
+from .replicas import ReplicaReadMixin, mark_written
+# Search may read from replicas; writers are pinned to the primary for a while
+
+from django.conf import settings
+# Project settings used for ingestion tuning parameters
 
 from django.views.decorators.csrf import csrf_exempt
 from django.utils.decorators import method_decorator
@@ -21,7 +60,7 @@ from django.utils.decorators import method_decorator
 
 
 @method_decorator(csrf_exempt, name="dispatch")
-class Submit(APIView):
+class Submit(UserShardMixin, APIView):
     # API endpoint responsible for accepting multiple paragraphs in one request
     permission_classes = [IsAuthenticated]
     # Only logged-in users are allowed to submit paragraphs
@@ -44,27 +83,18 @@ class Submit(APIView):
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        created_ids = []
-        # Iterate through each paragraph submitted by the user
-        for text in paragraphs:
-            # Create records only for valid, non-empty string inputs
-            if text and isinstance(text, str):
-                p = Paragraph.objects.create(
-                    user=request.user,   # Associate paragraph with authenticated user
-                    content=text         # Store raw paragraph content
-                )
-
-                # Trigger background processing for word frequency computation
-                # This runs asynchronously and does NOT block the API response
-                compute_frequency.delay(p.id)
-
-                # Store created paragraph IDs for response tracking
-                created_ids.append(p.id)
+        # Insert valid, non-empty string inputs and trigger background processing
+        # This runs asynchronously and does NOT block the API response
+        texts = [text for text in paragraphs if text and isinstance(text, str)]
+        job = start_job(request.user, len(texts))
+        created_ids = create_paragraphs(request.user, texts, job)
         
         # Return immediately while background processing continues
+        # (progress is polled at /api/text/jobs/<job_id>/)
         return Response(
             {
                 "message": f"Processing {len(created_ids)} paragraphs",
+                "job_id": job.id,
                 "paragraph_ids": created_ids,
                 "processing": True
             },
@@ -74,12 +104,147 @@ class Submit(APIView):
 
 
 @method_decorator(csrf_exempt, name="dispatch")
-class Search(APIView):
+class SubmitStream(UserShardMixin, APIView):
+    # API endpoint for large uploads that are read incrementally from the request
+    # Accepts NDJSON or plain text bodies, or a multipart "file" upload
+    permission_classes = [IsAuthenticated]
+    # Only logged-in users are allowed to submit paragraphs
+
+    NDJSON_TYPES = ("application/x-ndjson", "application/jsonl", "application/json-seq")
+    NDJSON_EXTENSIONS = (".ndjson", ".jsonl")
+
+    def post(self, request):
+        content_type = request.content_type.split(";")[0].strip().lower()
+
+        if content_type == "multipart/form-data":
+            # Django streams multipart uploads to disk, so iterating is bounded
+            upload = request.FILES.get("file")
+            if upload is None:
+                return Response(
+                    {"error": "No file provided"},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            is_ndjson = upload.name.lower().endswith(self.NDJSON_EXTENSIONS)
+            lines = iter_lines(upload)
+        elif content_type in self.NDJSON_TYPES or content_type == "text/plain":
+            # Read the raw body line by line; request.data is never touched
+            is_ndjson = content_type != "text/plain"
+            lines = iter_lines(request.stream or [])
+        else:
+            return Response(
+                {"error": "Unsupported content type"},
+                status=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE
+            )
+
+        paragraphs = iter_ndjson(lines) if is_ndjson else iter_text_blocks(lines)
+        stats = ingest_stream(request.user, paragraphs, settings.TEXT_INGEST_CHUNK_SIZE)
+
+        return Response(
+            {
+                "message": f"Processing {stats['created']} paragraphs",
+                "job_id": stats["job_id"],
+                "paragraph_count": stats["created"],
+                "skipped": stats["skipped"],
+                "id_ranges": stats["id_ranges"],   # Inclusive [first, last] id runs
+                "processing": True
+            },
+            status=status.HTTP_202_ACCEPTED
+        )
+
+
+@method_decorator(csrf_exempt, name="dispatch")
+class ParagraphDetail(UserShardMixin, APIView):
+    # API endpoint for editing a paragraph owned by the authenticated user
+    permission_classes = [IsAuthenticated]
+
+    def patch(self, request, pk):
+        content = request.data.get("content")
+
+        # Validate that new, non-empty text is provided
+        if not content or not isinstance(content, str):
+            return Response(
+                {"error": "Content must be a non-empty string"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        # Users can only edit their own paragraphs
+        paragraph = Paragraph.objects.filter(user=request.user, pk=pk).first()
+        if paragraph is None:
+            return Response(
+                {"error": "Paragraph not found"},
+                status=status.HTTP_404_NOT_FOUND
+            )
+
+        paragraph.content = content
+        paragraph.preview = make_preview(content)
+        paragraph.fingerprint = content_fingerprint(content)
+        paragraph.save(update_fields=["content", "preview", "fingerprint"])
+        mark_written([request.user.id])
+
+        # Only changed words are rewritten by the background task
+        # (on the "large" queue when the new content is large)
+        reindex_paragraph.apply_async(
+            (paragraph.id,),
+            {"user_id": request.user.id},
+            queue="large" if is_large(len(content)) else "small"
+        )
+
+        return Response(
+            {
+                "message": "Paragraph updated",
+                "paragraph_id": paragraph.id,
+                "processing": True
+            },
+            status=status.HTTP_202_ACCEPTED
+        )
+
+
+class JobDetail(UserShardMixin, APIView):
+    # API endpoint reporting the indexing progress of a submission
+    # (one primary-key lookup, whatever the size of the submission)
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, pk):
+        # Users can only see their own jobs
+        job = IngestJob.objects.filter(user=request.user, pk=pk).first()
+        if job is None:
+            return Response(
+                {"error": "Job not found"},
+                status=status.HTTP_404_NOT_FOUND
+            )
+        return Response(job_status(job), status=status.HTTP_200_OK)
+
+
+class TopWords(UserShardMixin, APIView):
+    # API endpoint listing the approximate most frequent words of the user's
+    # corpus, read from one sketch row instead of aggregating WordFrequency
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        try:
+            n = int(request.query_params.get("n", 20))
+        except ValueError:
+            return Response(
+                {"error": "Invalid n"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        # Only the tracked heavy hitters can be ranked
+        n = max(1, min(n, settings.TEXT_SKETCH_HEAVY_HITTERS))
+        return Response(top_words(request.user.id, n), status=status.HTTP_200_OK)
+
+
+@method_decorator(csrf_exempt, name="dispatch")
+class Search(UserShardMixin, ReplicaReadMixin, APIView):
     # API endpoint for retrieving top paragraphs by word frequency
     permission_classes = [IsAuthenticated]
     # Only authenticated users can search their own data
 
     def get(self, request):
+        # Multi-word queries ("cat dog", "cat AND dog") are passed as ?q=
+        query = request.query_params.get("q", "").strip()
+        if query:
+            return self._multi_search(request, query)
+
         # Extract search word from query parameters
         # Normalized to lowercase to ensure case-insensitive matching
         word = request.query_params.get("word", "").strip().lower()
@@ -90,34 +255,128 @@ class Search(APIView):
                 {"error": "Word parameter is required"},
                 status=status.HTTP_400_BAD_REQUEST
             )
-        
-        # Query word frequency records scoped to the logged-in user
-        # select_related is used to avoid extra database queries
-        qs = (
-            WordFrequency.objects
-            .filter(user=request.user, word=word)  # User-specific search isolation
-            .select_related('paragraph')            # Optimizes DB access
-            .order_by("-count")[:10]                # Top 10 results by frequency
-        )
 
-        results = []
-        # Build clean, concise response payload for each result
-        for q in qs:
-            results.append({
-                "paragraph_id": q.paragraph.id,  # Reference to original paragraph
-                "content": (
-                    q.paragraph.content[:100] + "..."
-                    if len(q.paragraph.content) > 100
-                    else q.paragraph.content
-                ),  # Content preview capped at 100 characters
-                "count": q.count,                 # Frequency of searched word
-                "created_at": q.paragraph.created_at.isoformat()
-                # ISO format ensures consistent datetime representation
+        # Optional page size and keyset cursor returned by a previous page
+        try:
+            limit = int(request.query_params.get("limit", DEFAULT_PAGE_SIZE))
+            cursor = request.query_params.get("cursor")
+            after = decode_cursor(cursor) if cursor else None
+        except ValueError:
+            return Response(
+                {"error": "Invalid limit or cursor"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        limit = max(1, min(limit, MAX_PAGE_SIZE))
+
+        # Ranking: raw count (default, keyset paginated) or BM25 (first page only)
+        rank = request.query_params.get("rank", "count")
+        if rank not in ("count", "bm25") or (rank == "bm25" and after is not None):
+            return Response(
+                {"error": "rank must be 'count' or 'bm25'; cursors are only valid with rank=count"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        # Prefix ("run*") and fuzzy ("runing~", "runing~2") words
+        if is_pattern(word):
+            if rank == "bm25":
+                return Response(
+                    {"error": "rank=bm25 is not supported for prefix or fuzzy words"},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            return self._pattern_search(request, word, limit, after)
+
+        if rank == "bm25":
+            term_id = lookup_term_id(word)
+            results = bm25_page(request.user.id, term_id, limit) if term_id is not None else []
+            return Response({
+                "word": word,
+                "rank": rank,
+                "total_results": len(results),
+                "results": results,
+                "next_cursor": None
             })
         
+        # Answer the first page from the configured search engine when it is warm
+        engine = get_search_engine()
+        results = None
+        if engine is not None and after is None:
+            results = engine.search(request.user.id, word, limit)
+
+        if results is None:
+            results = self._search_orm(request.user, word, limit, after)
+        
         # Final structured response sent to the client
         return Response({
-            "word": word,                         # Searched keyword
-            "total_results": len(results),        # Number of matches returned
-            "results": results                    # Top paragraphs by frequency
+            "word": word,                               # Searched keyword
+            "rank": rank,                               # Ranking used for the results
+            "total_results": len(results),              # Number of matches returned
+            "results": results,                         # Top paragraphs by frequency
+            "next_cursor": next_cursor(results, limit)  # Pass back as ?cursor= for the next page
+        })
+
+    def _pattern_search(self, request, pattern, limit, after):
+        try:
+            if after is not None:
+                raise InvalidPattern(pattern)
+            terms = expand_pattern(request.user.id, pattern)
+        except InvalidPattern:
+            return Response(
+                {"error": "Invalid prefix or fuzzy pattern (cursors are not supported)"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        # The bounded set of matching words is ranked like an OR query
+        results = terms_search_page(request.user.id, terms, "OR", limit)
+        return Response({
+            "word": pattern,
+            "expanded": list(terms),
+            "total_results": len(results),
+            "results": results,
+            "next_cursor": None
         })
+
+    def _multi_search(self, request, query):
+        try:
+            operator, words = parse_query(query)
+            limit = int(request.query_params.get("limit", DEFAULT_PAGE_SIZE))
+        except QuerySyntaxError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        except ValueError:
+            return Response({"error": "Invalid limit"}, status=status.HTTP_400_BAD_REQUEST)
+        limit = max(1, min(limit, MAX_PAGE_SIZE))
+
+        # Paragraphs ranked by the summed count of the query words
+        results = multi_search_page(request.user.id, words, operator, limit)
+        return Response({
+            "query": query,
+            "operator": operator,
+            "words": words,
+            "total_results": len(results),
+            "results": results,
+            "next_cursor": None
+        })
+
+    def _search_orm(self, user, word, limit, after):
+        # Words that were never indexed cannot match anything
+        term_id = lookup_term_id(word)
+        if term_id is None:
+            return []
+
+        # Keyset page ordered by (-count, paragraph_id); paragraph bodies are never loaded
+        return search_page(user.id, term_id, limit, after)
+
+
+class DedupStats(APIView):
+    # API endpoint exposing duplicate-paragraph cache effectiveness
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        # Hit rate and tokenization time saved by reusing cached frequency tables,
+        # aggregated in the shared Redis tier (per-process counters are on /metrics)
+        stats = frequency_cache.stats()
+        if stats is None:
+            return Response(
+                {"error": "Cache statistics require TEXT_FREQ_CACHE_REDIS_URL"},
+                status=status.HTTP_503_SERVICE_UNAVAILABLE
+            )
+        return Response(stats)
@@ -0,0 +1,279 @@
+import re
+import threading
+from bisect import bisect_left, insort
+from collections import OrderedDict
+# Sorted term arrays and an LRU of users
+
+from django.conf import settings
+from django.core.cache import cache
+# Version counters and word changes shared between web and worker processes
+
+from .models import DocumentFrequency
+
+
+VERSION_KEY = "text:vocab:version:{user_id}"
+CHANGES_KEY = "text:vocab:changes:{user_id}:{version}"
+# Words added (word -> term id) and removed (word -> None) by each version,
+# replayed by processes holding an older copy
+
+# Seconds the changes of a version are kept, and the most versions a
+# stale copy replays before it is reloaded instead
+CHANGES_TIMEOUT = 86400
+MAX_REPLAYED_VERSIONS = 1000
+
+# Highest edit distance accepted in "word~N" queries
+MAX_FUZZY_DISTANCE = 2
+
+# "run*" expands a prefix, "runing~" / "runing~2" matches within an edit distance
+PATTERN_RE = re.compile(r'^(?P<word>[a-z]+)(?:(?P<prefix>\*)|~(?P<distance>\d)?)$')
+
+# Sorts after every character that can follow a prefix
+PREFIX_END = "\U0010ffff"
+
+
+class InvalidPattern(ValueError):
+    # Raised for "*" / "~" queries that cannot be expanded
+    pass
+
+
+def is_pattern(word):
+    # True for words using prefix or fuzzy syntax
+    return word.endswith("*") or "~" in word
+
+
+class UserVocabulary:
+    """
+    Sorted array of the words a user's paragraphs contain.
+
+    Prefix queries are a binary search; fuzzy queries walk the array in
+    order, reusing Levenshtein rows for shared prefixes and skipping every
+    word under a prefix that is already too far from the query.
+    """
+
+    __slots__ = ("version", "words", "terms")
+
+    def __init__(self, version):
+        self.version = version
+        self.words = []
+        # word -> [term_id, document frequency at load time]
+        self.terms = {}
+
+    def add(self, word, term_id, document_frequency=1):
+        if word in self.terms:
+            return
+        self.terms[word] = [term_id, document_frequency]
+        insort(self.words, word)
+
+    def remove(self, word):
+        if self.terms.pop(word, None) is None:
+            return
+        del self.words[bisect_left(self.words, word)]
+
+    def apply(self, changes):
+        # {word: term_id} adds, {word: None} removes
+        for word, term_id in changes.items():
+            if term_id is None:
+                self.remove(word)
+            else:
+                self.add(word, term_id)
+
+    def prefix(self, prefix, limit):
+        # Up to `limit` words starting with `prefix`, most frequent first
+        start = bisect_left(self.words, prefix)
+        end = bisect_left(self.words, prefix + PREFIX_END, lo=start)
+        matches = self.words[start:end]
+        matches.sort(key=lambda word: (-self.terms[word][1], word))
+        return {word: self.terms[word][0] for word in matches[:limit]}
+
+    def fuzzy(self, target, max_distance, limit):
+        # Up to `limit` words within `max_distance` edits, closest and most frequent first
+        words = self.words
+        rows = [list(range(len(target) + 1))]
+        # rows[d] is the edit distance row for the first d characters of `previous`
+        previous = ""
+        matches = []
+
+        i = 0
+        while i < len(words):
+            word = words[i]
+
+            # Keep the rows of the prefix shared with the previous word
+            shared = 0
+            limit_shared = min(len(previous), len(word), len(rows) - 1)
+            while shared < limit_shared and previous[shared] == word[shared]:
+                shared += 1
+            del rows[shared + 1:]
+
+            pruned = False
+            for depth in range(shared, len(word)):
+                above = rows[-1]
+                char = word[depth]
+                row = [above[0] + 1]
+                for j in range(1, len(target) + 1):
+                    row.append(min(
+                        row[j - 1] + 1,
+                        above[j] + 1,
+                        above[j - 1] + (target[j - 1] != char)
+                    ))
+                rows.append(row)
+                if min(row) > max_distance:
+                    # No word under this prefix can come within range
+                    pruned = True
+                    break
+
+            previous = word[:len(rows) - 1]
+            if pruned:
+                i = bisect_left(words, previous + PREFIX_END, lo=i)
+                continue
+
+            distance = rows[-1][-1]
+            if distance <= max_distance:
+                matches.append((distance, -self.terms[word][1], word))
+            i += 1
+
+        matches.sort()
+        return {word: self.terms[word][0] for _, _, word in matches[:limit]}
+
+
+class VocabularyCache:
+    """
+    Per-process LRU of user vocabularies.
+
+    Vocabularies are loaded from DocumentFrequency on first use. Indexing
+    tasks report words entering a user's vocabulary (document frequency
+    rising from 0) and leaving it (falling back to 0): each report bumps a
+    per-user version counter in the shared cache and stores the changes
+    under that version, so every process brings its copy up to date by
+    applying the changes of the versions it missed. Copies are reloaded
+    only when those changes are gone from the cache or too many versions
+    behind.
+    """
+
+    def __init__(self, max_users):
+        self.max_users = max_users
+        self._users = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, user_id):
+        with self._lock:
+            vocabulary = self._users.get(user_id)
+            if vocabulary is not None:
+                self._users.move_to_end(user_id)
+
+        version = cache.get(self._version_key(user_id))
+        if vocabulary is None or not self._catch_up(user_id, vocabulary, version):
+            vocabulary = self.load(user_id)
+        return vocabulary
+
+    def load(self, user_id):
+        # The version is read first: changes made while the rows load are
+        # replayed by the next get() (applying one twice is a no-op)
+        vocabulary = UserVocabulary(cache.get(self._version_key(user_id)))
+        rows = sorted(
+            DocumentFrequency.objects
+            .filter(user_id=user_id, paragraph_count__gt=0)
+            .values_list('term__text', 'term_id', 'paragraph_count')
+        )
+        vocabulary.words = [word for word, _, _ in rows]
+        vocabulary.terms = {word: [term_id, count] for word, term_id, count in rows}
+
+        with self._lock:
+            self._users[user_id] = vocabulary
+            self._users.move_to_end(user_id)
+            while len(self._users) > self.max_users:
+                self._users.popitem(last=False)
+        return vocabulary
+
+    def words_changed(self, changes):
+        # {user_id: {word: term_id or None}} of words that entered (or, with
+        # None, left) users' vocabularies
+        for user_id, words in changes.items():
+            key = self._version_key(user_id)
+            cache.add(key, 0, timeout=None)
+            version = cache.incr(key)
+            cache.set(
+                CHANGES_KEY.format(user_id=user_id, version=version),
+                dict(words),
+                timeout=CHANGES_TIMEOUT
+            )
+
+            with self._lock:
+                vocabulary = self._users.get(user_id)
+                if vocabulary is None or vocabulary.version != version - 1:
+                    # Other versions are caught up with on the next get()
+                    continue
+                vocabulary.apply(words)
+                vocabulary.version = version
+
+    def _catch_up(self, user_id, vocabulary, version):
+        # Apply the changes of the versions the copy missed; False when it
+        # has to be reloaded instead
+        with self._lock:
+            current = vocabulary.version
+        if current == version:
+            return True
+        if current is None or version is None or not 0 < version - current <= MAX_REPLAYED_VERSIONS:
+            return False
+
+        keys = [
+            CHANGES_KEY.format(user_id=user_id, version=missed)
+            for missed in range(current + 1, version + 1)
+        ]
+        changes = cache.get_many(keys)
+        if len(changes) != len(keys):
+            return False
+
+        with self._lock:
+            if vocabulary.version != current:
+                # Another thread caught up meanwhile
+                return vocabulary.version == version
+            for key in keys:
+                vocabulary.apply(changes[key])
+            vocabulary.version = version
+        return True
+
+    def invalidate(self, user_ids):
+        # Make every process reload these users' vocabularies: copies more
+        # than MAX_REPLAYED_VERSIONS behind are never caught up
+        for user_id in user_ids:
+            key = self._version_key(user_id)
+            cache.add(key, 0, timeout=None)
+            cache.incr(key, MAX_REPLAYED_VERSIONS + 1)
+
+    def clear(self):
+        with self._lock:
+            self._users.clear()
+
+    @staticmethod
+    def _version_key(user_id):
+        return VERSION_KEY.format(user_id=user_id)
+
+
+vocabulary_cache = VocabularyCache(
+    max_users=getattr(settings, "TEXT_VOCABULARY_CACHE_USERS", 1000)
+)
+# Process-wide vocabulary cache shared by the Search views and indexing tasks
+
+
+def expand_pattern(user_id, pattern, limit=None):
+    """
+    Expand "prefix*" or "word~N" into a bounded {word: term_id} mapping.
+
+    At most TEXT_VOCABULARY_MAX_EXPANSIONS words are returned, so the
+    ranking step always reads a bounded number of posting lists.
+    """
+
+    match = PATTERN_RE.match(pattern)
+    if match is None:
+        raise InvalidPattern(pattern)
+    if limit is None:
+        limit = settings.TEXT_VOCABULARY_MAX_EXPANSIONS
+
+    vocabulary = vocabulary_cache.get(user_id)
+    if match.group("prefix"):
+        return vocabulary.prefix(match.group("word"), limit)
+
+    distance = int(match.group("distance") or 1)
+    if not 1 <= distance <= MAX_FUZZY_DISTANCE:
+        raise InvalidPattern(pattern)
+    return vocabulary.fuzzy(match.group("word"), distance, limit)